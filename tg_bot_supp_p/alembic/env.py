@@ -2,16 +2,15 @@
 Alembic environment configuration
 """
 from logging.config import fileConfig
-from sqlalchemy import engine_from_config
-from sqlalchemy import pool
 from alembic import context
+import asyncio
 import os
 import sys
 
 # Добавляем корневую директорию в путь
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from database import Base
+from database import Base, engine
 from config import settings
 
 # this is the Alembic Config object
@@ -20,8 +19,12 @@ config = context.config
 # Устанавливаем URL из настроек
 config.set_main_option('sqlalchemy.url', settings.DATABASE_URL)
 
+# Соединение, переданное из init_db() при запуске бота
+connection = config.attributes.get('connection')
+
 # Interpret the config file for Python logging.
-if config.config_file_name is not None:
+# При запуске из бота логирование уже настроено - не перетираем его
+if config.config_file_name is not None and connection is None:
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -42,24 +45,27 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    """Run migrations in 'online' mode."""
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
+def do_run_migrations(connection) -> None:
+    """Выполнить миграции на синхронном соединении"""
+    context.configure(
+        connection=connection, target_metadata=target_metadata
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    with context.begin_transaction():
+        context.run_migrations()
+
 
-        with context.begin_transaction():
-            context.run_migrations()
+async def run_migrations_online() -> None:
+    """Run migrations in 'online' mode."""
+    # Асинхронный движок приложения: тот же драйвер, что и у бота
+    async with engine.connect() as conn:
+        await conn.run_sync(do_run_migrations)
+        await conn.commit()
 
 
 if context.is_offline_mode():
     run_migrations_offline()
+elif connection is not None:
+    do_run_migrations(connection)
 else:
-    run_migrations_online()
\ No newline at end of file
+    asyncio.run(run_migrations_online())
\ No newline at end of file
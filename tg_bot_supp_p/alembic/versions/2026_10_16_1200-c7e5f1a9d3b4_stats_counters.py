@@ -0,0 +1,37 @@
+"""stats counters
+
+Revision ID: c7e5f1a9d3b4
+Revises: 8d42b6e1c0f3
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e5f1a9d3b4'
+down_revision: Union[str, None] = '8d42b6e1c0f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stats_counters',
+    sa.Column('metric', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('metric')
+    )
+    op.create_table('stats_daily',
+    sa.Column('metric', sa.String(length=50), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('metric', 'day')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('stats_daily')
+    op.drop_table('stats_counters')
@@ -0,0 +1,59 @@
+"""performance indexes
+
+Revision ID: e2b8d4f6a1c5
+Revises: c7e5f1a9d3b4
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from contextlib import nullcontext
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b8d4f6a1c5'
+down_revision: Union[str, None] = 'c7e5f1a9d3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя, таблица, колонки)
+INDEXES = [
+    ('ix_users_created_at', 'users', ['created_at']),
+    ('ix_orders_created_at', 'orders', ['created_at']),
+    ('ix_orders_user_id', 'orders', ['user_id']),
+    ('ix_order_items_order_id', 'order_items', ['order_id']),
+    ('ix_rate_limits_telegram_action_timestamp', 'rate_limits', ['telegram_id', 'action_type', 'timestamp']),
+]
+
+
+def _online_ddl():
+    """
+    На Postgres индексы строятся CONCURRENTLY, без блокировки записи
+
+    CONCURRENTLY не работает внутри транзакции, поэтому DDL выполняется
+    в autocommit-блоке. Остальные СУБД используют обычную транзакцию.
+    """
+    if op.get_context().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block()
+    return nullcontext()
+
+
+def upgrade() -> None:
+    with _online_ddl():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+
+        # Префикс составного индекса покрывает поиск по telegram_id
+        op.drop_index('ix_rate_limits_telegram_id', table_name='rate_limits', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with _online_ddl():
+        op.create_index(
+            'ix_rate_limits_telegram_id', 'rate_limits', ['telegram_id'],
+            unique=False, postgresql_concurrently=True
+        )
+
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,48 @@
+"""tickets
+
+Revision ID: f4a7c2e9b1d6
+Revises: e2b8d4f6a1c5
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a7c2e9b1d6'
+down_revision: Union[str, None] = 'e2b8d4f6a1c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('tickets',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('admin_chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('admin_message_id', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('closed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('admin_chat_id', 'admin_message_id', name='uq_tickets_admin_message')
+    )
+    op.create_index('ix_tickets_user_status', 'tickets', ['user_id', 'status'], unique=False)
+    op.create_table('ticket_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('admin_chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('admin_message_id', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['ticket_id'], ['tickets.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('admin_chat_id', 'admin_message_id', name='uq_ticket_messages_admin_message')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('ticket_messages')
+    op.drop_index('ix_tickets_user_status', table_name='tickets')
+    op.drop_table('tickets')
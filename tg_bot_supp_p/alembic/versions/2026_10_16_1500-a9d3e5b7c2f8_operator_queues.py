@@ -0,0 +1,25 @@
+"""operator queues
+
+Revision ID: a9d3e5b7c2f8
+Revises: f4a7c2e9b1d6
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d3e5b7c2f8'
+down_revision: Union[str, None] = 'f4a7c2e9b1d6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_tickets_status_admin_chat', 'tickets', ['status', 'admin_chat_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tickets_status_admin_chat', table_name='tickets')
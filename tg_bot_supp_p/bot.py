@@ -1,60 +1,180 @@
 """
 Главный файл Telegram бота
 """
+import argparse
 import asyncio
 import logging
+from typing import Optional
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
 from config import settings
-from database import init_db
+from database import async_session, engine, init_db
 from handlers import user, support, admin
+from middlewares import (
+    ActivityMiddleware,
+    BotApiMetricsMiddleware,
+    DbSessionMiddleware,
+    HandlerMetricsMiddleware,
+    OperatorPresenceMiddleware,
+    OutboundSchedulerMiddleware,
+    UpdateMetricsMiddleware,
+    activity_tracker
+)
+from utils.background import background
+from utils.broadcast import resume_broadcast_jobs
+from utils.logging_queue import setup_logging
+from utils.metrics import start_metrics_server
+from utils.outbound import OutboundScheduler
+from utils.redis_client import close_redis
+from utils.security import blocked_users_cache, purge_rate_limits
+from utils.stats import reconcile_stats
+from utils.state_store import create_fsm_storage, refresh_state_sizes, state_backend
+from utils.supervisor import run_supervisor, run_worker
+from utils.operators import operator_router
+from utils.tickets import ticket_store
+from utils.webhook import run_webhook
 
 from logger_telegram import setup_telegram_logger
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Настройка логирования: вывод в фоновом потоке, event loop только ставит записи в очередь
+setup_logging(settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    """Главная функция запуска бота"""
+async def on_startup(bot: Bot, maintenance: bool = True):
+    """Прогрев кэшей и запуск фоновых задач"""
+    await blocked_users_cache.refresh()
+    support.rate_limiter.start()
+    activity_tracker.start()
+    ticket_store.start()
+    # Очереди операторов: счетчики в памяти сверяются с БД
+    await ticket_store.refresh_open_counts()
+    background.every(settings.OPERATOR_REFRESH_INTERVAL, ticket_store.refresh_open_counts, "operator_queues")
 
-    # Инициализация базы данных
-    logger.info("Инициализация базы данных...")
-    await init_db()
+    # Обслуживание БД и рассылки - в одном процессе из нескольких
+    if not maintenance:
+        return
 
-    # Создание бота и диспетчера
-    from aiogram.fsm.storage.memory import MemoryStorage
-    storage = MemoryStorage()
+    await resume_broadcast_jobs(bot)
+
+    await reconcile_stats()
+    background.every(settings.STATS_RECONCILE_INTERVAL, reconcile_stats, "stats_reconcile")
+    # Первая очистка сразу: накопленный хвост не ждет целый интервал
+    background.spawn(purge_rate_limits(), name="rate_limit_retention_initial")
+    background.every(settings.RATE_LIMIT_CLEANUP_INTERVAL, purge_rate_limits, "rate_limit_retention")
+
+    if state_backend() == "redis":
+        background.every(60, refresh_state_sizes, "state_store_sizes")
+
+
+async def on_shutdown():
+    """Остановка фоновых задач с финальным сбросом буферов"""
+    await background.stop()
+
+
+def create_bot(processes: int = 1) -> Bot:
+    """
+    Создать бота (через свой Bot API сервер, если задан TELEGRAM_API_URL)
+
+    Args:
+        processes: Сколько процессов делят общий лимит отправок бота
+    """
+    session = None
+    if settings.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.TELEGRAM_API_URL))
 
     bot = Bot(
         token=settings.BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=None)
     )
-
-    dp = Dispatcher(storage=storage)
+    # Планировщик раньше метрик: ожидание лимита не входит во время запроса
+    bot.session.middleware(OutboundSchedulerMiddleware(OutboundScheduler(
+        global_rate=settings.OUTBOUND_GLOBAL_RATE / processes,
+        chat_rate=settings.OUTBOUND_CHAT_RATE,
+        group_rate=settings.OUTBOUND_GROUP_RATE,
+        chat_burst=settings.OUTBOUND_CHAT_BURST
+    )))
+    bot.session.middleware(BotApiMetricsMiddleware())
+    return bot
+
+
+def create_dispatcher(maintenance: bool = True) -> Dispatcher:
+    """
+    Создать диспетчер с хранилищем состояний и роутерами
+
+    Args:
+        maintenance: Запускать фоновое обслуживание (в одном процессе из нескольких)
+    """
+    storage = create_fsm_storage()
+    logger.info(f"Хранилище состояний: {state_backend()}")
+
+    dp = Dispatcher(storage=storage, maintenance=maintenance)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+
+    # Отметка активности до фильтров: учитываются и необработанные обновления
+    dp.update.outer_middleware(ActivityMiddleware(activity_tracker))
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(OperatorPresenceMiddleware(operator_router))
+    # Сессия БД на обновление: передается обработчикам аргументом session
+    dp.update.middleware(DbSessionMiddleware(async_session))
+
+    # Время обработчиков: middleware диспетчера действуют и во вложенных роутерах
+    handler_metrics = HandlerMetricsMiddleware()
+    for event_type, observer in dp.observers.items():
+        if event_type != "update":
+            observer.middleware(handler_metrics)
 
     # Регистрация роутеров
     dp.include_router(user.router)
     dp.include_router(support.router)
     dp.include_router(admin.router)
 
-    # TELEGRAM_ADMIN_ID = 123456789  # ваш ID
-    # bot = Bot("TOKEN")
+    return dp
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    """Получать обновления через getUpdates"""
+    # Пока установлен вебхук, getUpdates не работает
+    await bot.delete_webhook()
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+async def main(webhook: bool = False, workers: int = 1, worker_index: Optional[int] = None):
+    """
+    Главная функция запуска бота
 
-    class TelegramLogHandler(logging.Handler):
-        def emit(self, record):
-            log_entry = self.format(record)
-            asyncio.create_task(bot.send_message(settings.TECH_MANAGER_ID, log_entry[:4000]))
+    Args:
+        webhook: Принимать обновления через вебхук
+        workers: Число процессов-обработчиков (больше 1 - режим супервизора)
+        worker_index: Номер обработчика (процесс запущен супервизором)
+    """
 
-    # Настройка логгера
-    # logger = logging.getLogger(__name__)
-    # logger.setLevel(logging.ERROR)
-    # logger.addHandler(TelegramLogHandler())
+    # Инициализация базы данных (миграции выполняет один процесс)
+    if worker_index is None:
+        logger.info("Инициализация базы данных...")
+        await init_db()
+
+    # Создание бота и диспетчера
+    # Обработчики делят лимит бота поровну (у каждого свой планировщик)
+    bot = create_bot(workers if worker_index is not None else 1)
+    dp = create_dispatcher(maintenance=not worker_index)
+
+    metrics_runner = None
+
+    # Дайджесты ошибок в Telegram (в дополнение к обычным логам)
+    telegram_log = None
+    if settings.TELEGRAM_LOG_CHAT_ID:
+        telegram_log = setup_telegram_logger(
+            bot,
+            settings.TELEGRAM_LOG_CHAT_ID,
+            interval=settings.TELEGRAM_LOG_INTERVAL,
+            max_pending=settings.TELEGRAM_LOG_MAX_PENDING
+        )
 
     logger.info("Бот запущен и готов к работе!")
 
@@ -67,18 +187,54 @@ async def main():
     # except Exception as e:
     #     logger.error(f"Не удалось отправить уведомление админу: {e}")
 
-    # Запуск polling
     try:
-        await dp.start_polling(bot)
+        # Метрики: у супервизора METRICS_PORT, у обработчиков следующие порты.
+        # Внутри try: если порт занят, бот и соединения все равно закрываются
+        if settings.METRICS_PORT:
+            metrics_port = settings.METRICS_PORT + (worker_index + 1 if worker_index is not None else 0)
+            metrics_runner = await start_metrics_server(settings.METRICS_HOST, metrics_port)
+            logger.info(f"Метрики: http://{settings.METRICS_HOST}:{metrics_port}/metrics")
+
+        if worker_index is not None:
+            await run_worker(bot, dp, worker_index)
+        elif workers > 1:
+            await run_supervisor(bot, dp, workers, webhook)
+        elif webhook:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     finally:
+        # Последний дайджест уходит, пока сессия бота еще открыта
+        if telegram_log is not None:
+            await telegram_log.stop()
         await bot.session.close()
+        await close_redis()
+        # Пул держит соединения открытыми (у aiosqlite это потоки)
+        await engine.dispose()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Telegram бот поддержки")
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="принимать обновления через вебхук (WEBHOOK_URL) вместо polling"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="число процессов-обработчиков; обновления распределяются по ID пользователя (нужен REDIS_URL)"
+    )
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
     try:
-        asyncio.run(main())
+        asyncio.run(main(webhook=args.webhook, workers=args.workers, worker_index=args.worker_index))
 
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
-        logger.error(f"Критическая ошибка: {e}")
\ No newline at end of file
+        logger.error(f"Критическая ошибка: {e}")
@@ -14,8 +14,29 @@ class Settings(BaseSettings):
     MONITOR_ID: int
     TECH_MANAGER_ID: int  # Новый - техменеджер
 
+    # Операторы поддержки: JSON-список ID, например [111, 222] (пусто - только ADMIN_ID).
+    # Распределение: least_open (меньше открытых обращений) или round_robin (по кругу)
+    OPERATOR_IDS: list[int] = []
+    OPERATOR_ROUTING: str = "least_open"
+    # Оператор в сети, если был активен за последние N секунд; пересчет очередей по БД (секунды)
+    OPERATOR_PRESENCE_TIMEOUT: float = 900
+    OPERATOR_REFRESH_INTERVAL: float = 60
+
     # Database
     DATABASE_URL: str
+    # Пул соединений (кроме SQLite): постоянные соединения, сверх них при пиках,
+    # ожидание свободного (секунды), пересоздание старых (секунды, -1 - никогда)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    # Проверка соединения перед выдачей (переживает перезапуск СУБД)
+    DB_POOL_PRE_PING: bool = True
+    # asyncpg: кэш подготовленных выражений на соединение (0 - для pgbouncer)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # SQLite: ожидание блокировки записи (секунды) и кэш страниц на соединение (КиБ)
+    SQLITE_BUSY_TIMEOUT: float = 5.0
+    SQLITE_CACHE_SIZE_KB: int = 16384
 
     # Security
     SECRET_KEY: str = "your-secret-key-change-in-production"
@@ -23,6 +44,91 @@ class Settings(BaseSettings):
     # Rate Limiting
     MAX_MESSAGES_PER_MINUTE: int = 5
     MAX_MESSAGES_PER_HOUR: int = 30
+    # Хранилище лимитов: auto (redis при REDIS_URL, иначе sql), sql, redis, memory
+    RATE_LIMIT_BACKEND: str = "auto"
+    # Период записи журнала rate_limits в режиме memory (секунды)
+    RATE_LIMIT_AUDIT_FLUSH_INTERVAL: float = 5.0
+    # Хранение rate_limits: срок (дни), период очистки (секунды) и размер порции DELETE
+    RATE_LIMIT_RETENTION_DAYS: int = 7
+    RATE_LIMIT_CLEANUP_INTERVAL: float = 3600
+    RATE_LIMIT_CLEANUP_BATCH: int = 5000
+
+    # Кэш заблокированных: период перечитывания blocked_users (секунды)
+    BLOCKED_CACHE_TTL: int = 60
+
+    # Рассылки: сообщений в секунду (лимит Telegram ~30), параллельных отправок, повторов
+    BROADCAST_RATE: float = 25
+    BROADCAST_CONCURRENCY: int = 20
+    BROADCAST_MAX_RETRIES: int = 3
+    # Размер порции получателей между сохранениями прогресса и период обновления статуса (секунды)
+    BROADCAST_CHUNK_SIZE: int = 500
+    BROADCAST_PROGRESS_INTERVAL: float = 5.0
+
+    # Лимиты всех отправок бота (сообщений в секунду): общий, в личный чат, в группу (20 в минуту),
+    # и сколько сообщений подряд можно отправить в один чат без паузы.
+    # При --workers общий лимит делится поровну между обработчиками, лимиты чатов
+    # действуют в каждом процессе (чат пользователя закреплен за одним обработчиком)
+    OUTBOUND_GLOBAL_RATE: float = 30
+    OUTBOUND_CHAT_RATE: float = 1
+    OUTBOUND_GROUP_RATE: float = 20 / 60
+    OUTBOUND_CHAT_BURST: float = 3
+
+    # Альбомы: пауза после последнего элемента и предельное ожидание с первого (секунды)
+    MEDIA_GROUP_DELAY: float = 0.3
+    MEDIA_GROUP_MAX_WAIT: float = 2.0
+
+    # Статистика: пересчет счетчиков по таблицам (сек) и глубина пересчета по дням
+    STATS_RECONCILE_INTERVAL: float = 3600
+    STATS_RECONCILE_DAYS: int = 8
+
+    # Активность пользователей: период пакетной записи last_activity (секунды)
+    ACTIVITY_FLUSH_INTERVAL: float = 5.0
+
+    # Состояние диалогов (handlers/state.py) и FSM: auto (redis при REDIS_URL, иначе memory), memory, redis
+    STATE_BACKEND: str = "auto"
+    # Максимум записей в каждом хранилище в памяти
+    STATE_MAX_ENTRIES: int = 100000
+    # Время жизни (секунды) ожидания вопроса и режима ответа
+    STATE_PENDING_TTL: float = 86400
+
+    # Обращения (utils/tickets.py): период пакетной записи (секунды) и размер LRU сообщений администратора
+    TICKET_FLUSH_INTERVAL: float = 1.0
+    TICKET_CACHE_SIZE: int = 10000
+    # Сбросов подряд с ошибкой, после которых изменения обращения отбрасываются
+    TICKET_FLUSH_MAX_ATTEMPTS: int = 60
+
+    # Вебхук (python bot.py --webhook): публичный адрес, путь и секрет заголовка
+    # (секрет обязателен: без него вебхук принимал бы обновления от кого угодно)
+    WEBHOOK_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: Optional[str] = None
+    # Адрес, на котором слушает aiohttp-сервер вебхука
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Обработчики обновлений: число очередей (по пользователям) и размер каждой
+    WEBHOOK_WORKERS: int = 32
+    WEBHOOK_QUEUE_SIZE: int = 100
+
+    # Несколько процессов (python bot.py --workers N): порты обработчиков с WORKER_BASE_PORT
+    WORKER_BASE_PORT: int = 8090
+
+    # Уровень логов: DEBUG включает подробную трассировку обработчиков
+    LOG_LEVEL: str = "INFO"
+
+    # Метрики Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 - отключены, например 9101).
+    # Процессы-обработчики слушают METRICS_PORT + 1 + номер
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 0
+
+    # Ошибки в Telegram: чат для дайджестов (не задан - отключено).
+    # Одинаковые ошибки склеиваются, дайджест не чаще раза в TELEGRAM_LOG_INTERVAL секунд,
+    # в буфере не больше TELEGRAM_LOG_MAX_PENDING разных ошибок
+    TELEGRAM_LOG_CHAT_ID: Optional[int] = None
+    TELEGRAM_LOG_INTERVAL: float = 30.0
+    TELEGRAM_LOG_MAX_PENDING: int = 100
+
+    # Свой Bot API сервер (локальный telegram-bot-api или тестовый стенд)
+    TELEGRAM_API_URL: Optional[str] = None
 
     # Web App
     WEBAPP_URL: str = "https://your-domain.com"
@@ -1,17 +1,16 @@
+import os
 from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, BigInteger, Boolean,
-    DateTime, Text, ForeignKey, Float, JSON
+    DateTime, Date, Text, ForeignKey, Float, JSON, UniqueConstraint, Index, inspect
 )
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base, relationship
 from config import settings
+from utils.db_pool import create_db_engine
 
-# Преобразуем URL для async
-db_url = settings.DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://')
-
-# Создаем движок БД
-engine = create_async_engine(db_url, echo=False)
+# Создаем движок БД (драйвер подставляется по URL, пул настраивается в Settings)
+engine = create_db_engine(settings.DATABASE_URL)
 
 # Создаем фабрику сессий
 async_session = async_sessionmaker(
@@ -20,6 +19,11 @@ async_session = async_sessionmaker(
 
 Base = declarative_base()
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Ревизия alembic, соответствующая схеме до появления миграций
+BASELINE_REVISION = '5a1c9e3f7b20'
+
 
 class User(Base):
     """Модель пользователя"""
@@ -30,7 +34,7 @@ class User(Base):
     username = Column(String(255), nullable=True)
     first_name = Column(String(255), nullable=True)
     last_name = Column(String(255), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     last_activity = Column(DateTime, default=datetime.utcnow)
 
     # Связи
@@ -71,10 +75,10 @@ class Order(Base):
     __tablename__ = 'orders'
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
     status = Column(String(50), default='pending')  # pending, confirmed, completed, cancelled
     total_amount = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     contact_info = Column(JSON, nullable=True)  # Контактная информация
 
@@ -88,7 +92,7 @@ class OrderItem(Base):
     __tablename__ = 'order_items'
 
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     quantity = Column(Integer, nullable=False)
     price = Column(Float, nullable=False)  # Цена на момент заказа
@@ -101,9 +105,13 @@ class OrderItem(Base):
 class RateLimit(Base):
     """Модель для отслеживания лимитов"""
     __tablename__ = 'rate_limits'
+    __table_args__ = (
+        # Покрывает фильтр RateLimiter.check_limit: пользователь + действие + окно времени
+        Index('ix_rate_limits_telegram_action_timestamp', 'telegram_id', 'action_type', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(BigInteger, nullable=False, index=True)
+    telegram_id = Column(BigInteger, nullable=False)
     action_type = Column(String(50), nullable=False)  # message, command
     timestamp = Column(DateTime, default=datetime.utcnow, index=True)
 
@@ -121,10 +129,124 @@ class RequiredChannel(Base):
     created_by = Column(BigInteger, nullable=False)  # Кто добавил (ADMIN_ID или TECH_MANAGER_ID)
 
 
+class BroadcastJob(Base):
+    """Модель задания рассылки"""
+    __tablename__ = 'broadcast_jobs'
+
+    id = Column(Integer, primary_key=True)
+    created_by = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=False)  # Сообщение рассылки (file_id и тексты)
+    status = Column(String(20), default='running', index=True)  # running, completed
+    last_user_id = Column(Integer, default=0, nullable=False)  # Курсор: users.id последней обработанной порции
+    delivered = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    status_chat_id = Column(BigInteger, nullable=True)  # Сообщение с прогрессом у администратора
+    status_message_id = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Связи
+    deliveries = relationship("BroadcastDelivery", back_populates="job")
+
+
+class BroadcastDelivery(Base):
+    """Модель журнала доставки рассылки"""
+    __tablename__ = 'broadcast_deliveries'
+    __table_args__ = (
+        UniqueConstraint('job_id', 'telegram_id', name='uq_broadcast_deliveries_job_user'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey('broadcast_jobs.id'), nullable=False)
+    telegram_id = Column(BigInteger, nullable=False)
+    status = Column(String(20), nullable=False)  # delivered, permanent, transient
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Связи
+    job = relationship("BroadcastJob", back_populates="deliveries")
+
+
+class Ticket(Base):
+    """Модель обращения в поддержку"""
+    __tablename__ = 'tickets'
+    __table_args__ = (
+        # Сообщение с кнопками у администратора однозначно определяет обращение
+        UniqueConstraint('admin_chat_id', 'admin_message_id', name='uq_tickets_admin_message'),
+        # Открытые обращения пользователя (ответ закрывает их)
+        Index('ix_tickets_user_status', 'user_id', 'status'),
+        # Очереди операторов: открытые обращения по чатам
+        Index('ix_tickets_status_admin_chat', 'status', 'admin_chat_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(BigInteger, nullable=False)  # telegram_id автора
+    admin_chat_id = Column(BigInteger, nullable=False)
+    admin_message_id = Column(BigInteger, nullable=False)  # Сообщение с кнопками управления
+    status = Column(String(20), default='open', nullable=False)  # open, answered, ignored
+    created_at = Column(DateTime, default=datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True)
+
+    # Связи
+    messages = relationship("TicketMessage", back_populates="ticket")
+
+
+class TicketMessage(Base):
+    """Модель сообщения обращения в чате администратора"""
+    __tablename__ = 'ticket_messages'
+    __table_args__ = (
+        UniqueConstraint('admin_chat_id', 'admin_message_id', name='uq_ticket_messages_admin_message'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    ticket_id = Column(Integer, ForeignKey('tickets.id'), nullable=False)
+    admin_chat_id = Column(BigInteger, nullable=False)
+    admin_message_id = Column(BigInteger, nullable=False)
+
+    # Связи
+    ticket = relationship("Ticket", back_populates="messages")
+
+
+class StatsCounter(Base):
+    """Модель накопительного счетчика статистики"""
+    __tablename__ = 'stats_counters'
+
+    metric = Column(String(50), primary_key=True)  # users, orders, products, blocked_users
+    value = Column(BigInteger, default=0, nullable=False)
+
+
+class StatsDaily(Base):
+    """Модель дневного счетчика статистики"""
+    __tablename__ = 'stats_daily'
+
+    metric = Column(String(50), primary_key=True)  # users, orders
+    day = Column(Date, primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+
+
+def _upgrade_schema(connection):
+    """Применить миграции alembic на переданном соединении"""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(BASE_DIR, 'alembic.ini'))
+    config.set_main_option('script_location', os.path.join(BASE_DIR, 'alembic'))
+    config.attributes['connection'] = connection
+
+    tables = inspect(connection).get_table_names()
+    if 'users' in tables and 'alembic_version' not in tables:
+        # База создана через create_all до появления миграций
+        command.stamp(config, BASELINE_REVISION)
+    # Миграции сами управляют транзакциями (CREATE INDEX CONCURRENTLY)
+    connection.commit()
+
+    command.upgrade(config, 'head')
+
+
 async def init_db():
-    """Инициализация базы данных"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Инициализация базы данных: миграция схемы до последней ревизии"""
+    async with engine.connect() as conn:
+        await conn.run_sync(_upgrade_schema)
+        await conn.commit()
 
 
 async def get_session() -> AsyncSession:
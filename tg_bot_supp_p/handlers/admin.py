@@ -1,24 +1,25 @@
 """
 Обработчики административных команд
 """
+from functools import wraps
+
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select, func
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import async_session, User, BlockedUser, Product, Order
 from config import settings
 from utils.security import (
     SecurityValidator,
     block_user,
-    unblock_user,
-    is_user_blocked
+    unblock_user
 )
+from utils.broadcast import build_broadcast_payload, start_broadcast
+from utils.stats import get_stats
 
-router = Router()
+router = Router(name="admin")
 
 
 class BroadcastStates(StatesGroup):
@@ -37,6 +38,7 @@ class ProductStates(StatesGroup):
 def admin_only(func):
     """Декоратор для проверки прав администратора"""
 
+    @wraps(func)
     async def wrapper(message: Message, *args, **kwargs):
         if message.from_user.id != settings.ADMIN_ID:
             await message.answer("❌ У вас нет прав для выполнения этой команды.")
@@ -49,6 +51,7 @@ def admin_only(func):
 def admin_or_tech(func):
     """Декоратор для админа или техменеджера"""
 
+    @wraps(func)
     async def wrapper(message: Message, *args, **kwargs):
         if message.from_user.id not in [settings.ADMIN_ID, settings.TECH_MANAGER_ID]:
             await message.answer("❌ У вас нет прав для выполнения этой команды.")
@@ -60,33 +63,16 @@ def admin_or_tech(func):
 
 @router.message(Command("admin"))
 @admin_only
-async def cmd_admin(message: Message):
+async def cmd_admin(message: Message, session: AsyncSession):
     """Панель администратора"""
-    async with async_session() as session:
-        # Статистика пользователей
-        users_query = select(func.count(User.id))
-        users_result = await session.execute(users_query)
-        total_users = users_result.scalar()
-
-        # Заблокированные
-        blocked_query = select(func.count(BlockedUser.id))
-        blocked_result = await session.execute(blocked_query)
-        total_blocked = blocked_result.scalar()
-
-        # Заказы за сегодня
-        today = datetime.utcnow().date()
-        orders_query = select(func.count(Order.id)).where(
-            func.date(Order.created_at) == today
-        )
-        orders_result = await session.execute(orders_query)
-        today_orders = orders_result.scalar()
+    stats = await get_stats(session)
 
     admin_text = (
         f"🔐 Панель администратора\n\n"
         f"📊 Статистика:\n"
-        f"👥 Всего пользователей: {total_users}\n"
-        f"🚫 Заблокировано: {total_blocked}\n"
-        f"📦 Заказов сегодня: {today_orders}\n\n"
+        f"👥 Всего пользователей: {stats['total_users']}\n"
+        f"🚫 Заблокировано: {stats['total_blocked']}\n"
+        f"📦 Заказов сегодня: {stats['today_orders']}\n\n"
         f"📋 Доступные команды:\n"
         f"/block [user_id] - Заблокировать пользователя\n"
         f"/unblock [user_id] - Разблокировать\n"
@@ -101,7 +87,7 @@ async def cmd_admin(message: Message):
 
 @router.message(Command("block"))
 @admin_only
-async def cmd_block_user(message: Message):
+async def cmd_block_user(message: Message, session: AsyncSession):
     """Блокировка пользователя"""
     # Парсим аргументы
     args = message.text.split()
@@ -124,32 +110,31 @@ async def cmd_block_user(message: Message):
         await message.answer("❌ Нельзя заблокировать этого пользователя.")
         return
 
-    async with async_session() as session:
-        success = await block_user(
-            session,
-            user_id,
-            message.from_user.id,
-            reason
-        )
+    success = await block_user(
+        session,
+        user_id,
+        message.from_user.id,
+        reason
+    )
 
-        if success:
-            await message.answer(f"✅ Пользователь {user_id} заблокирован.")
-            # Уведомляем пользователя
-            try:
-                await message.bot.send_message(
-                    user_id,
-                    "⛔ Вы были заблокированы администратором.\n"
-                    f"Причина: {reason or 'не указана'}"
-                )
-            except:
-                pass
-        else:
-            await message.answer(f"❌ Пользователь {user_id} уже заблокирован.")
+    if success:
+        await message.answer(f"✅ Пользователь {user_id} заблокирован.")
+        # Уведомляем пользователя
+        try:
+            await message.bot.send_message(
+                user_id,
+                "⛔ Вы были заблокированы администратором.\n"
+                f"Причина: {reason or 'не указана'}"
+            )
+        except:
+            pass
+    else:
+        await message.answer(f"❌ Пользователь {user_id} уже заблокирован.")
 
 
 @router.message(Command("unblock"))
 @admin_only
-async def cmd_unblock_user(message: Message):
+async def cmd_unblock_user(message: Message, session: AsyncSession):
     """Разблокировка пользователя"""
     args = message.text.split()
     if len(args) < 2:
@@ -165,21 +150,20 @@ async def cmd_unblock_user(message: Message):
         await message.answer("❌ Неверный формат ID пользователя.")
         return
 
-    async with async_session() as session:
-        success = await unblock_user(session, user_id)
+    success = await unblock_user(session, user_id)
 
-        if success:
-            await message.answer(f"✅ Пользователь {user_id} разблокирован.")
-            # Уведомляем пользователя
-            try:
-                await message.bot.send_message(
-                    user_id,
-                    "✅ Вы были разблокированы. Теперь вы можете снова использовать бота."
-                )
-            except:
-                pass
-        else:
-            await message.answer(f"❌ Пользователь {user_id} не найден в списке заблокированных.")
+    if success:
+        await message.answer(f"✅ Пользователь {user_id} разблокирован.")
+        # Уведомляем пользователя
+        try:
+            await message.bot.send_message(
+                user_id,
+                "✅ Вы были разблокированы. Теперь вы можете снова использовать бота."
+            )
+        except:
+            pass
+    else:
+        await message.answer(f"❌ Пользователь {user_id} не найден в списке заблокированных.")
 
 
 @router.message(Command("broadcast"))
@@ -211,7 +195,12 @@ async def process_broadcast(message: Message, state: FSMContext):
         ]
     ])
 
-    await state.update_data(broadcast_message=message)
+    payload = build_broadcast_payload(message)
+    if not payload:
+        await message.answer("❌ Этот тип сообщения нельзя разослать.")
+        return
+
+    await state.update_data(broadcast_payload=payload)
     await message.answer(
         "Вы уверены, что хотите отправить это сообщение всем пользователям?",
         reply_markup=keyboard
@@ -226,56 +215,17 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
         return
 
     data = await state.get_data()
-    broadcast_msg = data.get("broadcast_message")
+    payload = data.get("broadcast_payload")
 
-    if not broadcast_msg:
+    if not payload:
         await callback.message.edit_text("❌ Сообщение для рассылки не найдено.")
         await state.clear()
         return
 
     await callback.message.edit_text("📤 Начинаю рассылку...")
 
-    async with async_session() as session:
-        # Получаем всех пользователей
-        query = select(User.telegram_id)
-        result = await session.execute(query)
-        user_ids = [row[0] for row in result.fetchall()]
-
-    success = 0
-    failed = 0
-
-    for user_id in user_ids:
-        try:
-            # Пропускаем заблокированных
-            async with async_session() as session:
-                if await is_user_blocked(session, user_id):
-                    continue
-
-            # Отправляем сообщение
-            if broadcast_msg.text:
-                await callback.bot.send_message(user_id, broadcast_msg.text)
-            elif broadcast_msg.photo:
-                await callback.bot.send_photo(
-                    user_id,
-                    broadcast_msg.photo[-1].file_id,
-                    caption=broadcast_msg.caption
-                )
-            elif broadcast_msg.video:
-                await callback.bot.send_video(
-                    user_id,
-                    broadcast_msg.video.file_id,
-                    caption=broadcast_msg.caption
-                )
-
-            success += 1
-        except Exception as e:
-            failed += 1
-
-    await callback.message.edit_text(
-        f"✅ Рассылка завершена!\n\n"
-        f"Отправлено: {success}\n"
-        f"Не доставлено: {failed}"
-    )
+    # Рассылка идет в фоне, прогресс обновляется в этом же сообщении
+    await start_broadcast(callback.bot, payload, callback.from_user.id, callback.message)
     await state.clear()
 
 
@@ -288,40 +238,20 @@ async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
 
 @router.message(Command("stats"))
 @admin_or_tech
-async def cmd_stats(message: Message):
+async def cmd_stats(message: Message, session: AsyncSession):
     """Подробная статистика"""
-    async with async_session() as session:
-        # Пользователи
-        total_users_query = select(func.count(User.id))
-        total_users = (await session.execute(total_users_query)).scalar()
-
-        # Новые за неделю
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        new_users_query = select(func.count(User.id)).where(User.created_at >= week_ago)
-        new_users = (await session.execute(new_users_query)).scalar()
-
-        # Заказы
-        total_orders_query = select(func.count(Order.id))
-        total_orders = (await session.execute(total_orders_query)).scalar()
-
-        # Заказы за неделю
-        new_orders_query = select(func.count(Order.id)).where(Order.created_at >= week_ago)
-        new_orders = (await session.execute(new_orders_query)).scalar()
-
-        # Товары
-        products_query = select(func.count(Product.id))
-        total_products = (await session.execute(products_query)).scalar()
+    stats = await get_stats(session)
 
     stats_text = (
         f"📊 Подробная статистика\n\n"
         f"👥 Пользователи:\n"
-        f"  • Всего: {total_users}\n"
-        f"  • Новых за неделю: {new_users}\n\n"
+        f"  • Всего: {stats['total_users']}\n"
+        f"  • Новых за неделю: {stats['new_users_week']}\n\n"
         f"📦 Заказы:\n"
-        f"  • Всего: {total_orders}\n"
-        f"  • За неделю: {new_orders}\n\n"
+        f"  • Всего: {stats['total_orders']}\n"
+        f"  • За неделю: {stats['new_orders_week']}\n\n"
         f"🛍️ Товары:\n"
-        f"  • В каталоге: {total_products}"
+        f"  • В каталоге: {stats['total_products']}"
     )
 
     await message.answer(stats_text)
\ No newline at end of file
@@ -1,19 +1,18 @@
 """
 Общие состояния для всех хэндлеров
-"""
-
-# Словарь для отслеживания состояния пользователей (ожидают ли вопрос)
-waiting_for_question = {}
-
-# Словарь для хранения ID сообщений пользователей (для ответов админа)
-user_messages = {}
 
-# Словарь для отслеживания режима ответа админа {admin_id: user_id}
-admin_reply_mode = {}
-
-# Словарь для сбора медиа от админа {admin_id: [messages]}
-admin_media_buffer = {}
+Хранилища ограничены по размеру и времени жизни записей (utils/state_store.py).
+Связь сообщений администратора с обращениями хранится в БД (utils/tickets.py)
+"""
+from config import settings
+from utils.state_store import create_state_store
 
-control_messages = {}
+# Состояние пользователей (ожидают ли вопрос)
+waiting_for_question = create_state_store(
+    "waiting_for_question", settings.STATE_MAX_ENTRIES, settings.STATE_PENDING_TTL
+)
 
-broadcast_media_buffer = {}
\ No newline at end of file
+# Режим ответа у каждого оператора {operator_id: user_id}
+operator_reply_mode = create_state_store(
+    "operator_reply_mode", settings.STATE_MAX_ENTRIES, settings.STATE_PENDING_TTL
+)
@@ -1,26 +1,29 @@
 """
 Обработчики поддержки
 """
+import logging
+import time
+
 from aiogram import Router, F
 from aiogram.types import Message, ContentType, InputMediaPhoto, InputMediaVideo, InputMediaDocument, \
     InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from collections import defaultdict
 import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import async_session
 from config import settings
-from utils.security import SecurityValidator, RateLimiter, is_user_blocked, block_user, unblock_user
-from handlers.state import waiting_for_question, user_messages, admin_reply_mode, admin_media_buffer, control_messages
+from utils.security import SecurityValidator, create_rate_limiter, is_user_blocked, block_user, unblock_user
+from utils.media_groups import create_collector
+from utils.outbound import NOTIFICATION, outbound_lane
+from utils.tickets import ticket_store, TICKET_ANSWERED, TICKET_IGNORED
+from utils.operators import operator_router, ticket_assignment_seconds
+from handlers.state import waiting_for_question, operator_reply_mode
 
-router = Router()
+logger = logging.getLogger(__name__)
 
-rate_limiter = RateLimiter(
-    max_per_minute=settings.MAX_MESSAGES_PER_MINUTE,
-    max_per_hour=settings.MAX_MESSAGES_PER_HOUR
-)
+router = Router(name="support")
 
-# Словарь для сбора медиа-группы от пользователей
-media_groups = defaultdict(list)
+rate_limiter = create_rate_limiter()
 
 
 def get_admin_keyboard(user_id: int, is_blocked: bool = False):
@@ -48,14 +51,18 @@ def get_cancel_keyboard(user_id: int):
     return keyboard
 
 
-async def send_question_to_admin(message: Message, user_info_text: str, media_group=None):
-    """Отправка вопроса администратору"""
+@outbound_lane(NOTIFICATION)
+async def send_question_to_admin(session: AsyncSession, message: Message, user_info_text: str, media_group=None):
+    """Отправка вопроса оператору поддержки (выбирается из пула)"""
+
+    logger.debug("Отправка вопроса админу от %s", message.from_user.id)
 
-    print(f"[DEBUG] Отправка вопроса админу от {message.from_user.id}")
+    started = time.perf_counter()
+    # Обращение целиком (альбом, кнопки) уходит одному оператору из пула
+    operator_id = await operator_router.assign()
 
     # Проверяем заблокирован ли пользователь
-    async with async_session() as session:
-        is_blocked = await is_user_blocked(session, message.from_user.id)
+    is_blocked = await is_user_blocked(session, message.from_user.id)
 
     try:
         # Если есть медиа-группа (альбом)
@@ -70,9 +77,9 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
             # Формируем полный текст с информацией о пользователе
             if question_text:
                 full_text = f"{user_info_text}\n\n💬 Вопрос:\n{question_text}"
-                await message.bot.send_message(settings.ADMIN_ID, full_text)
+                info_msg = await message.bot.send_message(operator_id, full_text)
             else:
-                await message.bot.send_message(settings.ADMIN_ID, user_info_text)
+                info_msg = await message.bot.send_message(operator_id, user_info_text)
 
             # Отправляем медиа-группу
             media_to_send = []
@@ -88,22 +95,26 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
                 media_to_send.append(media_item)
 
             sent_messages = await message.bot.send_media_group(
-                settings.ADMIN_ID,
+                operator_id,
                 media=media_to_send
             )
 
             if sent_messages:
                 # Отправляем кнопки управления отдельным сообщением
                 control_msg = await message.bot.send_message(
-                    settings.ADMIN_ID,
+                    operator_id,
                     "⬆️ Управление вопросом:",
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
                 )
-                user_messages[sent_messages[0].message_id] = message.from_user.id
-                user_messages[control_msg.message_id] = message.from_user.id
-                # Сохраняем ID сообщения с кнопками
-                control_messages[message.from_user.id] = (settings.ADMIN_ID, control_msg.message_id)
-                print(f"[DEBUG] Альбом отправлен админу")
+                # Обращение - по сообщению с кнопками, к нему относятся текст и альбом
+                ticket_store.open(
+                    message.from_user.id,
+                    operator_id,
+                    control_msg.message_id,
+                    [info_msg.message_id] + [msg.message_id for msg in sent_messages]
+                )
+                ticket_assignment_seconds.observe(time.perf_counter() - started)
+                logger.debug("Альбом отправлен админу")
 
         else:
             # Одно сообщение
@@ -111,7 +122,7 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
             if message.text:
                 full_text = f"{user_info_text}\n\n💬 Вопрос:\n{message.text}"
                 forwarded = await message.bot.send_message(
-                    settings.ADMIN_ID,
+                    operator_id,
                     full_text,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
                 )
@@ -119,7 +130,7 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
                 caption = message.caption or ""
                 full_caption = f"{user_info_text}\n\n💬 Вопрос:\n{caption}" if caption else user_info_text
                 forwarded = await message.bot.send_photo(
-                    settings.ADMIN_ID,
+                    operator_id,
                     message.photo[-1].file_id,
                     caption=full_caption,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
@@ -128,7 +139,7 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
                 caption = message.caption or ""
                 full_caption = f"{user_info_text}\n\n💬 Вопрос:\n{caption}" if caption else user_info_text
                 forwarded = await message.bot.send_video(
-                    settings.ADMIN_ID,
+                    operator_id,
                     message.video.file_id,
                     caption=full_caption,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
@@ -137,32 +148,33 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
                 caption = message.caption or ""
                 full_caption = f"{user_info_text}\n\n💬 Вопрос:\n{caption}" if caption else user_info_text
                 forwarded = await message.bot.send_document(
-                    settings.ADMIN_ID,
+                    operator_id,
                     message.document.file_id,
                     caption=full_caption,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
                 )
             elif message.voice:
                 forwarded = await message.bot.send_voice(
-                    settings.ADMIN_ID,
+                    operator_id,
                     message.voice.file_id,
                     caption=user_info_text,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
                 )
             elif message.audio:
                 forwarded = await message.bot.send_audio(
-                    settings.ADMIN_ID,
+                    operator_id,
                     message.audio.file_id,
                     caption=user_info_text,
                     reply_markup=get_admin_keyboard(message.from_user.id, is_blocked)
                 )
 
             if forwarded:
-                user_messages[forwarded.message_id] = message.from_user.id
-                print(f"[DEBUG] Сообщение отправлено админу с кнопками")
+                ticket_store.open(message.from_user.id, operator_id, forwarded.message_id)
+                ticket_assignment_seconds.observe(time.perf_counter() - started)
+                logger.debug("Сообщение отправлено админу с кнопками")
 
     except Exception as e:
-        print(f"[ERROR] Ошибка отправки админу: {e}")
+        logger.error("Ошибка отправки админу: %s", e)
         raise
 
 
@@ -170,15 +182,16 @@ async def send_question_to_admin(message: Message, user_info_text: str, media_gr
 async def handle_reply_button(callback: CallbackQuery):
     """Обработка кнопки 'Ответить'"""
 
-    if callback.from_user.id != settings.ADMIN_ID:
+    if not operator_router.is_operator(callback.from_user.id):
         await callback.answer("У вас нет прав!")
         return
 
-    user_id = int(callback.data.split("_")[1])
+    # Кнопки вопросов, заданных до появления обращений, - только ID из callback_data
+    ticket = await ticket_store.by_admin_message(callback.message.chat.id, callback.message.message_id)
+    user_id = ticket.user_id if ticket else int(callback.data.split("_")[1])
 
     # Включаем режим ответа
-    admin_reply_mode[callback.from_user.id] = user_id
-    admin_media_buffer[callback.from_user.id] = []
+    await operator_reply_mode.set(callback.from_user.id, user_id)
 
     await callback.message.edit_reply_markup(
         reply_markup=get_cancel_keyboard(user_id)
@@ -191,27 +204,23 @@ async def handle_reply_button(callback: CallbackQuery):
         "Нажмите 'Отменить ответ' для отмены."
     )
 
-    print(f"[DEBUG] Админ включил режим ответа для {user_id}")
+    logger.debug("Админ включил режим ответа для %s", user_id)
 
 
 @router.callback_query(F.data.startswith("cancel_reply_"))
-async def handle_cancel_reply(callback: CallbackQuery):
+async def handle_cancel_reply(callback: CallbackQuery, session: AsyncSession):
     """Отмена режима ответа"""
 
-    if callback.from_user.id != settings.ADMIN_ID:
+    if not operator_router.is_operator(callback.from_user.id):
         await callback.answer("У вас нет прав!")
         return
 
     user_id = int(callback.data.split("_")[2])
 
     # Выключаем режим ответа
-    if callback.from_user.id in admin_reply_mode:
-        del admin_reply_mode[callback.from_user.id]
-    if callback.from_user.id in admin_media_buffer:
-        del admin_media_buffer[callback.from_user.id]
+    await operator_reply_mode.pop(callback.from_user.id)
 
-    async with async_session() as session:
-        is_blocked = await is_user_blocked(session, user_id)
+    is_blocked = await is_user_blocked(session, user_id)
 
     await callback.message.edit_reply_markup(
         reply_markup=get_admin_keyboard(user_id, is_blocked)
@@ -220,102 +229,112 @@ async def handle_cancel_reply(callback: CallbackQuery):
     await callback.answer("Режим ответа отменен")
     await callback.message.answer("❌ Режим ответа отменен")
 
-    print(f"[DEBUG] Админ отменил режим ответа для {user_id}")
+    logger.debug("Админ отменил режим ответа для %s", user_id)
 
 
 @router.callback_query(F.data.startswith("block_"))
-async def handle_block_button(callback: CallbackQuery):
+async def handle_block_button(callback: CallbackQuery, session: AsyncSession):
     """Обработка кнопки блокировки/разблокировки"""
 
+    # Блокировка действует на весь бот - только администратор, не операторы
     if callback.from_user.id != settings.ADMIN_ID:
         await callback.answer("У вас нет прав!")
         return
 
     user_id = int(callback.data.split("_")[1])
 
-    async with async_session() as session:
-        is_blocked = await is_user_blocked(session, user_id)
-
-        if is_blocked:
-            # Разблокировать
-            success = await unblock_user(session, user_id)
-            if success:
-                await callback.message.edit_reply_markup(
-                    reply_markup=get_admin_keyboard(user_id, False)
+    is_blocked = await is_user_blocked(session, user_id)
+
+    if is_blocked:
+        # Разблокировать
+        success = await unblock_user(session, user_id)
+        if success:
+            await callback.message.edit_reply_markup(
+                reply_markup=get_admin_keyboard(user_id, False)
+            )
+            await callback.answer("✅ Пользователь разблокирован")
+            try:
+                await callback.bot.send_message(
+                    user_id,
+                    "✅ Вы были разблокированы. Теперь вы можете снова использовать бота."
                 )
-                await callback.answer("✅ Пользователь разблокирован")
-                try:
-                    await callback.bot.send_message(
-                        user_id,
-                        "✅ Вы были разблокированы. Теперь вы можете снова использовать бота."
-                    )
-                except:
-                    pass
-        else:
-            # Заблокировать
-            success = await block_user(session, user_id, callback.from_user.id, "Заблокирован через кнопку")
-            if success:
-                await callback.message.edit_reply_markup(
-                    reply_markup=get_admin_keyboard(user_id, True)
+            except:
+                pass
+    else:
+        # Заблокировать
+        success = await block_user(session, user_id, callback.from_user.id, "Заблокирован через кнопку")
+        if success:
+            await callback.message.edit_reply_markup(
+                reply_markup=get_admin_keyboard(user_id, True)
+            )
+            await callback.answer("🚫 Пользователь заблокирован")
+            try:
+                await callback.bot.send_message(
+                    user_id,
+                    "⛔ Вы были заблокированы администратором."
                 )
-                await callback.answer("🚫 Пользователь заблокирован")
-                try:
-                    await callback.bot.send_message(
-                        user_id,
-                        "⛔ Вы были заблокированы администратором."
-                    )
-                except:
-                    pass
+            except:
+                pass
 
-    print(f"[DEBUG] Админ {'разблокировал' if is_blocked else 'заблокировал'} {user_id}")
+    logger.debug("Админ %s %s", "разблокировал" if is_blocked else "заблокировал", user_id)
 
 
 @router.callback_query(F.data.startswith("ignore_"))
 async def handle_ignore_button(callback: CallbackQuery):
     """Обработка кнопки 'Игнорировать'"""
 
-    if callback.from_user.id != settings.ADMIN_ID:
+    if not operator_router.is_operator(callback.from_user.id):
         await callback.answer("У вас нет прав!")
         return
 
     user_id = int(callback.data.split("_")[1])
 
+    ticket = await ticket_store.by_admin_message(callback.message.chat.id, callback.message.message_id)
+    if ticket:
+        ticket_store.close(ticket, TICKET_IGNORED)
+
     # Удаляем кнопки
     await callback.message.edit_reply_markup(reply_markup=None)
     await callback.message.answer("✅ Вопрос проигнорирован")
     await callback.answer()
 
-    print(f"[DEBUG] Админ проигнорировал вопрос от {user_id}")
+    logger.debug("Админ проигнорировал вопрос от %s", user_id)
 
 
 # Обработчик медиа-альбомов от пользователей
 @router.message(F.media_group_id)
 async def handle_media_group(message: Message):
-    """Обработчик медиа-альбомов"""
+    """Обработчик медиа-альбомов: элементы копятся в сборщике"""
 
-    print(f"[DEBUG] Получен элемент медиа-группы от {message.from_user.id}")
+    logger.debug("Получен элемент медиа-группы от %s", message.from_user.id)
 
     # Если это админ в режиме ответа
-    if message.from_user.id == settings.ADMIN_ID and message.from_user.id in admin_reply_mode:
-        admin_media_buffer[message.from_user.id].append(message)
-        await asyncio.sleep(0.5)
-
-        # Проверяем, последнее ли это сообщение
-        if admin_media_buffer[message.from_user.id][-1].message_id == message.message_id:
-            await send_admin_reply_media(message)
+    if operator_router.is_operator(message.from_user.id) and await operator_reply_mode.contains(message.from_user.id):
+        admin_reply_albums.add(message)
         return
 
-    if message.from_user.id in [settings.ADMIN_ID, settings.MONITOR_ID, settings.TECH_MANAGER_ID]:
+    if message.from_user.id in [settings.ADMIN_ID, settings.MONITOR_ID, settings.TECH_MANAGER_ID] \
+            or operator_router.is_operator(message.from_user.id):
         return
 
-    if not waiting_for_question.get(message.from_user.id, False):
-        print(f"[DEBUG] Флаг ожидания не установлен для {message.from_user.id}")
+    if not await waiting_for_question.get(message.from_user.id, False):
+        logger.debug("Флаг ожидания не установлен для %s", message.from_user.id)
         return
 
+    user_albums.add(message)
+
+
+async def process_user_album(media_group: list[Message]):
+    """Отправка собранного альбома пользователя в поддержку"""
+
+    message = media_group[0]
+
+    # Альбом отправляется после завершения обновлений - своя сессия
     async with async_session() as session:
         if await is_user_blocked(session, message.from_user.id):
             return
 
+        # Альбом - одно обращение, лимит проверяем один раз
         allowed, error_msg = await rate_limiter.check_limit(
             session, message.from_user.id, "message"
         )
@@ -324,12 +343,6 @@ async def handle_media_group(message: Message):
             await message.answer(f"⚠️ {error_msg}")
             return
 
-    media_group_id = message.media_group_id
-    media_groups[media_group_id].append(message)
-
-    await asyncio.sleep(0.5)
-
-    if media_groups[media_group_id][0].message_id == message.message_id:
         user_info_text = (
             f"👤 Вопрос от пользователя:\n"
             f"ID: {message.from_user.id}\n"
@@ -339,8 +352,8 @@ async def handle_media_group(message: Message):
 
         try:
             await send_question_to_admin(
-                message, user_info_text,
-                media_group=media_groups[media_group_id]
+                session, message, user_info_text,
+                media_group=media_group
             )
 
             await message.answer(
@@ -348,27 +361,25 @@ async def handle_media_group(message: Message):
                 "Мы ответим вам в ближайшее время."
             )
 
-            waiting_for_question[message.from_user.id] = False
-            print(f"[DEBUG] Флаг ожидания сброшен для {message.from_user.id}")
+            await waiting_for_question.pop(message.from_user.id)
+            logger.debug("Флаг ожидания сброшен для %s", message.from_user.id)
 
         except Exception as e:
-            print(f"[ERROR] Ошибка обработки медиа-группы: {e}")
+            logger.error("Ошибка обработки медиа-группы: %s", e)
             await message.answer(
                 "❌ Произошла ошибка при отправке сообщения. Попробуйте позже."
             )
 
-        del media_groups[media_group_id]
-
 
-async def send_admin_reply_media(message: Message):
+async def send_admin_reply_media(media_list: list[Message]):
     """Отправка ответа админа с медиа"""
 
-    user_id = admin_reply_mode.get(message.from_user.id)
+    message = media_list[0]
+
+    user_id = await operator_reply_mode.get(message.from_user.id)
     if not user_id:
         return
 
-    media_list = admin_media_buffer[message.from_user.id]
-
     try:
         # Собираем весь текст из всех caption медиа
         all_text_parts = []
@@ -421,13 +432,12 @@ async def send_admin_reply_media(message: Message):
             [InlineKeyboardButton(text="✅ Ответ отправлен", callback_data="answered")]
         ])
 
-        # Находим сообщение с кнопками и обновляем его
-        if user_id in control_messages:
-            chat_id, msg_id = control_messages[user_id]
+        # Закрываем обращения пользователя и обновляем их кнопки
+        for ticket in await ticket_store.close_for_user(user_id, TICKET_ANSWERED):
             try:
                 await message.bot.edit_message_reply_markup(
-                    chat_id=chat_id,
-                    message_id=msg_id,
+                    chat_id=ticket.admin_chat_id,
+                    message_id=ticket.admin_message_id,
                     reply_markup=sent_keyboard
                 )
             except:
@@ -436,16 +446,20 @@ async def send_admin_reply_media(message: Message):
         await message.answer("✅ Ответ с медиа отправлен пользователю!")
 
         # Выключаем режим ответа
-        del admin_reply_mode[message.from_user.id]
-        del admin_media_buffer[message.from_user.id]
+        await operator_reply_mode.pop(message.from_user.id)
 
-        print(f"[DEBUG] Админ отправил медиа-ответ пользователю {user_id}")
+        logger.debug("Админ отправил медиа-ответ пользователю %s", user_id)
 
     except Exception as e:
-        print(f"[ERROR] Ошибка отправки медиа-ответа: {e}")
+        logger.error("Ошибка отправки медиа-ответа: %s", e)
         await message.answer(f"❌ Ошибка: {str(e)}")
 
 
+# Сборщики альбомов: от пользователей и ответов админа
+user_albums = create_collector(process_user_album)
+admin_reply_albums = create_collector(send_admin_reply_media)
+
+
 @router.message(F.content_type.in_([
     ContentType.TEXT,
     ContentType.PHOTO,
@@ -454,15 +468,17 @@ async def send_admin_reply_media(message: Message):
     ContentType.VOICE,
     ContentType.AUDIO
 ]))
-async def handle_user_message(message: Message):
+async def handle_user_message(message: Message, session: AsyncSession):
     """Обработчик сообщений от пользователей и ответов админа"""
 
-    print(f"[DEBUG] Получено сообщение от {message.from_user.id}, тип: {message.content_type}")
+    logger.debug("Получено сообщение от %s, тип: %s", message.from_user.id, message.content_type)
 
     # Если это админ в режиме ответа
-    if message.from_user.id == settings.ADMIN_ID and message.from_user.id in admin_reply_mode:
-        user_id = admin_reply_mode[message.from_user.id]
+    user_id = None
+    if operator_router.is_operator(message.from_user.id):
+        user_id = await operator_reply_mode.get(message.from_user.id)
 
+    if user_id:
         try:
             if message.text:
                 await message.bot.send_message(user_id, f"💬 Ответ поддержки:\n\n{message.text}")
@@ -491,82 +507,81 @@ async def handle_user_message(message: Message):
 
             await message.answer("✅ Ответ отправлен пользователю!")
 
-            # Меняем кнопки на "Ответ отправлен"
-            if user_id in control_messages:
-                chat_id, msg_id = control_messages[user_id]
+            # Закрываем обращения пользователя и меняем кнопки на "Ответ отправлен"
+            sent_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="✅ Ответ отправлен", callback_data="answered")]
+            ])
+            for ticket in await ticket_store.close_for_user(user_id, TICKET_ANSWERED):
                 try:
-                    sent_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="✅ Ответ отправлен", callback_data="answered")]
-                    ])
                     await message.bot.edit_message_reply_markup(
-                        chat_id=chat_id,
-                        message_id=msg_id,
+                        chat_id=ticket.admin_chat_id,
+                        message_id=ticket.admin_message_id,
                         reply_markup=sent_keyboard
                     )
                 except:
                     pass
 
             # Выключаем режим ответа
-            del admin_reply_mode[message.from_user.id]
+            await operator_reply_mode.pop(message.from_user.id)
 
-            print(f"[DEBUG] Админ отправил ответ пользователю {user_id}")
+            logger.debug("Админ отправил ответ пользователю %s", user_id)
 
         except Exception as e:
-            print(f"[ERROR] Ошибка отправки ответа: {e}")
+            logger.error("Ошибка отправки ответа: %s", e)
             await message.answer(f"❌ Ошибка: {str(e)}")
 
         return
 
     # Игнорируем сообщения от админа, монитора и техменеджера вне режима ответа
-    if message.from_user.id in [settings.ADMIN_ID, settings.MONITOR_ID, settings.TECH_MANAGER_ID]:
-        print("[DEBUG] Игнорирую - это админ/монитор/техменеджер")
+    if message.from_user.id in [settings.ADMIN_ID, settings.MONITOR_ID, settings.TECH_MANAGER_ID] \
+            or operator_router.is_operator(message.from_user.id):
+        logger.debug("Игнорирую - это админ/монитор/техменеджер")
         return
 
-    if not waiting_for_question.get(message.from_user.id, False):
-        print(f"[DEBUG] Флаг ожидания не установлен для {message.from_user.id}, игнорирую")
+    if not await waiting_for_question.get(message.from_user.id, False):
+        logger.debug("Флаг ожидания не установлен для %s, игнорирую", message.from_user.id)
         return
 
-    print(f"[DEBUG] Флаг ожидания установлен, обрабатываю сообщение")
+    logger.debug("Флаг ожидания установлен, обрабатываю сообщение")
 
-    async with async_session() as session:
-        if await is_user_blocked(session, message.from_user.id):
-            await message.answer("❌ Вы заблокированы и не можете писать в поддержку.")
-            return
+    if await is_user_blocked(session, message.from_user.id):
+        await message.answer("❌ Вы заблокированы и не можете писать в поддержку.")
+        return
 
-        allowed, error_msg = await rate_limiter.check_limit(
-            session, message.from_user.id, "message"
-        )
+    allowed, error_msg = await rate_limiter.check_limit(
+        session, message.from_user.id, "message"
+    )
 
-        if not allowed:
-            await message.answer(f"⚠️ {error_msg}")
-            return
+    if not allowed:
+        await message.answer(f"⚠️ {error_msg}")
+        return
 
-        if message.text:
-            clean_text = SecurityValidator.sanitize_text(message.text)
-            if len(clean_text) == 0:
-                await message.answer("❌ Сообщение содержит недопустимые символы.")
-                return
+    if message.text:
+        clean_text = SecurityValidator.sanitize_text(message.text)
+        if len(clean_text) == 0:
+            await message.answer("❌ Сообщение содержит недопустимые символы.")
+            return
 
-        user_info_text = (
-            f"👤 Вопрос от пользователя:\n"
-            f"ID: {message.from_user.id}\n"
-            f"Username: @{message.from_user.username or 'нет'}\n"
-            f"Имя: {message.from_user.first_name or ''} {message.from_user.last_name or ''}"
-        )
+    user_info_text = (
+        f"👤 Вопрос от пользователя:\n"
+        f"ID: {message.from_user.id}\n"
+        f"Username: @{message.from_user.username or 'нет'}\n"
+        f"Имя: {message.from_user.first_name or ''} {message.from_user.last_name or ''}"
+    )
 
-        try:
-            await send_question_to_admin(message, user_info_text)
+    try:
+        await send_question_to_admin(session, message, user_info_text)
 
-            await message.answer(
-                "✅ Ваше сообщение отправлено в поддержку!\n"
-                "Мы ответим вам в ближайшее время."
-            )
+        await message.answer(
+            "✅ Ваше сообщение отправлено в поддержку!\n"
+            "Мы ответим вам в ближайшее время."
+        )
 
-            waiting_for_question[message.from_user.id] = False
-            print(f"[DEBUG] Флаг ожидания сброшен для {message.from_user.id}")
+        await waiting_for_question.pop(message.from_user.id)
+        logger.debug("Флаг ожидания сброшен для %s", message.from_user.id)
 
-        except Exception as e:
-            print(f"[ERROR] Ошибка обработки сообщения: {e}")
-            await message.answer(
-                "❌ Произошла ошибка при отправке сообщения. Попробуйте позже."
-            )
\ No newline at end of file
+    except Exception as e:
+        logger.error("Ошибка обработки сообщения: %s", e)
+        await message.answer(
+            "❌ Произошла ошибка при отправке сообщения. Попробуйте позже."
+        )
\ No newline at end of file
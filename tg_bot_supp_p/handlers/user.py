@@ -1,21 +1,30 @@
 """
 Обработчики пользовательских команд
 """
+import logging
+
 from aiogram import Router, F
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, WebAppInfo, ReplyKeyboardRemove, \
     InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import User, async_session, Order, Product, BlockedUser
+from database import BlockedUser
 from config import settings
 from utils.security import is_user_blocked
-from handlers.state import waiting_for_question, broadcast_media_buffer
+from utils.broadcast import build_broadcast_payload, start_broadcast
+from utils.media_groups import create_collector
+from utils.outbound import NOTIFICATION, outbound_lane
+from utils.stats import get_stats
+from utils.users import upsert_user
+from handlers.state import waiting_for_question
 from handlers.fsm_states import BroadcastStates
 
-router = Router()
+logger = logging.getLogger(__name__)
+
+router = Router(name="user")
 
 
 def get_user_keyboard():
@@ -74,68 +83,63 @@ def get_tech_manager_keyboard():
 
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, session: AsyncSession):
     """Обработчик команды /start"""
 
-    print(f"[DEBUG] /start от пользователя {message.from_user.id}")
-    print(f"[DEBUG] ADMIN_ID = {settings.ADMIN_ID}")
-    print(f"[DEBUG] Это админ? {message.from_user.id == settings.ADMIN_ID}")
-
-    async with async_session() as session:
-        # Проверка блокировки
-        if await is_user_blocked(session, message.from_user.id):
-            await message.answer("❌ Вы заблокированы и не можете использовать бота.")
-            return
-
-        # Получаем или создаем пользователя
-        query = select(User).where(User.telegram_id == message.from_user.id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-
-        if not user:
-            # Создаем нового пользователя
-            user = User(
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name
-            )
-            session.add(user)
-            await session.commit()
-
-            print(f"[DEBUG] Создан новый пользователь: {message.from_user.id}")
-
-            # Уведомляем ТОЛЬКО монитор о новом пользователе
-            if message.from_user.id != settings.MONITOR_ID:
-                try:
-                    monitor_text = (
-                        f"👤 Новый пользователь:\n"
-                        f"ID: {message.from_user.id}\n"
-                        f"Username: @{message.from_user.username or 'нет'}\n"
-                        f"Имя: {message.from_user.first_name or ''} {message.from_user.last_name or ''}"
-                    )
+    logger.debug("/start от пользователя %s", message.from_user.id)
+    logger.debug("ADMIN_ID = %s", settings.ADMIN_ID)
+    logger.debug("Это админ? %s", message.from_user.id == settings.ADMIN_ID)
+
+    # Проверка блокировки
+    if await is_user_blocked(session, message.from_user.id):
+        await message.answer("❌ Вы заблокированы и не можете использовать бота.")
+        return
+
+    # Создаем пользователя или обновляем профиль одним запросом
+    is_new = await upsert_user(
+        session,
+        telegram_id=message.from_user.id,
+        username=message.from_user.username,
+        first_name=message.from_user.first_name,
+        last_name=message.from_user.last_name
+    )
+    await session.commit()
+
+    if is_new:
+        logger.debug("Создан новый пользователь: %s", message.from_user.id)
+
+        # Уведомляем ТОЛЬКО монитор о новом пользователе
+        if message.from_user.id != settings.MONITOR_ID:
+            try:
+                monitor_text = (
+                    f"👤 Новый пользователь:\n"
+                    f"ID: {message.from_user.id}\n"
+                    f"Username: @{message.from_user.username or 'нет'}\n"
+                    f"Имя: {message.from_user.first_name or ''} {message.from_user.last_name or ''}"
+                )
+                with outbound_lane(NOTIFICATION):
                     await message.bot.send_message(settings.MONITOR_ID, monitor_text)
-                    print(f"[DEBUG] Уведомление отправлено монитору: {settings.MONITOR_ID}")
-                except Exception as e:
-                    print(f"[ERROR] Ошибка отправки монитору: {e}")
+                logger.debug("Уведомление отправлено монитору: %s", settings.MONITOR_ID)
+            except Exception as e:
+                logger.error("Ошибка отправки монитору: %s", e)
 
     # Проверяем, является ли пользователь администратором или техменеджером
     if message.from_user.id == settings.ADMIN_ID:
-        print("[DEBUG] Отправляю админское приветствие")
+        logger.debug("Отправляю админское приветствие")
         welcome_text = (
             "👋 Здравствуйте, администратор!\n\n"
             "🔐 Выберите действие с помощью кнопок ниже:"
         )
         await message.answer(welcome_text, reply_markup=get_admin_keyboard())
     elif message.from_user.id == settings.TECH_MANAGER_ID:
-        print("[DEBUG] Отправляю приветствие техменеджера")
+        logger.debug("Отправляю приветствие техменеджера")
         welcome_text = (
             "👋 Здравствуйте, технический менеджер!\n\n"
             "🔧 Выберите действие с помощью кнопок ниже:"
         )
         await message.answer(welcome_text, reply_markup=get_tech_manager_keyboard())
     else:
-        print("[DEBUG] Отправляю обычное приветствие с кнопками")
+        logger.debug("Отправляю обычное приветствие с кнопками")
         welcome_text = (
             f"👋 Добро пожаловать, {message.from_user.first_name}!\n\n"
             "Я бот поддержки Vapor Launge. Вы можете:\n\n"
@@ -152,25 +156,24 @@ async def cmd_start(message: Message):
 
 
 @router.message(F.text == "❓ Задать вопрос")
-async def ask_question(message: Message):
+async def ask_question(message: Message, session: AsyncSession):
     """Обработчик кнопки 'Задать вопрос'"""
 
-    print(f"[DEBUG] Кнопка 'Задать вопрос' от {message.from_user.id}")
+    logger.debug("Кнопка 'Задать вопрос' от %s", message.from_user.id)
 
     # Игнорируем если это монитор или техменеджер
     if message.from_user.id in [settings.MONITOR_ID, settings.TECH_MANAGER_ID]:
-        print(f"[DEBUG] Игнорирую - это монитор/техменеджер")
+        logger.debug("Игнорирую - это монитор/техменеджер")
         return
 
-    async with async_session() as session:
-        # Проверка блокировки
-        if await is_user_blocked(session, message.from_user.id):
-            await message.answer("❌ Вы заблокированы и не можете писать в поддержку.")
-            return
+    # Проверка блокировки
+    if await is_user_blocked(session, message.from_user.id):
+        await message.answer("❌ Вы заблокированы и не можете писать в поддержку.")
+        return
 
     # Отмечаем, что пользователь ожидает вопрос
-    waiting_for_question[message.from_user.id] = True
-    print(f"[DEBUG] Установлен флаг ожидания для {message.from_user.id}")
+    await waiting_for_question.set(message.from_user.id, True)
+    logger.debug("Установлен флаг ожидания для %s", message.from_user.id)
 
     await message.answer(
         "📝 Опишите ваш вопрос или проблему.\n"
@@ -180,48 +183,24 @@ async def ask_question(message: Message):
 
 
 @router.message(F.text == "📊 Статистика")
-async def button_stats(message: Message):
+async def button_stats(message: Message, session: AsyncSession):
     """Обработчик кнопки 'Статистика'"""
 
     if message.from_user.id not in [settings.ADMIN_ID, settings.TECH_MANAGER_ID]:
         return
 
-    from sqlalchemy import select, func
-    from datetime import datetime, timedelta
-    from database import Order, Product
-
-    async with async_session() as session:
-        # Пользователи
-        total_users_query = select(func.count(User.id))
-        total_users = (await session.execute(total_users_query)).scalar()
-
-        # Новые за неделю
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        new_users_query = select(func.count(User.id)).where(User.created_at >= week_ago)
-        new_users = (await session.execute(new_users_query)).scalar()
-
-        # Заказы
-        total_orders_query = select(func.count(Order.id))
-        total_orders = (await session.execute(total_orders_query)).scalar()
-
-        # Заказы за неделю
-        new_orders_query = select(func.count(Order.id)).where(Order.created_at >= week_ago)
-        new_orders = (await session.execute(new_orders_query)).scalar()
-
-        # Товары
-        products_query = select(func.count(Product.id))
-        total_products = (await session.execute(products_query)).scalar()
+    stats = await get_stats(session)
 
     stats_text = (
         f"📊 Статистика\n\n"
         f"👥 Пользователи:\n"
-        f"  • Всего: {total_users}\n"
-        f"  • Новых за неделю: {new_users}\n\n"
+        f"  • Всего: {stats['total_users']}\n"
+        f"  • Новых за неделю: {stats['new_users_week']}\n\n"
         f"📦 Заказы:\n"
-        f"  • Всего: {total_orders}\n"
-        f"  • За неделю: {new_orders}\n\n"
+        f"  • Всего: {stats['total_orders']}\n"
+        f"  • За неделю: {stats['new_orders_week']}\n\n"
         f"🛍️ Товары:\n"
-        f"  • В каталоге: {total_products}"
+        f"  • В каталоге: {stats['total_products']}"
     )
 
     await message.answer(stats_text)
@@ -234,9 +213,6 @@ async def button_broadcast(message: Message, state: FSMContext):
     if message.from_user.id not in [settings.ADMIN_ID, settings.TECH_MANAGER_ID]:
         return
 
-    # Очищаем буфер медиа
-    broadcast_media_buffer[message.from_user.id] = []
-
     await message.answer(
         "📢 Отправьте сообщение для рассылки всем пользователям.\n"
         "Вы можете отправить текст, фото, видео или альбом.\n\n"
@@ -245,40 +221,44 @@ async def button_broadcast(message: Message, state: FSMContext):
     await state.set_state(BroadcastStates.waiting_for_message)
 
 
+def get_broadcast_confirm_keyboard():
+    """Клавиатура подтверждения рассылки"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm"),
+            InlineKeyboardButton(text="❌ Отменить", callback_data="broadcast_cancel")
+        ]
+    ])
+    return keyboard
+
+
 @router.message(BroadcastStates.waiting_for_message, F.media_group_id)
 async def handle_broadcast_media_group(message: Message, state: FSMContext):
-    """Обработчик медиа-группы для рассылки"""
+    """Обработчик медиа-группы для рассылки: элементы копятся в сборщике"""
 
     if message.from_user.id not in [settings.ADMIN_ID, settings.TECH_MANAGER_ID]:
         return
 
-    import asyncio
+    broadcast_albums.add(message, state=state)
 
-    # Добавляем сообщение в буфер
-    if message.from_user.id not in broadcast_media_buffer:
-        broadcast_media_buffer[message.from_user.id] = []
 
-    broadcast_media_buffer[message.from_user.id].append(message)
+async def confirm_broadcast_album(media_list: list[Message], state: FSMContext):
+    """Запрос подтверждения для собранного альбома"""
 
-    # Ждем пока соберутся все медиа
-    await asyncio.sleep(0.5)
+    message = media_list[-1]
+    payload = build_broadcast_payload(message, media_list)
+    if not payload:
+        await message.answer("❌ Этот тип сообщения нельзя разослать.")
+        return
 
-    # Проверяем что это последнее сообщение в группе
-    media_list = broadcast_media_buffer[message.from_user.id]
-    if media_list and media_list[-1].message_id == message.message_id:
-        # Подтверждение
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm"),
-                InlineKeyboardButton(text="❌ Отменить", callback_data="broadcast_cancel")
-            ]
-        ])
+    await state.update_data(broadcast_payload=payload)
+    await message.answer(
+        f"Вы уверены, что хотите отправить этот альбом ({len(media_list)} медиа) всем пользователям?",
+        reply_markup=get_broadcast_confirm_keyboard()
+    )
 
-        await state.update_data(broadcast_message=message)
-        await message.answer(
-            f"Вы уверены, что хотите отправить этот альбом ({len(media_list)} медиа) всем пользователям?",
-            reply_markup=keyboard
-        )
+
+broadcast_albums = create_collector(confirm_broadcast_album)
 
 
 @router.message(BroadcastStates.waiting_for_message, Command("cancel"))
@@ -295,27 +275,17 @@ async def process_broadcast(message: Message, state: FSMContext):
     if message.from_user.id not in [settings.ADMIN_ID, settings.TECH_MANAGER_ID]:
         return
 
-    # Сохраняем тип контента
-    content_type = message.content_type
-
-    # Подтверждение
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm"),
-            InlineKeyboardButton(text="❌ Отменить", callback_data="broadcast_cancel")
-        ]
-    ])
+    payload = build_broadcast_payload(message)
+    if not payload:
+        await message.answer("❌ Этот тип сообщения нельзя разослать.")
+        return
 
-    # Сохраняем сообщение и его тип
-    await state.update_data(
-        broadcast_message=message,
-        content_type=content_type,
-        media_group_id=message.media_group_id if hasattr(message, 'media_group_id') else None
-    )
+    # Сохраняем описание сообщения (file_id и тексты)
+    await state.update_data(broadcast_payload=payload)
 
     await message.answer(
         "Вы уверены, что хотите отправить это сообщение всем пользователям?",
-        reply_markup=keyboard
+        reply_markup=get_broadcast_confirm_keyboard()
     )
 
 
@@ -327,89 +297,17 @@ async def confirm_broadcast(callback, state: FSMContext):
         return
 
     data = await state.get_data()
-    broadcast_msg = data.get("broadcast_message")
+    payload = data.get("broadcast_payload")
 
-    if not broadcast_msg:
+    if not payload:
         await callback.message.edit_text("❌ Сообщение для рассылки не найдено.")
         await state.clear()
         return
 
     await callback.message.edit_text("📤 Начинаю рассылку...")
 
-    # Проверяем есть ли медиа-группа
-    media_group = broadcast_media_buffer.get(callback.from_user.id, [])
-
-    async with async_session() as session:
-        query = select(User.telegram_id)
-        result = await session.execute(query)
-        user_ids = [row[0] for row in result.fetchall()]
-
-    success = 0
-    failed = 0
-
-    for user_id in user_ids:
-        try:
-            async with async_session() as session:
-                if await is_user_blocked(session, user_id):
-                    continue
-
-            # Если есть медиа-группа (альбом)
-            if media_group and len(media_group) > 1:
-                from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument
-
-                media_to_send = []
-                for idx, msg in enumerate(media_group):
-                    caption = msg.caption if idx == 0 else None
-
-                    if msg.photo:
-                        media_to_send.append(InputMediaPhoto(
-                            media=msg.photo[-1].file_id,
-                            caption=caption
-                        ))
-                    elif msg.video:
-                        media_to_send.append(InputMediaVideo(
-                            media=msg.video.file_id,
-                            caption=caption
-                        ))
-                    elif msg.document:
-                        media_to_send.append(InputMediaDocument(
-                            media=msg.document.file_id,
-                            caption=caption
-                        ))
-
-                if media_to_send:
-                    await callback.bot.send_media_group(user_id, media=media_to_send)
-
-            # Обычное сообщение
-            elif broadcast_msg.text:
-                await callback.bot.send_message(user_id, broadcast_msg.text)
-            elif broadcast_msg.photo:
-                await callback.bot.send_photo(
-                    user_id,
-                    broadcast_msg.photo[-1].file_id,
-                    caption=broadcast_msg.caption
-                )
-            elif broadcast_msg.video:
-                await callback.bot.send_video(
-                    user_id,
-                    broadcast_msg.video.file_id,
-                    caption=broadcast_msg.caption
-                )
-
-            success += 1
-        except Exception as e:
-            failed += 1
-            print(f"[ERROR] Broadcast to {user_id}: {e}")
-
-    # Очищаем буфер медиа
-    if callback.from_user.id in broadcast_media_buffer:
-        del broadcast_media_buffer[callback.from_user.id]
-
-    await callback.message.edit_text(
-        f"✅ Рассылка завершена!\n\n"
-        f"Отправлено: {success}\n"
-        f"Не доставлено: {failed}"
-    )
+    # Рассылка идет в фоне, прогресс обновляется в этом же сообщении
+    await start_broadcast(callback.bot, payload, callback.from_user.id, callback.message)
     await state.clear()
 
 
@@ -421,7 +319,7 @@ async def cancel_broadcast_callback(callback, state: FSMContext):
 
 
 @router.message(F.text == "🚫 Заблокированные")
-async def button_blocked_users(message: Message):
+async def button_blocked_users(message: Message, session: AsyncSession):
     """Обработчик кнопки 'Заблокированные'"""
 
     if message.from_user.id != settings.ADMIN_ID:
@@ -430,24 +328,23 @@ async def button_blocked_users(message: Message):
     from sqlalchemy import select
     from database import BlockedUser
 
-    async with async_session() as session:
-        query = select(BlockedUser).order_by(BlockedUser.blocked_at.desc())
-        result = await session.execute(query)
-        blocked_users = result.scalars().all()
+    query = select(BlockedUser).order_by(BlockedUser.blocked_at.desc())
+    result = await session.execute(query)
+    blocked_users = result.scalars().all()
 
-        if not blocked_users:
-            await message.answer("✅ Нет заблокированных пользователей")
-            return
+    if not blocked_users:
+        await message.answer("✅ Нет заблокированных пользователей")
+        return
 
-        text = "🚫 Заблокированные пользователи:\n\n"
-        for user in blocked_users:
-            text += f"ID: {user.telegram_id}\n"
-            if user.reason:
-                text += f"Причина: {user.reason}\n"
-            text += f"Дата: {user.blocked_at.strftime('%d.%m.%Y %H:%M')}\n"
-            text += "─" * 30 + "\n"
+    text = "🚫 Заблокированные пользователи:\n\n"
+    for user in blocked_users:
+        text += f"ID: {user.telegram_id}\n"
+        if user.reason:
+            text += f"Причина: {user.reason}\n"
+        text += f"Дата: {user.blocked_at.strftime('%d.%m.%Y %H:%M')}\n"
+        text += "─" * 30 + "\n"
 
-        await message.answer(text)
+    await message.answer(text)
 
 
 @router.message(F.text == "➕ Добавить товар")
@@ -627,7 +524,7 @@ async def button_add_product(message: Message):
 #             return
 #
 #     # Отмечаем, что пользователь ожидает вопрос
-#     waiting_for_question[message.from_user.id] = True
+#     await waiting_for_question.set(message.from_user.id, True)
 #     print(f"[DEBUG] Установлен флаг ожидания для {message.from_user.id}")
 #
 #     await message.answer(
@@ -1,49 +1,190 @@
 import logging
 import asyncio
+import html
+import sys
+import threading
+import time
+from typing import Optional
+
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from utils.logging_queue import LOG_FORMAT, add_log_handler, remove_log_handler
+from utils.outbound import NOTIFICATION, outbound_lane
+
+# Лимит Telegram - 4096 символов, оставляем запас на разметку
+MAX_MESSAGE_LENGTH = 3500
+# Одна ошибка в дайджесте (с трейсбеком) обрезается до этой длины
+MAX_ENTRY_LENGTH = 1500
+
+
+class _PendingError:
+    """Одинаковые ошибки за интервал: первый текст и число повторов"""
+
+    __slots__ = ("text", "count", "first_seen", "last_seen")
+
+    def __init__(self, text: str, now: float):
+        self.text = text
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
 
 
 # ===================================
 # КЛАСС ДЛЯ ОТПРАВКИ ЛОГОВ В ТЕЛЕГРАМ
 # ===================================
 class TelegramLogHandler(logging.Handler):
-    def init(self, bot: Bot, chat_id: int):
-        super().init()
+    """
+    Отправка ошибок в Telegram дайджестами
+
+    emit() только складывает запись в ограниченный буфер (потокобезопасно:
+    вызывается из потока QueueListener). Одинаковые ошибки склеиваются
+    со счетчиком повторов. Единственная задача-отправитель шлет дайджест
+    не чаще раза в interval секунд. Если Telegram недоступен, дайджест
+    пишется в локальный лог, а не теряется.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, interval: float = 30, max_pending: int = 100):
+        super().__init__(level=logging.ERROR)  # Только ошибки и критическое
         self.bot = bot
         self.chat_id = chat_id
-        self.setLevel(logging.ERROR)  # Только ошибки и критическое
+        self.interval = interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._pending: dict[tuple, _PendingError] = {}
+        self._overflow = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Локальный вывод, если отправить не удалось (мимо корневого логгера)
+        self.fallback = logging.StreamHandler(sys.stderr)
+        self.fallback.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    def emit(self, record: logging.LogRecord):
+        """Добавить запись в буфер дайджеста"""
+        # Ошибки самой отправки не должны порождать новые отправки
+        if record.name.startswith(__name__):
+            return
+
+        try:
+            key = (record.name, record.levelno, record.pathname, record.lineno, record.getMessage())
+            now = time.time()
+            with self._lock:
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry.count += 1
+                    entry.last_seen = now
+                    return
+
+                if len(self._pending) >= self.max_pending:
+                    self._overflow += 1
+                    return
+
+                self._pending[key] = _PendingError(self.format(record), now)
+                first = len(self._pending) == 1
+
+            if first and self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+        except Exception:
+            self.handleError(record)
+
+    def start(self):
+        """Запустить отправителя (из работающего event loop)"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._sender(), name="telegram_log_sender")
+
+    async def stop(self):
+        """Отключиться от логов, остановить отправителя и отправить накопленное"""
+        remove_log_handler(self)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._flush()
+
+    async def _sender(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self._flush()
+            # Не чаще одного дайджеста за интервал: остальное копится в буфере
+            await asyncio.sleep(self.interval)
+
+    async def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            overflow, self._overflow = self._overflow, 0
 
-    def emit(self, record):
-        """Отправляет лог в Telegram"""
-        asyncio.create_task(self._send(record))
+        if not pending and not overflow:
+            return
 
-    async def _send(self, record):
+        for blocks in self._digest(list(pending.values()), overflow):
+            try:
+                await self._send(blocks)
+            except Exception as e:
+                text = "\n\n".join(blocks)
+                self._fallback(f"Не удалось отправить ошибки в Telegram ({type(e).__name__}: {e}):\n{text}")
+
+    @outbound_lane(NOTIFICATION)
+    async def _send(self, blocks: list[str]):
+        text = "\n\n".join(html.escape(block) for block in blocks)
+        message = f"🚨 <b>Ошибка в боте</b>\n<code>{text}</code>"
         try:
-            # Форматируем сообщение
-            log_entry = self.format(record)
-            # Обрезаем если слишком длинное
-            if len(log_entry) > 3500:
-                log_entry = log_entry[:3500] + "..."
+            await self.bot.send_message(self.chat_id, message, parse_mode="HTML")
+        except TelegramRetryAfter as e:
+            # Один повтор после паузы, которую попросил Telegram
+            await asyncio.sleep(e.retry_after)
+            await self.bot.send_message(self.chat_id, message, parse_mode="HTML")
+
+    def _digest(self, entries: list[_PendingError], overflow: int) -> list[list[str]]:
+        """Разбить дайджест на сообщения: длина после экранирования HTML не больше MAX_MESSAGE_LENGTH"""
+        blocks = []
+        for entry in entries:
+            text = entry.text
+            if len(text) > MAX_ENTRY_LENGTH:
+                text = text[:MAX_ENTRY_LENGTH] + "..."
+            if entry.count > 1:
+                text = f"[×{entry.count} за {entry.last_seen - entry.first_seen:.0f} с]\n{text}"
+            blocks.append(text)
+        if overflow:
+            blocks.append(f"...и еще {overflow} записей с другими ошибками (см. локальный лог)")
 
-            await self.bot.send_message(
-                self.chat_id,
-                f"🚨 <b>Ошибка в боте</b>\n<code>{log_entry}</code>",
-                parse_mode="HTML"
-            )
-        except:
-            pass  # Тихий провал, чтобы бот не падал
+        messages, current, size = [], [], 0
+        for block in blocks:
+            length = len(html.escape(block)) + 2
+            if current and size + length > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current, size = [], 0
+            current.append(block)
+            size += length
+        if current:
+            messages.append(current)
+        return messages
+
+    def _fallback(self, text: str):
+        record = logging.LogRecord(__name__, logging.ERROR, __file__, 0, text, None, None)
+        self.fallback.handle(record)
 
 
 # ===================================
 # ФУНКЦИЯ БЫСТРОЙ НАСТРОЙКИ
 # ===================================
-def setup_telegram_logger(bot: Bot, admin_id: int):
+def setup_telegram_logger(
+        bot: Bot,
+        admin_id: int,
+        interval: float = 30,
+        max_pending: int = 100
+) -> TelegramLogHandler:
     """
-    Включает отправку ошибок в Telegram.
-    Вызывай сразу после создания bot.
+    Включает отправку ошибок в Telegram (в дополнение к обычным логам).
+    Вызывай из работающего event loop после создания bot;
+    при остановке - await handler.stop().
     """
     # Создаем обработчик
-    telegram_handler = TelegramLogHandler(bot, admin_id)
+    telegram_handler = TelegramLogHandler(bot, admin_id, interval=interval, max_pending=max_pending)
 
     # Красивый формат для Telegram
     formatter = logging.Formatter(
@@ -54,20 +195,8 @@ def setup_telegram_logger(bot: Bot, admin_id: int):
     )
     telegram_handler.setFormatter(formatter)
 
-    # Получаем корневой логгер
-    root_logger = logging.getLogger()
-
-    # Удаляем ВСЕ старые обработчики (включая консоль)
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-
-    # Добавляем только Telegram
-    root_logger.addHandler(telegram_handler)
-    root_logger.setLevel(logging.ERROR)
-
-    # Отправляем тестовое сообщение
-    asyncio.create_task(
-        bot.send_message(admin_id, "✅ Логи переключены на Telegram")
-    )
+    # Записи приходят из очереди логов, консольный вывод сохраняется
+    telegram_handler.start()
+    add_log_handler(telegram_handler)
 
-    return telegram_handler
\ No newline at end of file
+    return telegram_handler
@@ -0,0 +1,18 @@
+"""
+Middlewares package
+"""
+from .activity import ActivityMiddleware, OperatorPresenceMiddleware, activity_tracker
+from .database import DbSessionMiddleware
+from .metrics import BotApiMetricsMiddleware, HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from .outbound import OutboundSchedulerMiddleware
+
+__all__ = [
+    'ActivityMiddleware',
+    'activity_tracker',
+    'OperatorPresenceMiddleware',
+    'DbSessionMiddleware',
+    'BotApiMetricsMiddleware',
+    'HandlerMetricsMiddleware',
+    'UpdateMetricsMiddleware',
+    'OutboundSchedulerMiddleware',
+]
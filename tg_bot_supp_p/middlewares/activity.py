@@ -0,0 +1,131 @@
+"""
+Учет последней активности пользователей с отложенной записью и присутствия операторов
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User as TelegramUser
+from sqlalchemy import BigInteger, DateTime, bindparam, column, update, values
+
+from config import settings
+from database import User, async_session
+from utils.background import background
+from utils.operators import OperatorRouter
+
+logger = logging.getLogger(__name__)
+
+# Строк в одном UPDATE (Postgres ограничивает число параметров запроса)
+FLUSH_BATCH_SIZE = 1000
+
+
+class ActivityTracker:
+    """
+    Буфер времени последней активности
+
+    Обработчики только обновляют словарь в памяти; раз в flush_interval
+    накопленное записывается в users.last_activity пакетным UPDATE.
+    Повторные сообщения пользователя между записями ничего не стоят.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: dict[int, datetime] = {}
+
+    def touch(self, telegram_id: int):
+        """Отметить активность пользователя"""
+        self._pending[telegram_id] = datetime.utcnow()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def start(self):
+        """Запустить периодическую запись (и финальную при остановке)"""
+        background.every(self.flush_interval, self.flush, "activity_flush", run_on_stop=True)
+
+    async def flush(self):
+        """Записать накопленную активность в БД"""
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        rows = list(pending.items())
+        started = time.monotonic()
+
+        try:
+            async with async_session() as session:
+                for offset in range(0, len(rows), FLUSH_BATCH_SIZE):
+                    await self._update(session, rows[offset:offset + FLUSH_BATCH_SIZE])
+                await session.commit()
+        except Exception:
+            # Не теряем отметки: более свежие, пришедшие за время записи, важнее
+            for telegram_id, moment in pending.items():
+                self._pending.setdefault(telegram_id, moment)
+            raise
+
+        logger.debug(f"last_activity: обновлено {len(rows)} пользователей за {time.monotonic() - started:.3f} с")
+
+    @staticmethod
+    async def _update(session, rows: list[tuple[int, datetime]]):
+        if session.bind.dialect.name == "postgresql":
+            # UPDATE users ... FROM (VALUES ...) - один запрос на порцию
+            data = values(
+                column("telegram_id", BigInteger),
+                column("last_activity", DateTime),
+                name="activity"
+            ).data(rows)
+            await session.execute(
+                update(User)
+                .where(User.telegram_id == data.c.telegram_id)
+                .values(last_activity=data.c.last_activity)
+            )
+            return
+
+        # SQLite не поддерживает VALUES с именами колонок: executemany
+        await session.execute(
+            update(User.__table__)
+            .where(User.telegram_id == bindparam("telegram_id_"))
+            .values(last_activity=bindparam("last_activity_")),
+            [{"telegram_id_": telegram_id, "last_activity_": moment} for telegram_id, moment in rows]
+        )
+
+
+activity_tracker = ActivityTracker(flush_interval=settings.ACTIVITY_FLUSH_INTERVAL)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Внешний middleware: отмечает активность автора каждого обновления"""
+
+    def __init__(self, tracker: ActivityTracker):
+        self.tracker = tracker
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user: TelegramUser = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self.tracker.touch(user.id)
+        return await handler(event, data)
+
+
+class OperatorPresenceMiddleware(BaseMiddleware):
+    """Внешний middleware: отмечает, что оператор поддержки в сети"""
+
+    def __init__(self, router: OperatorRouter):
+        self.router = router
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        user: TelegramUser = data.get("event_from_user")
+        if user is not None and self.router.is_pool_member(user.id):
+            await self.router.touch(user.id)
+        return await handler(event, data)
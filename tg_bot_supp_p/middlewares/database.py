@@ -0,0 +1,40 @@
+"""
+Сессия БД на время обработки обновления
+"""
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """
+    Одна сессия БД на обновление (аргумент обработчика session)
+
+    AsyncSession берет соединение из пула только при первом запросе, поэтому
+    обновления без обращений к БД пул не трогают, а остальные используют не
+    больше одного соединения. Незафиксированная транзакция по окончании
+    обработки коммитится, при исключении - откатывается.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker):
+        self.session_pool = session_pool
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        async with self.session_pool() as session:
+            data["session"] = session
+            try:
+                result = await handler(event, data)
+            except Exception:
+                await session.rollback()
+                raise
+
+            if session.in_transaction():
+                await session.commit()
+            return result
@@ -0,0 +1,111 @@
+"""
+Метрики обработки обновлений и запросов к Bot API
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+from utils.metrics import Counter, Histogram
+
+bot_updates_total = Counter(
+    "bot_updates_total",
+    "Обработанные обновления по типу и результату (handled, unhandled, error)",
+    ["type", "status"]
+)
+bot_update_duration_seconds = Histogram(
+    "bot_update_duration_seconds",
+    "Полное время обработки обновления",
+    ["type"]
+)
+bot_handler_duration_seconds = Histogram(
+    "bot_handler_duration_seconds",
+    "Время работы обработчика",
+    ["router", "handler"]
+)
+bot_handler_errors_total = Counter(
+    "bot_handler_errors_total",
+    "Исключения в обработчиках",
+    ["router", "handler", "error"]
+)
+bot_api_request_duration_seconds = Histogram(
+    "bot_api_request_duration_seconds",
+    "Длительность запросов к Bot API",
+    ["method"]
+)
+bot_api_errors_total = Counter(
+    "bot_api_errors_total",
+    "Ошибки запросов к Bot API",
+    ["method", "error"]
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: поток и полное время обработки"""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "unhandled" if result is UNHANDLED else "handled"
+            return result
+        finally:
+            bot_update_duration_seconds.observe(time.perf_counter() - started, type=update_type)
+            bot_updates_total.inc(type=update_type, status=status)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: время обработчика по роутеру и имени функции
+
+    Вызывается только для обработчика, прошедшего фильтры, поэтому
+    проверки фильтров в его время не входят.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+        router = data["event_router"].name
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            bot_handler_errors_total.inc(router=router, handler=name, error=type(e).__name__)
+            raise
+        finally:
+            bot_handler_duration_seconds.observe(time.perf_counter() - started, router=router, handler=name)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: длительность и ошибки методов Bot API"""
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType,
+            bot: Bot,
+            method: TelegramMethod
+    ) -> Response:
+        api_method = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            bot_api_errors_total.inc(method=api_method, error=type(e).__name__)
+            raise
+        finally:
+            bot_api_request_duration_seconds.observe(time.perf_counter() - started, method=api_method)
@@ -0,0 +1,52 @@
+"""
+Исходящие сообщения через планировщик лимитов
+"""
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+
+from utils.outbound import OutboundScheduler
+
+# Методы, которые Telegram считает отправкой сообщения (кроме send*)
+SEND_METHODS = {"copyMessage", "copyMessages", "forwardMessage", "forwardMessages"}
+# send*, которые не создают сообщений
+NOT_SEND_METHODS = {"sendChatAction"}
+
+
+def is_send_method(api_method: str) -> bool:
+    """Попадает ли метод Bot API под лимиты отправки"""
+    if api_method in NOT_SEND_METHODS:
+        return False
+    return api_method.startswith("send") or api_method in SEND_METHODS
+
+
+class OutboundSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: отправки ждут разрешения планировщика
+
+    Остальные методы (колбэки, редактирование, getUpdates) проходят без
+    ожидания. Регистрируется раньше BotApiMetricsMiddleware, чтобы ожидание
+    не попадало в длительность запросов к Bot API.
+    """
+
+    def __init__(self, scheduler: OutboundScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType,
+            bot: Bot,
+            method: TelegramMethod
+    ) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not is_send_method(method.__api_method__):
+            return await make_request(bot, method)
+
+        cost = len(method.media) if method.__api_method__ == "sendMediaGroup" else 1
+        await self.scheduler.acquire(chat_id, cost)
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.scheduler.penalize(chat_id, e.retry_after)
+            raise
@@ -0,0 +1,126 @@
+"""
+Бенчмарк логирования на горячем пути: print() против очереди логов
+
+Запуск:
+    python scripts/bench_logging.py --updates 20000
+
+Каждое "обновление" делает столько же записей, сколько handle_user_message
+вместе с send_question_to_admin. Замеряется время, которое записи отнимают
+у event loop. Вывод идет в файл (--output) с построчной буферизацией, как
+у контейнера с PYTHONUNBUFFERED=1; --write-latency имитирует медленный
+приемник (терминал, заполненный pipe, journald).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.logging_queue import LOG_FORMAT, setup_logging, stop_logging
+
+logger = logging.getLogger("bench_logging")
+
+
+class SlowFile:
+    """Файл, каждая запись в который занимает не меньше latency секунд"""
+
+    def __init__(self, path: str, latency: float):
+        self._file = open(path, "w", buffering=1, encoding="utf-8")
+        self._latency = latency
+
+    def write(self, text: str) -> int:
+        if self._latency:
+            time.sleep(self._latency)
+        return self._file.write(text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def update_with_print(sink, user_id: int, content_type: str):
+    print(f"[DEBUG] Получено сообщение от {user_id}, тип: {content_type}", file=sink)
+    print(f"[DEBUG] Флаг ожидания установлен, обрабатываю сообщение", file=sink)
+    print(f"[DEBUG] Отправка вопроса админу от {user_id}", file=sink)
+    print(f"[DEBUG] Сообщение отправлено админу с кнопками", file=sink)
+    print(f"[DEBUG] Флаг ожидания сброшен для {user_id}", file=sink)
+
+
+def update_with_logging(sink, user_id: int, content_type: str):
+    logger.debug("Получено сообщение от %s, тип: %s", user_id, content_type)
+    logger.debug("Флаг ожидания установлен, обрабатываю сообщение")
+    logger.debug("Отправка вопроса админу от %s", user_id)
+    logger.debug("Сообщение отправлено админу с кнопками")
+    logger.debug("Флаг ожидания сброшен для %s", user_id)
+
+
+async def run(name: str, step, sink, updates: int):
+    """Прогнать обновления и вывести время записи на одно обновление"""
+    durations = []
+    for index in range(updates):
+        started = time.perf_counter()
+        step(sink, 1_000_000 + index % 500, "text")
+        durations.append((time.perf_counter() - started) * 1_000_000)
+        # Отдаем управление, как между реальными обновлениями
+        if index % 100 == 0:
+            await asyncio.sleep(0)
+
+    durations.sort()
+    print(
+        f"{name:<24} на обновление: среднее {statistics.mean(durations):7.1f} мкс, "
+        f"p50 {durations[len(durations) // 2]:7.1f}, p99 {durations[int(len(durations) * 0.99)]:7.1f}, "
+        f"max {durations[-1]:8.1f}",
+        file=sys.__stdout__
+    )
+
+
+def file_handler(path: str, latency: float) -> logging.Handler:
+    handler = logging.StreamHandler(SlowFile(path, latency))
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def direct_logging(level: str, handler: logging.Handler):
+    """Обычная схема: обработчик на корневом логгере пишет в потоке event loop"""
+    stop_logging()
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+async def main(args):
+    output = args.output or os.path.join(tempfile.mkdtemp(), "bench.log")
+    latency = args.write_latency / 1_000_000
+
+    sink = SlowFile(output, latency)
+    await run("print (было)", update_with_print, sink, args.updates)
+    sink.close()
+
+    direct_logging("DEBUG", file_handler(output, latency))
+    await run("logging DEBUG без очереди", update_with_logging, None, args.updates)
+
+    setup_logging("DEBUG", file_handler(output, latency))
+    await run("очередь, DEBUG", update_with_logging, None, args.updates)
+    stop_logging()
+
+    setup_logging("INFO", file_handler(output, latency))
+    await run("очередь, INFO (прод)", update_with_logging, None, args.updates)
+    stop_logging()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="print() против логирования через очередь")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--output", help="файл для вывода логов (по умолчанию временный)")
+    parser.add_argument("--write-latency", type=float, default=0, help="задержка одной записи в вывод (мкс)")
+    asyncio.run(main(parser.parse_args()))
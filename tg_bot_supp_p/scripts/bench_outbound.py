@@ -0,0 +1,179 @@
+"""
+Стенд исходящих сообщений: ответы поддержки во время рассылки
+
+Запуск (сравнение - двумя процессами):
+    python scripts/bench_outbound.py --recipients 600
+    python scripts/bench_outbound.py --recipients 600 --no-scheduler
+
+Поддельный Bot API на --api-port ограничивает отправки, как Telegram:
+общее ведро 30 сообщений в секунду и ведро на чат (1 в секунду, до 3 подряд),
+сверх лимита отвечает 429 с retry_after. Пока BroadcastEngine рассылает
+сообщение получателям, бот отвечает пользователям (полоса support) и шлет
+вопросы в чат администратора (полоса notification). Замеряется задержка
+этих отправок и сколько из них Telegram отклонил.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+from aiohttp import web
+
+from middlewares.outbound import OutboundSchedulerMiddleware
+from utils.broadcast import BroadcastEngine
+from utils.outbound import NOTIFICATION, OutboundScheduler, outbound_lane
+
+BENCH_TOKEN = "42:bench"
+ADMIN_CHAT = 1
+USER_ID_BASE = 1_000_000
+
+
+class Limit:
+    """Ведро токенов поддельного Telegram"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class FakeTelegram:
+    """Поддельный Bot API с лимитами отправки"""
+
+    def __init__(self):
+        self.global_limit = Limit(30, 30)
+        self.chat_limits: dict[int, Limit] = {}
+        self.sent = 0
+        self.rejected = 0
+        self._message_id = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        return app
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        params = dict(await request.post())
+        chat_id = int(params["chat_id"])
+        chat_limit = self.chat_limits.setdefault(chat_id, Limit(1, 3))
+
+        # Сетевая задержка до Bot API
+        await asyncio.sleep(0.03)
+        if not chat_limit.take() or not self.global_limit.take():
+            self.rejected += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1}
+            })
+
+        self.sent += 1
+        self._message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", "")
+        }})
+
+
+async def timed_send(bot: Bot, chat_id: int, text: str, latencies: list, failures: list):
+    started = time.perf_counter()
+    try:
+        await bot.send_message(chat_id, text)
+    except TelegramRetryAfter:
+        failures.append(chat_id)
+        return
+    latencies.append(time.perf_counter() - started)
+
+
+@outbound_lane(NOTIFICATION)
+async def send_question(bot: Bot, index: int, latencies: list, failures: list):
+    await timed_send(bot, ADMIN_CHAT, f"Вопрос #{index}", latencies, failures)
+
+
+def report(name: str, latencies: list, failures: list):
+    if not latencies:
+        print(f"{name:<14} отправлено 0, отклонено {len(failures)}")
+        return
+    latencies = sorted(latencies)
+    print(
+        f"{name:<14} отправлено {len(latencies):4}, отклонено {len(failures):3}, "
+        f"задержка p50 {latencies[len(latencies) // 2] * 1000:6.0f} мс, "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.0f} мс, "
+        f"max {latencies[-1] * 1000:6.0f} мс"
+    )
+
+
+async def main(args):
+    telegram = FakeTelegram()
+    runner = web.AppRunner(telegram.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{args.api_port}"))
+    bot = Bot(token=BENCH_TOKEN, session=session)
+    if not args.no_scheduler:
+        bot.session.middleware(OutboundSchedulerMiddleware(OutboundScheduler()))
+
+    engine = BroadcastEngine(bot, rate=25, concurrency=20)
+    recipients = [USER_ID_BASE + index for index in range(args.recipients)]
+    broadcast_started = time.perf_counter()
+    broadcast = asyncio.create_task(engine.run(recipients, {"kind": "text", "text": "Рассылка"}))
+
+    replies, reply_failures = [], []
+    questions, question_failures = [], []
+    tasks = []
+    index = 0
+    # Ответы поддержки 5 в секунду разным пользователям, вопрос админу раз в 1.5 с
+    while not broadcast.done():
+        user_id = USER_ID_BASE + args.recipients + random.randrange(10_000)
+        tasks.append(asyncio.create_task(timed_send(bot, user_id, "Ответ поддержки", replies, reply_failures)))
+        if index % 8 == 0:
+            tasks.append(asyncio.create_task(send_question(bot, index, questions, question_failures)))
+        index += 1
+        await asyncio.sleep(0.2)
+
+    result = await broadcast
+    broadcast_time = time.perf_counter() - broadcast_started
+    await asyncio.gather(*tasks)
+
+    mode = "без планировщика" if args.no_scheduler else "с планировщиком"
+    print(f"Режим: {mode}")
+    print(
+        f"Рассылка: {result.delivered} доставлено, {result.failed} не доставлено за {broadcast_time:.1f} с"
+    )
+    report("ответы", replies, reply_failures)
+    report("вопросы админу", questions, question_failures)
+    print(f"Telegram: принято {telegram.sent}, отклонено 429: {telegram.rejected}")
+
+    await bot.session.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ответы поддержки во время рассылки")
+    parser.add_argument("--recipients", type=int, default=600)
+    parser.add_argument("--api-port", type=int, default=8089)
+    parser.add_argument("--no-scheduler", action="store_true", help="отправлять без планировщика")
+    asyncio.run(main(parser.parse_args()))
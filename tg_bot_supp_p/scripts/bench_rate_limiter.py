@@ -0,0 +1,99 @@
+"""
+Бенчмарк ограничителя частоты: SQL против Redis
+
+Запуск:
+    python scripts/bench_rate_limiter.py --users 200 --checks 20
+
+Для Redis-части нужен REDIS_URL в .env (или --redis-url).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete
+
+from config import settings
+from database import RateLimit, async_session, engine, init_db
+from utils.security import RateLimiter, RedisRateLimiter
+
+# Диапазон ID, который не пересекается с реальными пользователями
+BENCH_ID_BASE = 9_000_000_000_000
+
+
+async def run_checks(limiter: RateLimiter, users: int, checks: int, concurrency: int) -> list[float]:
+    """Выполнить users * checks проверок и вернуть задержки в мс"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_user(telegram_id: int):
+        for _ in range(checks):
+            async with semaphore:
+                started = time.perf_counter()
+                async with async_session() as session:
+                    await limiter.check_limit(session, telegram_id, "bench")
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one_user(BENCH_ID_BASE + i) for i in range(users)))
+    return latencies
+
+
+def report(name: str, latencies: list[float], elapsed: float):
+    """Вывести сводку по одному прогону"""
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<8} checks={len(latencies):<6} "
+        f"rps={len(latencies) / elapsed:>9.1f} "
+        f"p50={statistics.median(latencies):>7.2f}ms "
+        f"p95={p95:>7.2f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--checks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--redis-url", default=settings.REDIS_URL)
+    args = parser.parse_args()
+
+    # Лимиты выше числа проверок, чтобы каждая проверка проходила полный путь
+    limits = dict(max_per_minute=args.checks + 1, max_per_hour=args.checks + 1)
+
+    await init_db()
+
+    started = time.perf_counter()
+    latencies = await run_checks(RateLimiter(**limits), args.users, args.checks, args.concurrency)
+    report("sql", latencies, time.perf_counter() - started)
+
+    async with async_session() as session:
+        await session.execute(delete(RateLimit).where(RateLimit.action_type == "bench"))
+        await session.commit()
+
+    if args.redis_url:
+        from redis.asyncio import Redis
+        redis = Redis.from_url(args.redis_url)
+        limiter = RedisRateLimiter(redis, key_prefix="rate_limit_bench", **limits)
+
+        started = time.perf_counter()
+        latencies = await run_checks(limiter, args.users, args.checks, args.concurrency)
+        report("redis", latencies, time.perf_counter() - started)
+
+        keys = [key async for key in redis.scan_iter("rate_limit_bench:*")]
+        if keys:
+            await redis.delete(*keys)
+        await redis.close()
+    else:
+        print("redis    пропущен: REDIS_URL не задан")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+"""
+Стенд с поддельным Telegram: пропускная способность и задержка polling против вебхука
+
+Запуск (каждый режим - отдельным процессом):
+    python scripts/bench_updates.py --mode polling --users 200 --updates 5 --rate 300
+    python scripts/bench_updates.py --mode webhook --users 200 --updates 5 --rate 300
+
+Поддельный Bot API поднимается на --api-port, бот запускается в этом же
+процессе с TELEGRAM_API_URL на него. Обновления подаются с постоянной частотой
+--rate: в режиме polling отдаются через getUpdates, в режиме webhook
+отправляются POST-запросами (не больше 40 одновременно, как у Telegram).
+Задержка - от выдачи обновления до sendMessage этому пользователю.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, web
+
+# Диапазон ID, который не пересекается с реальными пользователями
+BENCH_ID_BASE = 9_000_000_000_000
+WEBHOOK_SECRET = "bench-secret"
+# Telegram по умолчанию держит до 40 параллельных запросов к вебхуку
+WEBHOOK_CONNECTIONS = 40
+
+
+class FakeTelegram:
+    """Поддельный Bot API: выдает обновления и замеряет время до ответа бота"""
+
+    def __init__(self, mode: str, webhook_url: str, expected: int):
+        self.mode = mode
+        self.webhook_url = webhook_url
+        self.expected = expected
+
+        self.updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+        self._sent_at: dict[int, deque] = defaultdict(deque)
+        self.latencies: list[float] = []
+        self.first_sent = None
+        self.last_answer = None
+        self.done = asyncio.Event()
+        self._message_id = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        return app
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getupdates":
+            result = await self._get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)))
+        elif method in ("sendmessage", "sendphoto", "sendvideo", "senddocument"):
+            result = self._answer(int(params["chat_id"]), params.get("text", ""))
+        else:
+            result = True
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, offset: int, timeout: float) -> list[dict]:
+        # update_id идут подряд с 1
+        start = max(offset - 1, 0)
+        if start >= len(self.updates):
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[start:start + 100]
+
+    def _answer(self, chat_id: int, text: str) -> dict:
+        now = time.perf_counter()
+        pending = self._sent_at.get(chat_id)
+        if pending:
+            self.latencies.append(now - pending.popleft())
+            self.last_answer = now
+            if len(self.latencies) >= self.expected:
+                self.done.set()
+
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+
+    async def feed(self, users: int, per_user: int, rate: float, text: str):
+        """Подавать обновления с частотой rate в секунду"""
+        semaphore = asyncio.Semaphore(WEBHOOK_CONNECTIONS)
+        tasks = []
+        started = time.perf_counter()
+
+        async with ClientSession() as http:
+            for index in range(users * per_user):
+                delay = started + index / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                user_id = BENCH_ID_BASE + index % users
+                update = {
+                    "update_id": index + 1,
+                    "message": {
+                        "message_id": index + 1,
+                        "date": int(time.time()),
+                        "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+                        "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                        "text": text,
+                    },
+                }
+
+                now = time.perf_counter()
+                self.first_sent = self.first_sent or now
+                self._sent_at[user_id].append(now)
+
+                if self.mode == "polling":
+                    self.updates.append(update)
+                    self._new_updates.set()
+                else:
+                    tasks.append(asyncio.create_task(self._post(http, semaphore, update)))
+
+            await asyncio.gather(*tasks)
+
+    async def _post(self, http: ClientSession, semaphore: asyncio.Semaphore, update: dict):
+        async with semaphore:
+            async with http.post(
+                self.webhook_url,
+                data=json.dumps(update),
+                headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+            ) as response:
+                response.raise_for_status()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def main(args):
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    webhook_url = f"http://127.0.0.1:{args.webhook_port}/webhook"
+
+    # Настройки бота задаются до импорта config
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "TELEGRAM_API_URL": api_url,
+        "WEBHOOK_URL": f"http://127.0.0.1:{args.webhook_port}",
+        "WEBHOOK_PATH": "/webhook",
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(args.webhook_port),
+    })
+    os.environ.setdefault("BOT_TOKEN", "123456:bench")
+    for name in ("ADMIN_ID", "MONITOR_ID", "TECH_MANAGER_ID"):
+        os.environ.setdefault(name, "1")
+
+    import bot as bot_module
+    from database import engine, init_db
+
+    expected = args.users * args.updates
+    fake = FakeTelegram(args.mode, webhook_url, expected)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    await init_db()
+    tg_bot = bot_module.create_bot()
+    dp = bot_module.create_dispatcher()
+
+    if args.mode == "polling":
+        bot_task = asyncio.create_task(bot_module.run_polling(tg_bot, dp))
+    else:
+        bot_task = asyncio.create_task(bot_module.run_webhook(tg_bot, dp))
+
+    # Даем боту запуститься (и вебхуку начать слушать)
+    await asyncio.sleep(2)
+
+    await fake.feed(args.users, args.updates, args.rate, args.text)
+    try:
+        await asyncio.wait_for(fake.done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Получено ответов: {len(fake.latencies)} из {expected}")
+
+    if args.mode == "polling":
+        await dp.stop_polling()
+    else:
+        bot_task.cancel()
+    await asyncio.gather(bot_task, return_exceptions=True)
+    await tg_bot.session.close()
+    await runner.cleanup()
+    await engine.dispose()
+
+    if not fake.latencies:
+        print("Нет ответов")
+        return
+
+    latencies_ms = [latency * 1000 for latency in fake.latencies]
+    duration = fake.last_answer - fake.first_sent
+    print(f"\nРежим: {args.mode}, обновлений: {len(latencies_ms)}, частота подачи: {args.rate}/с")
+    print(f"Пропускная способность: {len(latencies_ms) / duration:.0f} обновлений/с")
+    print(
+        f"Задержка: среднее {statistics.mean(latencies_ms):.1f} мс, "
+        f"p50 {percentile(latencies_ms, 50):.1f}, p95 {percentile(latencies_ms, 95):.1f}, "
+        f"p99 {percentile(latencies_ms, 99):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Polling против вебхука на поддельном Telegram")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=5, help="обновлений на пользователя")
+    parser.add_argument("--rate", type=float, default=300, help="обновлений в секунду")
+    parser.add_argument("--text", default="❓ Задать вопрос", help="текст сообщений пользователей")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8082)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///bench_updates.db")
+    parser.add_argument("--timeout", type=float, default=60)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""
+Проверка планов горячих запросов: каждый должен идти по своему индексу
+
+Запуск:
+    python scripts/explain_indexes.py
+
+Печатает EXPLAIN для запросов ограничителя частоты, статистики и заказов
+и завершается с кодом 1, если какой-то запрос не использует ожидаемый индекс.
+На Postgres последовательное сканирование отключается (enable_seqscan = off):
+на маленькой базе проверяется применимость индекса, а не выбор планировщика.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Добавляем корневую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func, text
+
+from database import RateLimit, User, Order, OrderItem, engine, init_db
+
+
+def hot_queries() -> list[tuple[str, object, str]]:
+    """Запросы в том виде, в котором их строит код бота: (описание, запрос, индекс)"""
+    now = datetime.utcnow()
+    week_ago = now - timedelta(days=7)
+
+    return [
+        (
+            "RateLimiter.check_limit: действия пользователя за минуту",
+            select(func.count(RateLimit.id)).where(
+                RateLimit.telegram_id == 123456789,
+                RateLimit.action_type == "message",
+                RateLimit.timestamp >= now - timedelta(minutes=1)
+            ),
+            "ix_rate_limits_telegram_action_timestamp",
+        ),
+        (
+            "reconcile_stats: новые пользователи по дням",
+            select(func.date(User.created_at), func.count())
+            .where(User.created_at >= week_ago)
+            .group_by(func.date(User.created_at)),
+            "ix_users_created_at",
+        ),
+        (
+            "reconcile_stats: новые заказы по дням",
+            select(func.date(Order.created_at), func.count())
+            .where(Order.created_at >= week_ago)
+            .group_by(func.date(Order.created_at)),
+            "ix_orders_created_at",
+        ),
+        (
+            "Заказы пользователя",
+            select(Order).where(Order.user_id == 1),
+            "ix_orders_user_id",
+        ),
+        (
+            "Позиции заказа",
+            select(OrderItem).where(OrderItem.order_id == 1),
+            "ix_order_items_order_id",
+        ),
+    ]
+
+
+async def main() -> int:
+    await init_db()
+
+    failed = 0
+    async with engine.connect() as conn:
+        dialect = conn.dialect
+        if dialect.name == "postgresql":
+            explain = "EXPLAIN "
+            await conn.execute(text("SET enable_seqscan = off"))
+        elif dialect.name == "sqlite":
+            explain = "EXPLAIN QUERY PLAN "
+        else:
+            print(f"СУБД {dialect.name} не поддерживается скриптом")
+            return 1
+
+        for title, query, index in hot_queries():
+            sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            rows = (await conn.execute(text(explain + sql))).all()
+            plan = "\n".join("  " + " ".join(str(value) for value in row) for row in rows)
+
+            ok = index in plan
+            failed += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {title} (ожидается {index})")
+            print(plan)
+            print()
+
+    await engine.dispose()
+
+    if failed:
+        print(f"Без индекса: {failed} запрос(ов)")
+        return 1
+    print("Все запросы используют индексы")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,50 @@
+"""
+Общие настройки тестов
+
+Переменные окружения задаются до импорта модулей бота: config.settings
+читается при импорте. БД - временный файл SQLite.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("MONITOR_ID", "2")
+os.environ.setdefault("TECH_MANAGER_ID", "3")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+os.environ["STATE_BACKEND"] = "memory"
+
+import pytest
+from sqlalchemy import delete
+
+from database import Ticket, TicketMessage, async_session, engine, init_db
+
+
+def run(coro):
+    """Выполнить корутину в новом цикле и закрыть соединения пула (они привязаны к циклу)"""
+
+    async def main():
+        try:
+            return await coro
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def db():
+    """Схема БД до последней ревизии и пустые таблицы обращений"""
+
+    async def prepare():
+        await init_db()
+        async with async_session() as session:
+            await session.execute(delete(TicketMessage))
+            await session.execute(delete(Ticket))
+            await session.commit()
+
+    run(prepare())
@@ -0,0 +1,116 @@
+"""
+OutboundScheduler: приоритет полос, независимость чатов и отмена ожидающих
+"""
+import asyncio
+import time
+
+from utils.outbound import BROADCAST, NOTIFICATION, SUPPORT, OutboundScheduler, current_lane, outbound_lane
+
+
+async def drain_global(scheduler: OutboundScheduler):
+    """Израсходовать общий запас токенов отправками в разные чаты"""
+    for index in range(int(scheduler.global_rate)):
+        await scheduler.acquire(100_000 + index)
+
+
+async def send(scheduler: OutboundScheduler, chat_id: int, lane: int, order: list):
+    await scheduler.acquire(chat_id, lane=lane)
+    order.append(lane)
+
+
+def test_free_tokens_grant_immediately():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=30)
+        started = time.monotonic()
+        await scheduler.acquire(1)
+        await scheduler.acquire(2)
+        assert time.monotonic() - started < 0.05
+        assert scheduler._task is None
+
+    asyncio.run(scenario())
+
+
+def test_higher_lanes_served_first():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=20, chat_rate=100, chat_burst=100)
+        await drain_global(scheduler)
+
+        order = []
+        # Встают в очередь от младшей полосы к старшей
+        await asyncio.gather(
+            send(scheduler, 1, BROADCAST, order),
+            send(scheduler, 2, NOTIFICATION, order),
+            send(scheduler, 3, SUPPORT, order),
+        )
+        assert order == [SUPPORT, NOTIFICATION, BROADCAST]
+
+    asyncio.run(scenario())
+
+
+def test_blocked_chat_does_not_hold_other_chats():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=100, chat_rate=10, chat_burst=1)
+        await scheduler.acquire(1)
+
+        order = []
+        # Чат 1 ждет свой лимит, рассылка в чат 2 уходит раньше ответа поддержки
+        await asyncio.gather(
+            send(scheduler, 1, SUPPORT, order),
+            send(scheduler, 2, BROADCAST, order),
+        )
+        assert order == [BROADCAST, SUPPORT]
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=10, chat_rate=100, chat_burst=100)
+        await drain_global(scheduler)
+
+        order = []
+        cancelled = asyncio.create_task(send(scheduler, 1, SUPPORT, order))
+        waiting = asyncio.create_task(send(scheduler, 2, BROADCAST, order))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth()[("support",)] == 1
+
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, 1)
+
+        assert order == [BROADCAST]
+        assert cancelled.cancelled()
+        assert sum(scheduler.queue_depth().values()) == 0
+
+    asyncio.run(scenario())
+
+
+def test_penalized_chat_waits_retry_after():
+    async def scenario():
+        scheduler = OutboundScheduler(global_rate=100, chat_rate=10, chat_burst=3)
+        scheduler.penalize(1, 0.2, lane=SUPPORT)
+
+        started = time.monotonic()
+        await scheduler.acquire(1)
+        assert time.monotonic() - started >= 0.25
+        # Другие чаты штраф не затрагивает
+        started = time.monotonic()
+        await scheduler.acquire(2)
+        assert time.monotonic() - started < 0.05
+
+    asyncio.run(scenario())
+
+
+def test_lane_from_context():
+    async def scenario():
+        assert current_lane() == SUPPORT
+        with outbound_lane(NOTIFICATION):
+            assert current_lane() == NOTIFICATION
+
+        @outbound_lane(BROADCAST)
+        async def deliver():
+            return current_lane()
+
+        assert await deliver() == BROADCAST
+        assert current_lane() == SUPPORT
+
+    asyncio.run(scenario())
@@ -0,0 +1,147 @@
+"""
+MemoryRateLimiter: окно последних действий и пакетная запись журнала rate_limits
+"""
+import pytest
+from sqlalchemy import func, select
+
+import utils.security
+from conftest import run
+from database import RateLimit, async_session
+from utils.security import (
+    HOUR_LIMIT_MESSAGE,
+    MINUTE_LIMIT_MESSAGE,
+    MemoryRateLimiter,
+    rate_limit_audit_dropped_total,
+)
+
+
+class Clock:
+    """Подменяемое time.monotonic"""
+
+    def __init__(self):
+        self.now = 10_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utils.security.time, "monotonic", clock)
+    return clock
+
+
+async def count_rows() -> int:
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).select_from(RateLimit))).scalar()
+
+
+def test_minute_window_slides(clock):
+    async def scenario():
+        limiter = MemoryRateLimiter(max_per_minute=3, max_per_hour=30)
+        for _ in range(3):
+            assert await limiter.check_limit(None, 1) == (True, None)
+            clock.now += 1
+
+        assert await limiter.check_limit(None, 1) == (False, MINUTE_LIMIT_MESSAGE)
+        # Другие пользователи и типы действий считаются отдельно
+        assert await limiter.check_limit(None, 2) == (True, None)
+        assert await limiter.check_limit(None, 1, "command") == (True, None)
+
+        # Первое действие вышло из окна - одно место освободилось
+        clock.now += 57
+        assert await limiter.check_limit(None, 1) == (True, None)
+        assert await limiter.check_limit(None, 1) == (False, MINUTE_LIMIT_MESSAGE)
+
+    run(scenario())
+
+
+def test_hour_limit_over_ring_buffer(clock):
+    async def scenario():
+        limiter = MemoryRateLimiter(max_per_minute=2, max_per_hour=4)
+        for _ in range(4):
+            assert await limiter.check_limit(None, 1) == (True, None)
+            clock.now += 61
+
+        assert await limiter.check_limit(None, 1) == (False, HOUR_LIMIT_MESSAGE)
+        # Отказы не записываются в окно и журнал
+        assert len(limiter._pending) == 4
+
+        clock.now += 3600
+        assert await limiter.check_limit(None, 1) == (True, None)
+
+    run(scenario())
+
+
+def test_flush_writes_pending_rows(db):
+    async def scenario():
+        limiter = MemoryRateLimiter()
+        before = await count_rows()
+        await limiter.check_limit(None, 1)
+        await limiter.check_limit(None, 2)
+        await limiter.flush()
+
+        assert len(limiter._pending) == 0
+        assert await count_rows() == before + 2
+
+    run(scenario())
+
+
+def test_failed_flush_keeps_batch_and_new_rows_in_order(db, monkeypatch):
+    async def scenario():
+        limiter = MemoryRateLimiter()
+        await limiter.check_limit(None, 1)
+        await limiter.check_limit(None, 2)
+
+        class BrokenSession:
+            """Пока идет вставка, приходит новое сообщение; затем БД падает"""
+
+            async def __aenter__(self):
+                await limiter.check_limit(None, 3)
+                raise ConnectionError("БД недоступна")
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        monkeypatch.setattr(utils.security, "async_session", BrokenSession)
+        with pytest.raises(ConnectionError):
+            await limiter.flush()
+
+        assert [row[0] for row in limiter._pending] == [1, 2, 3]
+
+        monkeypatch.setattr(utils.security, "async_session", async_session)
+        before = await count_rows()
+        await limiter.flush()
+        assert await count_rows() == before + 3
+
+    run(scenario())
+
+
+def test_overflow_drops_oldest_and_counts(db, monkeypatch):
+    async def scenario():
+        limiter = MemoryRateLimiter(max_pending=3)
+        dropped = rate_limit_audit_dropped_total.value()
+        for user_id in range(1, 6):
+            await limiter.check_limit(None, user_id)
+
+        assert [row[0] for row in limiter._pending] == [3, 4, 5]
+        assert rate_limit_audit_dropped_total.value() == dropped + 2
+
+        # При возврате неудачной пачки лимит тоже соблюдается
+        class BrokenSession:
+            async def __aenter__(self):
+                await limiter.check_limit(None, 6)
+                raise ConnectionError("БД недоступна")
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        monkeypatch.setattr(utils.security, "async_session", BrokenSession)
+        with pytest.raises(ConnectionError):
+            await limiter.flush()
+
+        assert [row[0] for row in limiter._pending] == [4, 5, 6]
+        assert rate_limit_audit_dropped_total.value() == dropped + 3
+
+    run(scenario())
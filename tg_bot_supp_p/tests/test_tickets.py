@@ -0,0 +1,169 @@
+"""
+TicketStore: пакетная запись, повтор после ошибки и приоритет незаписанных изменений
+"""
+import pytest
+from sqlalchemy import func, select
+
+import utils.tickets
+from conftest import run
+from database import Ticket, TicketMessage, async_session
+from utils.tickets import TICKET_ANSWERED, TICKET_IGNORED, TICKET_OPEN, TicketStore
+
+ADMIN_CHAT = 10
+
+
+async def count_rows(model) -> int:
+    async with async_session() as session:
+        return (await session.execute(select(func.count()).select_from(model))).scalar()
+
+
+async def ticket_status(admin_message_id: int) -> str:
+    async with async_session() as session:
+        return (await session.execute(
+            select(Ticket.status).where(
+                Ticket.admin_chat_id == ADMIN_CHAT,
+                Ticket.admin_message_id == admin_message_id
+            )
+        )).scalar_one()
+
+
+def broken_session(on_call=None):
+    """Фабрика сессий, которая падает (и перед этим вызывает on_call)"""
+
+    def factory():
+        if on_call is not None:
+            on_call()
+        raise ConnectionError("БД недоступна")
+
+    return factory
+
+
+def test_flush_writes_tickets_and_messages(db):
+    async def scenario():
+        store = TicketStore(cache_size=100, flush_interval=1)
+        store.open(101, ADMIN_CHAT, 200, message_ids=[198, 199])
+        second = store.open(102, ADMIN_CHAT, 300)
+        await store.flush()
+
+        assert len(store) == 0
+        assert await count_rows(Ticket) == 2
+        assert await count_rows(TicketMessage) == 4
+
+        store.close(second, TICKET_ANSWERED)
+        await store.flush()
+        assert await ticket_status(300) == TICKET_ANSWERED
+
+        # Другой процесс находит обращение по любому его сообщению
+        fresh = TicketStore(cache_size=100, flush_interval=1)
+        ticket = await fresh.by_admin_message(ADMIN_CHAT, 198)
+        assert ticket.user_id == 101
+        assert ticket.persisted
+
+    run(scenario())
+
+
+def test_failed_flush_requeues_and_retries(db, monkeypatch):
+    async def scenario():
+        store = TicketStore(cache_size=100, flush_interval=1)
+        ticket = store.open(101, ADMIN_CHAT, 200)
+
+        monkeypatch.setattr(utils.tickets, "async_session", broken_session())
+        with pytest.raises(ConnectionError):
+            await store.flush()
+
+        assert len(store) == 1
+        assert not ticket.persisted
+        assert ticket.flush_failures == 1
+
+        monkeypatch.setattr(utils.tickets, "async_session", async_session)
+        await store.flush()
+
+        assert len(store) == 0
+        assert ticket.persisted
+        assert ticket.flush_failures == 0
+        assert await count_rows(Ticket) == 1
+
+    run(scenario())
+
+
+def test_changes_during_failed_flush_take_precedence(db, monkeypatch):
+    async def scenario():
+        store = TicketStore(cache_size=100, flush_interval=1)
+        ticket = store.open(101, ADMIN_CHAT, 200)
+
+        # Пока идет запись, администратор закрывает обращение
+        monkeypatch.setattr(
+            utils.tickets, "async_session", broken_session(lambda: store.close(ticket, TICKET_IGNORED))
+        )
+        with pytest.raises(ConnectionError):
+            await store.flush()
+
+        monkeypatch.setattr(utils.tickets, "async_session", async_session)
+        await store.flush()
+
+        assert await ticket_status(200) == TICKET_IGNORED
+
+    run(scenario())
+
+
+def test_ticket_dropped_after_max_attempts(db, monkeypatch):
+    async def scenario():
+        store = TicketStore(cache_size=100, flush_interval=1, max_attempts=2)
+        store.open(101, ADMIN_CHAT, 200)
+
+        monkeypatch.setattr(utils.tickets, "async_session", broken_session())
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await store.flush()
+
+        assert len(store) == 0
+
+    run(scenario())
+
+
+def test_integrity_error_drops_only_conflicting_ticket(db):
+    async def scenario():
+        first = TicketStore(cache_size=100, flush_interval=1)
+        first.open(101, ADMIN_CHAT, 200)
+        await first.flush()
+
+        store = TicketStore(cache_size=100, flush_interval=1)
+        store.open(102, ADMIN_CHAT, 200)
+        store.open(103, ADMIN_CHAT, 300)
+        await store.flush()
+
+        assert len(store) == 0
+        assert await count_rows(Ticket) == 2
+        assert (await TicketStore(100, 1).by_admin_message(ADMIN_CHAT, 200)).user_id == 101
+
+    run(scenario())
+
+
+def test_unflushed_ticket_found_after_lru_eviction(db):
+    async def scenario():
+        store = TicketStore(cache_size=2, flush_interval=1)
+        store.open(101, ADMIN_CHAT, 200, message_ids=[198, 199])
+        store.open(102, ADMIN_CHAT, 300)
+
+        assert (ADMIN_CHAT, 198) not in store._cache
+        assert (await store.by_admin_message(ADMIN_CHAT, 198)).user_id == 101
+        assert await store.by_admin_message(ADMIN_CHAT, 999) is None
+
+    run(scenario())
+
+
+def test_unflushed_status_overrides_database(db):
+    async def scenario():
+        store = TicketStore(cache_size=100, flush_interval=1)
+        ticket = store.open(101, ADMIN_CHAT, 200)
+        await store.flush()
+
+        # Закрытие еще не записано: в БД обращение открыто, но обработчики видят закрытым
+        store.close(ticket, TICKET_ANSWERED)
+        assert await ticket_status(200) == TICKET_OPEN
+        assert await store.open_for_user(101) == []
+
+        await store.refresh_open_counts()
+        assert store.open_count(ADMIN_CHAT) == 0
+
+    run(scenario())
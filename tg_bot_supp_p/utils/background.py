@@ -0,0 +1,85 @@
+"""
+Фоновые задачи бота
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """Реестр фоновых задач, которые останавливаются вместе с ботом"""
+
+    def __init__(self):
+        self._tasks: set[asyncio.Task] = set()
+
+    def spawn(self, coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+        """
+        Запустить корутину в фоне
+
+        Args:
+            coro: Корутина
+            name: Имя задачи для логов
+
+        Returns:
+            Созданная задача
+        """
+        task = asyncio.create_task(coro, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def every(
+            self,
+            interval: float,
+            func: Callable[[], Awaitable],
+            name: str,
+            run_on_stop: bool = False
+    ) -> asyncio.Task:
+        """
+        Периодически вызывать func
+
+        Args:
+            interval: Пауза между вызовами в секундах
+            func: Асинхронная функция без аргументов
+            name: Имя задачи для логов
+            run_on_stop: Выполнить func еще раз при остановке
+
+        Returns:
+            Созданная задача
+        """
+        return self.spawn(self._periodic(interval, func, name, run_on_stop), name=name)
+
+    async def stop(self, timeout: float = 10):
+        """Отменить все задачи и дождаться их завершения"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    async def _periodic(self, interval, func, name, run_on_stop):
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await func()
+                except Exception as e:
+                    logger.exception(f"Ошибка фоновой задачи {name}: {e}")
+        except asyncio.CancelledError:
+            if run_on_stop:
+                try:
+                    await func()
+                except Exception as e:
+                    logger.exception(f"Ошибка фоновой задачи {name} при остановке: {e}")
+            raise
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Фоновая задача {task.get_name()} упала: {task.exception()!r}")
+
+
+background = BackgroundTasks()
@@ -0,0 +1,572 @@
+"""
+Движок рассылок
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNotFound,
+    TelegramNetworkError,
+    TelegramServerError,
+)
+from aiogram.types import Message, InputMediaPhoto, InputMediaVideo, InputMediaDocument
+from sqlalchemy import select, insert, update, and_
+
+from config import settings
+from database import User, BlockedUser, BroadcastJob, BroadcastDelivery, async_session
+from utils.background import background
+from utils.outbound import BROADCAST, NOTIFICATION, outbound_lane
+from utils.state_store import state_backend
+
+logger = logging.getLogger(__name__)
+
+# Итог доставки одному получателю
+DELIVERED = "delivered"
+PERMANENT = "permanent"  # бот заблокирован, чат не найден - повторять бессмысленно
+TRANSIENT = "transient"  # сеть/сервер Telegram - попытки исчерпаны
+
+# Статусы задания рассылки
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+
+# Сколько раз подряд подчиняемся RetryAfter для одного получателя
+MAX_FLOOD_WAITS = 5
+
+# Аренда задания в Redis (мс): продлевается, пока задание выполняется
+JOB_LEASE_TTL_MS = 60000
+
+# Продлить / снять аренду, только если она все еще наша
+RENEW_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+MEDIA_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+}
+
+
+@dataclass
+class BroadcastResult:
+    """Итоги рассылки"""
+    delivered: int = 0
+    permanent: int = 0
+    transient: int = 0
+
+    @property
+    def failed(self) -> int:
+        return self.permanent + self.transient
+
+    def add(self, outcome: str):
+        """Учесть итог доставки одному получателю"""
+        setattr(self, outcome, getattr(self, outcome) + 1)
+
+
+def build_broadcast_payload(message: Message, media_group: Optional[list[Message]] = None) -> Optional[dict]:
+    """
+    Описать сообщение рассылки словарем (только file_id и тексты)
+
+    Args:
+        message: Сообщение администратора
+        media_group: Сообщения альбома, если рассылается альбом
+
+    Returns:
+        Словарь для send_broadcast_payload или None, если тип не поддерживается
+    """
+    if media_group and len(media_group) > 1:
+        items = []
+        for idx, msg in enumerate(media_group):
+            caption = msg.caption if idx == 0 else None
+            if msg.photo:
+                items.append({"type": "photo", "file_id": msg.photo[-1].file_id, "caption": caption})
+            elif msg.video:
+                items.append({"type": "video", "file_id": msg.video.file_id, "caption": caption})
+            elif msg.document:
+                items.append({"type": "document", "file_id": msg.document.file_id, "caption": caption})
+        return {"kind": "media_group", "items": items} if items else None
+
+    if message.text:
+        return {"kind": "text", "text": message.text}
+    if message.photo:
+        return {"kind": "photo", "file_id": message.photo[-1].file_id, "caption": message.caption}
+    if message.video:
+        return {"kind": "video", "file_id": message.video.file_id, "caption": message.caption}
+
+    return None
+
+
+def payload_cost(payload: dict) -> int:
+    """Сколько сообщений Telegram засчитает за одну доставку"""
+    if payload["kind"] == "media_group":
+        return len(payload["items"])
+    return 1
+
+
+async def send_broadcast_payload(bot: Bot, chat_id: int, payload: dict):
+    """Отправить сообщение рассылки одному получателю"""
+    kind = payload["kind"]
+
+    if kind == "text":
+        await bot.send_message(chat_id, payload["text"])
+    elif kind == "photo":
+        await bot.send_photo(chat_id, payload["file_id"], caption=payload["caption"])
+    elif kind == "video":
+        await bot.send_video(chat_id, payload["file_id"], caption=payload["caption"])
+    elif kind == "media_group":
+        media = [
+            MEDIA_TYPES[item["type"]](media=item["file_id"], caption=item["caption"])
+            for item in payload["items"]
+        ]
+        await bot.send_media_group(chat_id, media=media)
+    else:
+        raise ValueError(f"Неизвестный тип рассылки: {kind}")
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        """Дождаться и забрать токены (ожидающие обслуживаются по очереди)"""
+        tokens = min(tokens, self.capacity)
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class BroadcastEngine:
+    """Параллельная рассылка с общим ограничением скорости"""
+
+    def __init__(
+            self,
+            bot: Bot,
+            rate: float = 25,
+            concurrency: int = 20,
+            max_retries: int = 3
+    ):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate)
+        # Момент, до которого все отправки стоят после RetryAfter
+        self._paused_until = 0.0
+
+    async def run(
+            self,
+            recipients: Union[Iterable[int], AsyncIterable[int]],
+            payload: dict,
+            on_result: Optional[Callable[[int, str], None]] = None,
+            stopped: Optional[Callable[[], bool]] = None
+    ) -> BroadcastResult:
+        """
+        Разослать payload всем получателям
+
+        Args:
+            recipients: ID получателей (список или асинхронный итератор)
+            payload: Сообщение из build_broadcast_payload
+            on_result: Вызывается с (ID получателя, итог) после каждой доставки
+            stopped: Проверяется перед каждой отправкой; True - оставшимся не отправлять
+
+        Returns:
+            Итоги рассылки
+        """
+        result = BroadcastResult()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        def is_stopped() -> bool:
+            return stopped is not None and stopped()
+
+        async def produce():
+            if hasattr(recipients, "__aiter__"):
+                async for chat_id in recipients:
+                    if is_stopped():
+                        break
+                    await queue.put(chat_id)
+            else:
+                for chat_id in recipients:
+                    if is_stopped():
+                        break
+                    await queue.put(chat_id)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while (chat_id := await queue.get()) is not None:
+                if is_stopped():
+                    # Дочитываем очередь до конца без отправки
+                    continue
+                outcome = await self.deliver(chat_id, payload)
+                result.add(outcome)
+                if on_result is not None:
+                    on_result(chat_id, outcome)
+
+        workers = [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        try:
+            await produce()
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        return result
+
+    @outbound_lane(BROADCAST)
+    async def deliver(self, chat_id: int, payload: dict) -> str:
+        """
+        Доставить payload одному получателю с повторами
+
+        Returns:
+            DELIVERED, PERMANENT или TRANSIENT
+        """
+        cost = payload_cost(payload)
+        attempt = 0
+        flood_waits = 0
+
+        while True:
+            await self._wait_pause()
+            await self._bucket.acquire(cost)
+            await self._wait_pause()
+
+            try:
+                await send_broadcast_payload(self.bot, chat_id, payload)
+                return DELIVERED
+            except TelegramRetryAfter as e:
+                # Лимит общий для бота - останавливаем всех воркеров
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Рассылка: flood control, пауза {e.retry_after} с")
+                flood_waits += 1
+                if flood_waits > MAX_FLOOD_WAITS:
+                    return TRANSIENT
+            except (TelegramForbiddenError, TelegramNotFound, TelegramBadRequest) as e:
+                logger.debug(f"Рассылка: {chat_id} недоступен: {e}")
+                return PERMANENT
+            except (TelegramNetworkError, TelegramServerError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    logger.warning(f"Рассылка: {chat_id} не доставлено после {attempt} попыток: {e}")
+                    return TRANSIENT
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                logger.error(f"Рассылка: ошибка отправки {chat_id}: {e}")
+                return PERMANENT
+
+    async def _wait_pause(self):
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+async def iter_broadcast_audience(
+        job_id: int,
+        after_user_id: int = 0,
+        chunk_size: int = 500
+) -> AsyncIterator[list[tuple[int, int]]]:
+    """
+    Получатели задания порциями (users.id, telegram_id)
+
+    Каждая порция - один запрос users LEFT JOIN blocked_users LEFT JOIN
+    broadcast_deliveries с курсором по users.id, поэтому память не зависит
+    от числа пользователей, соединение не держится всю рассылку, а уже
+    получившие сообщение пропускаются при возобновлении.
+    """
+    while True:
+        query = (
+            select(User.id, User.telegram_id)
+            .outerjoin(BlockedUser, BlockedUser.telegram_id == User.telegram_id)
+            .outerjoin(BroadcastDelivery, and_(
+                BroadcastDelivery.job_id == job_id,
+                BroadcastDelivery.telegram_id == User.telegram_id
+            ))
+            .where(
+                User.id > after_user_id,
+                BlockedUser.id.is_(None),
+                BroadcastDelivery.id.is_(None)
+            )
+            .order_by(User.id)
+            .limit(chunk_size)
+        )
+
+        async with async_session() as session:
+            rows = [tuple(row) for row in (await session.execute(query)).all()]
+
+        if not rows:
+            return
+
+        yield rows
+        after_user_id = rows[-1][0]
+
+
+class BroadcastProgress:
+    """Прогресс рассылки в сообщении администратора (не чаще interval)"""
+
+    def __init__(self, bot: Bot, chat_id: Optional[int], message_id: Optional[int], interval: float = 5):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self._last_edit = 0.0
+
+    @outbound_lane(NOTIFICATION)
+    async def update(self, delivered: int, failed: int, finished: bool = False):
+        """Обновить сообщение, если с прошлого раза прошло достаточно времени"""
+        if not self.chat_id or not self.message_id:
+            return
+        if not finished and time.monotonic() - self._last_edit < self.interval:
+            return
+
+        title = "✅ Рассылка завершена!" if finished else "📤 Идет рассылка..."
+        try:
+            await self.bot.edit_message_text(
+                f"{title}\n\n"
+                f"Отправлено: {delivered}\n"
+                f"Не доставлено: {failed}",
+                chat_id=self.chat_id,
+                message_id=self.message_id
+            )
+        except TelegramAPIError as e:
+            logger.debug(f"Рассылка: не удалось обновить прогресс: {e}")
+        self._last_edit = time.monotonic()
+
+
+# Один движок на бота: параллельные задания делят лимит скорости и паузы
+_engines: dict[int, BroadcastEngine] = {}
+
+
+def get_broadcast_engine(bot: Bot) -> BroadcastEngine:
+    """Движок рассылок бота с настройками из settings"""
+    engine = _engines.get(bot.id)
+    if engine is None:
+        engine = _engines[bot.id] = BroadcastEngine(
+            bot,
+            rate=settings.BROADCAST_RATE,
+            concurrency=settings.BROADCAST_CONCURRENCY,
+            max_retries=settings.BROADCAST_MAX_RETRIES
+        )
+    return engine
+
+
+async def _checkpoint(job_id: int, outcomes: dict[int, str], last_user_id: Optional[int]):
+    """Записать итоги порции пакетом и сдвинуть курсор задания"""
+    delivered = sum(1 for outcome in outcomes.values() if outcome == DELIVERED)
+    values = {
+        "delivered": BroadcastJob.delivered + delivered,
+        "failed": BroadcastJob.failed + len(outcomes) - delivered,
+    }
+    if last_user_id is not None:
+        values["last_user_id"] = last_user_id
+
+    async with async_session() as session:
+        if outcomes:
+            await session.execute(insert(BroadcastDelivery), [
+                {"job_id": job_id, "telegram_id": telegram_id, "status": outcome}
+                for telegram_id, outcome in outcomes.items()
+            ])
+        await session.execute(update(BroadcastJob).where(BroadcastJob.id == job_id).values(**values))
+        await session.commit()
+
+
+async def run_broadcast_job(bot: Bot, job_id: int):
+    """
+    Выполнить (или продолжить) задание рассылки
+
+    После каждой порции получателей журнал доставки и курсор сохраняются
+    одной транзакцией. При остановке бота сохраняется и незаконченная
+    порция, поэтому после перезапуска повторно никто не получит сообщение.
+    """
+    async with async_session() as session:
+        job = await session.get(BroadcastJob, job_id)
+
+    if job is None or job.status != JOB_RUNNING:
+        return
+
+    async with _job_lease(job.id) as lease:
+        if lease is None:
+            logger.info(f"Рассылку #{job.id} выполняет другой экземпляр бота")
+            return
+
+        await _run_job(bot, job, lease)
+
+
+class _JobLease:
+    """Аренда задания; lost - продлить не удалось, задание нужно остановить"""
+
+    def __init__(self):
+        self.lost = False
+
+
+@asynccontextmanager
+async def _job_lease(job_id: int):
+    """
+    Аренда задания: при общем Redis задание выполняет только один экземпляр бота
+
+    Без Redis бот работает в одном экземпляре, и аренда всегда успешна.
+    Возвращает None, если задание арендовано другим экземпляром.
+    """
+    lease = _JobLease()
+    if state_backend() != "redis":
+        yield lease
+        return
+
+    from utils.redis_client import get_redis
+    redis = get_redis()
+    key = f"broadcast_job_lease:{job_id}"
+    owner = uuid.uuid4().hex
+
+    if not await redis.set(key, owner, nx=True, px=JOB_LEASE_TTL_MS):
+        yield None
+        return
+
+    async def renew():
+        interval = JOB_LEASE_TTL_MS / 3000
+        expires = time.monotonic() + JOB_LEASE_TTL_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await redis.eval(RENEW_LEASE_SCRIPT, 1, key, owner, JOB_LEASE_TTL_MS)
+            except Exception as e:
+                # Пробуем снова, пока аренда гарантированно наша
+                if time.monotonic() + interval < expires:
+                    logger.warning(f"Не удалось продлить аренду рассылки #{job_id}: {e}")
+                    continue
+                logger.error(f"Аренда рассылки #{job_id} не продлена ({e}), рассылка остановлена")
+                lease.lost = True
+                return
+
+            if not renewed:
+                logger.error(f"Аренда рассылки #{job_id} потеряна, рассылка остановлена")
+                lease.lost = True
+                return
+            expires = time.monotonic() + JOB_LEASE_TTL_MS / 1000
+
+    renewer = asyncio.create_task(renew())
+    try:
+        yield lease
+    finally:
+        renewer.cancel()
+        try:
+            await redis.eval(RELEASE_LEASE_SCRIPT, 1, key, owner)
+        except Exception as e:
+            logger.warning(f"Не удалось снять аренду рассылки #{job_id}: {e}")
+
+
+async def _run_job(bot: Bot, job: BroadcastJob, lease: _JobLease):
+    """Разослать задание оставшимся получателям (пока аренда не потеряна)"""
+    engine = get_broadcast_engine(bot)
+    progress = BroadcastProgress(
+        bot, job.status_chat_id, job.status_message_id, settings.BROADCAST_PROGRESS_INTERVAL
+    )
+    delivered, failed = job.delivered, job.failed
+    started = time.monotonic()
+
+    async for chunk in iter_broadcast_audience(job.id, job.last_user_id, settings.BROADCAST_CHUNK_SIZE):
+        outcomes: dict[int, str] = {}
+        try:
+            await engine.run(
+                (telegram_id for _, telegram_id in chunk),
+                job.payload,
+                on_result=outcomes.__setitem__,
+                stopped=lambda: lease.lost
+            )
+        finally:
+            completed = len(outcomes) == len(chunk)
+            await asyncio.shield(_checkpoint(job.id, outcomes, chunk[-1][0] if completed else None))
+
+        chunk_delivered = sum(1 for outcome in outcomes.values() if outcome == DELIVERED)
+        delivered += chunk_delivered
+        failed += len(outcomes) - chunk_delivered
+        await progress.update(delivered, failed)
+
+        if lease.lost:
+            # Продолжит экземпляр, получивший аренду, или этот после перезапуска
+            return
+
+    async with async_session() as session:
+        await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job.id)
+            .values(status=JOB_COMPLETED, finished_at=datetime.utcnow())
+        )
+        await session.commit()
+
+    await progress.update(delivered, failed, finished=True)
+    logger.info(
+        f"Рассылка #{job.id} завершена за {time.monotonic() - started:.1f} с: "
+        f"доставлено {delivered}, не доставлено {failed}"
+    )
+
+
+async def start_broadcast(bot: Bot, payload: dict, created_by: int, status_message: Message) -> int:
+    """
+    Создать задание рассылки и запустить его в фоне
+
+    Args:
+        bot: Бот
+        payload: Сообщение из build_broadcast_payload
+        created_by: ID администратора
+        status_message: Сообщение, в котором показывается прогресс
+
+    Returns:
+        ID задания
+    """
+    async with async_session() as session:
+        job = BroadcastJob(
+            created_by=created_by,
+            payload=payload,
+            status=JOB_RUNNING,
+            status_chat_id=status_message.chat.id,
+            status_message_id=status_message.message_id
+        )
+        session.add(job)
+        await session.commit()
+
+    background.spawn(run_broadcast_job(bot, job.id), name=f"broadcast_job_{job.id}")
+    return job.id
+
+
+async def resume_broadcast_jobs(bot: Bot):
+    """Продолжить задания, прерванные остановкой бота"""
+    async with async_session() as session:
+        result = await session.execute(
+            select(BroadcastJob.id).where(BroadcastJob.status == JOB_RUNNING)
+        )
+        job_ids = result.scalars().all()
+
+    for job_id in job_ids:
+        logger.info(f"Возобновляю рассылку #{job_id}")
+        background.spawn(run_broadcast_job(bot, job_id), name=f"broadcast_job_{job_id}")
@@ -0,0 +1,229 @@
+"""
+Движок БД: пул соединений, профиль SQLite и метрики
+"""
+import asyncio
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.util import await_only
+
+from config import settings
+from utils.metrics import Counter, Gauge, Histogram
+
+db_pool_checkout_wait_seconds = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание соединения из пула (включая открытие нового)"
+)
+db_pool_checkout_timeouts_total = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Ожидания соединения, прерванные по DB_POOL_TIMEOUT"
+)
+db_pool_size = Gauge("db_pool_size", "Постоянный размер пула соединений")
+db_pool_connections_in_use = Gauge("db_pool_connections_in_use", "Соединения, выданные из пула")
+db_pool_overflow = Gauge("db_pool_overflow", "Соединения сверх DB_POOL_SIZE")
+sqlite_writer_wait_seconds = Histogram(
+    "sqlite_writer_wait_seconds",
+    "Ожидание очереди записи SQLite пишущей транзакцией"
+)
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "Длительность SQL-запросов по типу оператора",
+    ["operation"]
+)
+db_query_errors_total = Counter(
+    "db_query_errors_total",
+    "SQL-запросы, завершившиеся ошибкой",
+    ["operation"]
+)
+
+# Типы операторов в метках db_query_* (остальные - OTHER)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA"}
+
+# Операторы, с которых SQLite начинает пишущую транзакцию
+SQLITE_WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул, замеряющий время получения соединения
+
+    Рост db_pool_checkout_wait_seconds означает, что обработчики
+    простаивают в очереди за соединением.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_pool_checkout_timeouts_total.inc()
+            raise
+        finally:
+            db_pool_checkout_wait_seconds.observe(time.perf_counter() - started)
+
+
+class SQLiteWriterQueue:
+    """
+    Очередь записи SQLite
+
+    SQLite допускает одного писателя на файл. Без очереди параллельные
+    транзакции ждут блокировку в потоках aiosqlite, опрашивая файл, и при
+    долгом ожидании получают "database is locked". Здесь пишущая транзакция
+    сначала занимает asyncio.Lock (по очереди, без опроса) и держит его до
+    COMMIT/ROLLBACK; чтения идут параллельно, WAL им не мешает.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+
+    def install(self, engine: AsyncEngine):
+        """Подключить очередь к событиям движка"""
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(sync_engine, "commit", self._release_connection)
+        event.listen(sync_engine, "rollback", self._release_connection)
+        # Соединение вернули в пул без COMMIT/ROLLBACK через Connection
+        event.listen(sync_engine.pool, "checkin", self._release_record)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get("sqlite_writer") or not statement.lstrip()[:7].upper().startswith(SQLITE_WRITE_STATEMENTS):
+            return
+
+        # Синхронное событие выполняется в greenlet асинхронного движка
+        started = time.perf_counter()
+        try:
+            await_only(asyncio.wait_for(self._lock.acquire(), self.timeout))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Очередь записи SQLite: нет доступа за {self.timeout} с")
+        finally:
+            sqlite_writer_wait_seconds.observe(time.perf_counter() - started)
+        conn.info["sqlite_writer"] = True
+
+    def _release_connection(self, conn):
+        self._release(conn.info)
+
+    def _release_record(self, dbapi_connection, connection_record):
+        self._release(connection_record.info)
+
+    def _release(self, info: dict):
+        if info.pop("sqlite_writer", False):
+            self._lock.release()
+
+
+def _configure_sqlite(engine: AsyncEngine):
+    """PRAGMA для каждого нового соединения и очередь записи"""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL: чтения не блокируются записью; NORMAL: fsync только при контрольной точке
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+        # Отрицательное значение - размер в КиБ
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.close()
+
+    SQLiteWriterQueue(settings.SQLITE_BUSY_TIMEOUT).install(engine)
+
+
+def async_database_url(database_url: str) -> str:
+    """URL БД с асинхронным драйвером (postgresql:// -> asyncpg, sqlite:// -> aiosqlite)"""
+    url = make_url(database_url)
+    if url.drivername in ("postgresql", "postgres"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.render_as_string(hide_password=False)
+
+
+def create_db_engine(database_url: str) -> AsyncEngine:
+    """
+    Создать движок БД с настройками пула из Settings
+
+    Файловая SQLite получает профиль для конкурентной работы (WAL, PRAGMA,
+    очередь записи); SQLite в памяти остается на пуле SQLAlchemy по умолчанию.
+
+    Args:
+        database_url: URL БД
+
+    Returns:
+        Асинхронный движок
+    """
+    url = make_url(async_database_url(database_url))
+    is_sqlite = url.get_backend_name() == "sqlite"
+
+    if is_sqlite and url.database in (None, "", ":memory:"):
+        engine = create_async_engine(url, echo=False)
+        _register_pool_metrics(engine)
+        _register_query_metrics(engine)
+        return engine
+
+    if url.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in url.query:
+        # Кэш подготовленных выражений на соединение (0 - для pgbouncer в режиме transaction)
+        url = url.update_query_dict({
+            "prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)
+        })
+
+    engine = create_async_engine(
+        url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        # Локальному файлу проверка соединения не нужна
+        pool_pre_ping=settings.DB_POOL_PRE_PING and not is_sqlite
+    )
+    if is_sqlite:
+        _configure_sqlite(engine)
+
+    _register_pool_metrics(engine)
+    # После очереди записи SQLite: ее ожидание не входит во время запроса
+    _register_query_metrics(engine)
+    return engine
+
+
+def _register_pool_metrics(engine: AsyncEngine):
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+
+    db_pool_size.set_function(pool.size)
+    db_pool_connections_in_use.set_function(pool.checkedout)
+    # overflow() отрицателен, пока пул не заполнен до pool_size
+    db_pool_overflow.set_function(lambda: max(pool.overflow(), 0))
+
+
+def _statement_operation(statement: str) -> str:
+    """Тип оператора для меток: SELECT, INSERT, ... (ограниченный набор значений)"""
+    words = statement.lstrip()[:16].split(None, 1)
+    operation = words[0].upper() if words else ""
+    return operation if operation in SQL_OPERATIONS else "OTHER"
+
+
+def _register_query_metrics(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "query_started", None)
+        if started is not None:
+            db_query_duration_seconds.observe(
+                time.perf_counter() - started,
+                operation=_statement_operation(statement)
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def count_error(exception_context):
+        db_query_errors_total.inc(operation=_statement_operation(exception_context.statement or ""))
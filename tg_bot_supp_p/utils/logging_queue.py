@@ -0,0 +1,85 @@
+"""
+Логирование через очередь: форматирование и вывод вне event loop
+"""
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler для очереди внутри процесса
+
+    Стандартный prepare() форматирует запись до постановки в очередь, то есть
+    в потоке event loop. Здесь запись уходит как есть: сообщение собирается
+    из аргументов уже в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = "INFO", *handlers: logging.Handler) -> QueueListener:
+    """
+    Настроить корневой логгер: записи идут в очередь, выводит фоновый поток
+
+    Args:
+        level: Уровень (DEBUG, INFO, ...); записи ниже него не создаются вовсе
+        handlers: Обработчики вывода, по умолчанию stderr
+
+    Returns:
+        Запущенный QueueListener (останавливается при выходе из процесса)
+    """
+    global _listener
+    if _listener is not None:
+        stop_logging()
+
+    if not handlers:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = (stream,)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(LocalQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    # respect_handler_level: у обработчиков вывода могут быть свои уровни
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def add_log_handler(handler: logging.Handler):
+    """Добавить обработчик вывода (в поток очереди, если она настроена)"""
+    if _listener is None:
+        logging.getLogger().addHandler(handler)
+        return
+    _listener.handlers = _listener.handlers + (handler,)
+
+
+def remove_log_handler(handler: logging.Handler):
+    """Убрать обработчик, добавленный add_log_handler"""
+    if _listener is not None and handler in _listener.handlers:
+        _listener.handlers = tuple(h for h in _listener.handlers if h is not handler)
+    logging.getLogger().removeHandler(handler)
+
+
+def stop_logging():
+    """Вывести оставшиеся записи и остановить фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
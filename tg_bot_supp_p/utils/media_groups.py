@@ -0,0 +1,106 @@
+"""
+Сборка медиа-альбомов
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from aiogram.types import Message
+
+from config import settings
+from utils.background import background
+
+logger = logging.getLogger(__name__)
+
+# Больше 10 элементов Telegram в один альбом не собирает
+MAX_ALBUM_SIZE = 10
+
+
+class _PendingGroup:
+    """Альбом, который еще собирается"""
+
+    __slots__ = ("messages", "context", "started", "timer")
+
+    def __init__(self, context: dict):
+        self.messages: list[Message] = []
+        self.context = context
+        self.started = time.monotonic()
+        self.timer = None
+
+
+class MediaGroupCollector:
+    """
+    Сборщик альбомов по media_group_id
+
+    Каждый новый элемент откладывает отправку на delay секунд; альбом
+    отдается в on_flush целиком одним вызовом, когда элементы перестают
+    приходить, набралось max_size элементов или с первого прошло max_wait.
+    """
+
+    def __init__(
+            self,
+            on_flush: Callable[..., Awaitable],
+            delay: float = 0.3,
+            max_size: int = MAX_ALBUM_SIZE,
+            max_wait: float = 2.0
+    ):
+        self.on_flush = on_flush
+        self.delay = delay
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._groups: dict[str, _PendingGroup] = {}
+
+    def add(self, message: Message, **context):
+        """
+        Добавить элемент альбома
+
+        Args:
+            message: Сообщение с media_group_id
+            **context: Доп. аргументы для on_flush (берутся от первого элемента)
+        """
+        key = message.media_group_id
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _PendingGroup(context)
+
+        group.messages.append(message)
+        if group.timer is not None:
+            group.timer.cancel()
+
+        if len(group.messages) >= self.max_size:
+            self._flush(key)
+            return
+
+        deadline = group.started + self.max_wait - time.monotonic()
+        group.timer = asyncio.get_running_loop().call_later(
+            max(0, min(self.delay, deadline)), self._flush, key
+        )
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def _flush(self, key: str):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+
+        if group.timer is not None:
+            group.timer.cancel()
+        group.messages.sort(key=lambda msg: msg.message_id)
+        background.spawn(self._run(group), name=f"media_group_{key}")
+
+    async def _run(self, group: _PendingGroup):
+        try:
+            await self.on_flush(group.messages, **group.context)
+        except Exception as e:
+            logger.exception(f"Ошибка обработки альбома: {e}")
+
+
+def create_collector(on_flush: Callable[..., Awaitable]) -> MediaGroupCollector:
+    """Сборщик альбомов с настройками из settings"""
+    return MediaGroupCollector(
+        on_flush,
+        delay=settings.MEDIA_GROUP_DELAY,
+        max_wait=settings.MEDIA_GROUP_MAX_WAIT
+    )
@@ -0,0 +1,226 @@
+"""
+Метрики бота в формате Prometheus
+"""
+import bisect
+from typing import Callable, Iterable, Optional
+
+from aiohttp import web
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsRegistry:
+    """Реестр всех метрик процесса"""
+
+    def __init__(self):
+        self._metrics: dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric"):
+        """Зарегистрировать метрику"""
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        """Найти метрику по имени"""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Выгрузить все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class Metric:
+    """Базовый класс метрики с метками"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        if not self.labelnames:
+            self._values[()] = 0
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def value(self, **labels) -> float:
+        """Текущее значение для набора меток"""
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        """Значения метрики: (суффикс имени, метки, значение)"""
+        for key, value in self._values.items():
+            yield "", dict(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Увеличить счетчик"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Текущее значение (размер, число соединений и т.п.)"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable] = None
+
+    def set(self, value: float, **labels):
+        """Установить значение"""
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        """Увеличить значение"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        """Уменьшить значение"""
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable):
+        """
+        Вычислять значение при выгрузке
+
+        Args:
+            function: Без меток возвращает число, с метками - словарь
+                      {кортеж значений меток: число}
+        """
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            yield from super().samples()
+            return
+
+        result = self._function()
+        if not self.labelnames:
+            yield "", {}, result
+            return
+
+        for key, value in result.items():
+            yield "", dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    """Распределение значений (обычно длительностей) по корзинам"""
+
+    type = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        # Для каждого набора меток: [число попаданий в корзины..., сумма, количество]
+        self._series: dict[tuple, list] = {}
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._series[()] = self._new_series()
+        self._values.clear()
+
+    def _new_series(self) -> list:
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, value: float, **labels):
+        """Учесть значение"""
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = self._new_series()
+
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def count(self, **labels) -> int:
+        """Число наблюдений для набора меток"""
+        series = self._series.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def sum(self, **labels) -> float:
+        """Сумма наблюдений для набора меток"""
+        series = self._series.get(self._key(labels))
+        return series[-2] if series else 0.0
+
+    def samples(self):
+        for key, series in list(self._series.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                yield "_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield "_bucket", {**labels, "le": "+Inf"}, series[-1]
+            yield "_sum", labels, series[-2]
+            yield "_count", labels, series[-1]
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запустить HTTP-сервер с /metrics для Prometheus
+
+    Args:
+        host: Адрес (по умолчанию только локальный)
+        port: Порт
+
+    Returns:
+        Runner сервера: остановка через cleanup()
+    """
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
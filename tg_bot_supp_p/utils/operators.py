@@ -0,0 +1,127 @@
+"""
+Операторы поддержки: кому из пула достается новое обращение
+"""
+import itertools
+import logging
+import time
+from typing import Optional
+
+from config import settings
+from utils.metrics import Gauge, Histogram
+from utils.state_store import create_state_store
+from utils.tickets import TicketStore, ticket_store
+
+logger = logging.getLogger(__name__)
+
+# Стратегии распределения
+LEAST_OPEN = "least_open"  # оператору с наименьшим числом открытых обращений
+ROUND_ROBIN = "round_robin"  # по кругу
+
+operator_open_tickets = Gauge(
+    "operator_open_tickets",
+    "Открытые обращения (очередь) оператора",
+    ["operator"]
+)
+operator_present = Gauge(
+    "operator_present",
+    "Оператор в сети (1) по последней активности",
+    ["operator"]
+)
+ticket_assignment_seconds = Histogram(
+    "ticket_assignment_seconds",
+    "От получения вопроса до появления обращения у оператора"
+)
+
+
+class OperatorRouter:
+    """
+    Распределение обращений по операторам
+
+    Оператор в сети, если писал боту или нажимал кнопки в последние
+    presence_timeout секунд (отметки в хранилище состояния: при Redis
+    общие для всех экземпляров). Обращение получает оператор в сети;
+    если в сети никого, выбирают из всех. Без OPERATOR_IDS пул состоит
+    из ADMIN_ID, и бот ведет себя как раньше.
+    """
+
+    def __init__(
+            self,
+            operators: list[int],
+            tickets: TicketStore,
+            strategy: str = LEAST_OPEN,
+            presence_timeout: float = 900
+    ):
+        if strategy not in (LEAST_OPEN, ROUND_ROBIN):
+            raise ValueError(f"Неизвестная стратегия распределения: {strategy}")
+
+        self.operators = list(dict.fromkeys(operators))
+        self.tickets = tickets
+        self.strategy = strategy
+        self._presence = create_state_store("operator_presence", len(self.operators), presence_timeout)
+        self._online: dict[int, bool] = {}
+        self._turn = itertools.count()
+        # Последнее назначение: при равенстве очередей - тот, кто дольше ждал
+        self._last_assigned: dict[int, float] = {}
+
+        operator_open_tickets.set_function(
+            lambda: {(str(operator),): self.tickets.open_count(operator) for operator in self.operators}
+        )
+        operator_present.set_function(
+            lambda: {(str(operator),): int(self._online.get(operator, False)) for operator in self.operators}
+        )
+
+    def is_operator(self, user_id: int) -> bool:
+        """Может ли пользователь отвечать на обращения (операторы и ADMIN_ID)"""
+        return user_id in self.operators or user_id == settings.ADMIN_ID
+
+    def is_pool_member(self, user_id: int) -> bool:
+        """Получает ли пользователь обращения (ADMIN_ID - только если он в OPERATOR_IDS)"""
+        return user_id in self.operators
+
+    async def touch(self, operator_id: int):
+        """Отметить, что оператор в сети (только участники пула)"""
+        # Хранилище рассчитано на len(operators) записей: чужие отметки вытесняли бы операторов
+        if not self.is_pool_member(operator_id):
+            return
+        await self._presence.set(operator_id, time.time())
+        self._online[operator_id] = True
+
+    async def assign(self) -> int:
+        """Выбрать оператора для нового обращения"""
+        if len(self.operators) == 1:
+            return self.operators[0]
+
+        candidates = await self._online_operators() or self.operators
+
+        if self.strategy == ROUND_ROBIN:
+            operator = candidates[next(self._turn) % len(candidates)]
+        else:
+            operator = min(
+                candidates,
+                key=lambda op: (self.tickets.open_count(op), self._last_assigned.get(op, 0.0))
+            )
+
+        self._last_assigned[operator] = time.monotonic()
+        logger.debug("Обращение назначено оператору %s", operator)
+        return operator
+
+    async def _online_operators(self) -> list[int]:
+        online = []
+        for operator in self.operators:
+            self._online[operator] = await self._presence.contains(operator)
+            if self._online[operator]:
+                online.append(operator)
+        return online
+
+
+def create_operator_router(operators: Optional[list[int]] = None) -> OperatorRouter:
+    """Пул операторов из settings (OPERATOR_IDS, по умолчанию - ADMIN_ID)"""
+    return OperatorRouter(
+        operators or settings.OPERATOR_IDS or [settings.ADMIN_ID],
+        ticket_store,
+        strategy=settings.OPERATOR_ROUTING,
+        presence_timeout=settings.OPERATOR_PRESENCE_TIMEOUT
+    )
+
+
+operator_router = create_operator_router()
@@ -0,0 +1,290 @@
+"""
+Планировщик исходящих сообщений: лимиты Telegram и приоритеты отправки
+
+Все отправки бота проходят через один планировщик (middleware сессии бота).
+Он держит общее ведро токенов (лимит бота) и ведро на каждый чат (лимит
+чата), а ожидающих обслуживает по полосам: ответы поддержки раньше
+уведомлений администраторам, уведомления раньше рассылки. Полоса берется
+из контекста вызова (outbound_lane), по умолчанию - ответ поддержки.
+"""
+import asyncio
+import contextvars
+import time
+from collections import deque
+from functools import wraps
+from typing import Optional, Union
+
+from utils.metrics import Counter, Gauge, Histogram
+
+# Полосы по убыванию приоритета
+SUPPORT = 0  # ответы пользователям и администраторам в диалоге
+NOTIFICATION = 1  # вопросы и уведомления администраторам, монитору, отчеты об ошибках
+BROADCAST = 2  # рассылка
+
+LANES = (SUPPORT, NOTIFICATION, BROADCAST)
+LANE_NAMES = {SUPPORT: "support", NOTIFICATION: "notification", BROADCAST: "broadcast"}
+
+# Ведра простаивающих чатов удаляются, когда их становится больше
+MAX_CHAT_BUCKETS = 10000
+
+outbound_queue_depth = Gauge(
+    "outbound_queue_depth",
+    "Отправки, ожидающие лимита, по полосам",
+    ["lane"]
+)
+outbound_wait_seconds = Histogram(
+    "outbound_wait_seconds",
+    "Ожидание отправки в планировщике",
+    ["lane"]
+)
+outbound_retry_after_total = Counter(
+    "outbound_retry_after_total",
+    "Ответы Telegram с RetryAfter (превышение лимита) по полосам",
+    ["lane"]
+)
+
+_current_lane: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_lane", default=SUPPORT)
+
+
+def current_lane() -> int:
+    """Полоса отправок текущего контекста"""
+    return _current_lane.get()
+
+
+class _LaneContext:
+    """Полоса на время блока with или вызова асинхронной функции"""
+
+    def __init__(self, lane: int):
+        self.lane = lane
+        self._tokens: list[contextvars.Token] = []
+
+    def __enter__(self):
+        self._tokens.append(_current_lane.set(self.lane))
+        return self
+
+    def __exit__(self, *exc_info):
+        _current_lane.reset(self._tokens.pop())
+
+    def __call__(self, func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _current_lane.set(self.lane)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_lane.reset(token)
+
+        return wrapper
+
+
+def outbound_lane(lane: int) -> _LaneContext:
+    """
+    Задать полосу отправок
+
+    Использование:
+        with outbound_lane(NOTIFICATION):
+            await bot.send_message(...)
+
+        @outbound_lane(BROADCAST)
+        async def deliver(...): ...
+
+    Контекст копируется в задачи, созданные внутри, поэтому фоновая
+    задача наследует полосу места запуска.
+    """
+    return _LaneContext(lane)
+
+
+class _Bucket:
+    """Ведро токенов без ожидания: только учет"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float) -> float:
+        """Через сколько секунд наберется cost токенов (0 - уже есть)"""
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens -= min(cost, self.capacity)
+
+
+class _Waiter:
+    __slots__ = ("chat_id", "cost", "future")
+
+    def __init__(self, chat_id: Union[int, str], cost: int, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.cost = cost
+        self.future = future
+
+
+class OutboundScheduler:
+    """
+    Общий и по-чатовый лимиты отправок с приоритетными полосами
+
+    Если никто не ждет и токены есть, отправка проходит сразу. Иначе
+    отправитель встает в очередь своей полосы, а задача-диспетчер выдает
+    разрешения: сначала старшим полосам, в полосе - по порядку. Ожидающий
+    чата, у которого кончились токены, не задерживает другие чаты; общие
+    токены младшим полосам достаются, только когда старшим нечего отправить.
+    """
+
+    def __init__(
+            self,
+            global_rate: float = 30,
+            chat_rate: float = 1,
+            group_rate: float = 20 / 60,
+            chat_burst: float = 3
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+
+        self._global = _Bucket(global_rate, global_rate, time.monotonic())
+        self._chats: dict[Union[int, str], _Bucket] = {}
+        self._lanes: dict[int, deque[_Waiter]] = {lane: deque() for lane in LANES}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        outbound_queue_depth.set_function(self.queue_depth)
+
+    def queue_depth(self) -> dict[tuple, int]:
+        """Число ожидающих по полосам (для метрик)"""
+        return {(LANE_NAMES[lane],): len(waiters) for lane, waiters in self._lanes.items()}
+
+    async def acquire(self, chat_id: Union[int, str], cost: int = 1, lane: Optional[int] = None):
+        """
+        Дождаться разрешения на отправку в чат
+
+        Args:
+            chat_id: Чат получателя
+            cost: Сколько сообщений засчитает Telegram (у альбома - число файлов)
+            lane: Полоса; по умолчанию - из контекста (outbound_lane)
+        """
+        lane = current_lane() if lane is None else lane
+        now = time.monotonic()
+
+        # Быстрый путь: очередь пуста, токены есть
+        if not any(self._lanes.values()):
+            self._global.refill(now)
+            bucket = self._chat_bucket(chat_id, now)
+            if not self._global.delay(cost) and not bucket.delay(cost):
+                self._global.take(cost)
+                bucket.take(cost)
+                outbound_wait_seconds.observe(0, lane=LANE_NAMES[lane])
+                return
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(chat_id, cost, loop.create_future())
+        self._lanes[lane].append(waiter)
+        self._ensure_dispatcher(loop)
+        self._wakeup.set()
+
+        try:
+            await waiter.future
+        finally:
+            outbound_wait_seconds.observe(time.monotonic() - now, lane=LANE_NAMES[lane])
+
+    def penalize(self, chat_id: Union[int, str], retry_after: float, lane: Optional[int] = None):
+        """Telegram ответил RetryAfter: не отправлять в чат retry_after секунд"""
+        lane = current_lane() if lane is None else lane
+        outbound_retry_after_total.inc(lane=LANE_NAMES[lane])
+
+        now = time.monotonic()
+        bucket = self._chat_bucket(chat_id, now)
+        bucket.tokens = min(bucket.tokens, 0) - retry_after * bucket.rate
+        bucket.updated = now
+
+    def _chat_bucket(self, chat_id: Union[int, str], now: float) -> _Bucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._prune(now)
+            # Группы и каналы (отрицательный ID или @username) - 20 сообщений в минуту
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chats[chat_id] = _Bucket(rate, self.chat_burst, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def _prune(self, now: float):
+        """Удалить ведра чатов с полным запасом: они ничем не отличаются от новых"""
+        for chat_id, bucket in list(self._chats.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._chats[chat_id]
+
+    def _ensure_dispatcher(self, loop: asyncio.AbstractEventLoop):
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._dispatch(), name="outbound_scheduler")
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._grant()
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self) -> Optional[float]:
+        """
+        Выдать разрешения, на которые хватает токенов
+
+        Returns:
+            Через сколько секунд пробовать снова (None - ожидающих нет)
+        """
+        now = time.monotonic()
+        self._global.refill(now)
+        blocked_chats = set()
+        retry_in = None
+
+        for lane in LANES:
+            waiters = self._lanes[lane]
+            for waiter in list(waiters):
+                if waiter.future.done():
+                    # Отправитель отменен, пока ждал
+                    waiters.remove(waiter)
+                    continue
+                if waiter.chat_id in blocked_chats:
+                    continue
+
+                bucket = self._chat_bucket(waiter.chat_id, now)
+                chat_delay = bucket.delay(waiter.cost)
+                if chat_delay:
+                    # Более поздние отправки в этот чат (и из младших полос) ждут за ним
+                    blocked_chats.add(waiter.chat_id)
+                    retry_in = chat_delay if retry_in is None else min(retry_in, chat_delay)
+                    continue
+
+                global_delay = self._global.delay(waiter.cost)
+                if global_delay:
+                    # Общие токены достанутся этому ожидающему, а не младшим полосам
+                    return global_delay if retry_in is None else min(retry_in, global_delay)
+
+                self._global.take(waiter.cost)
+                bucket.take(waiter.cost)
+                waiters.remove(waiter)
+                waiter.future.set_result(None)
+
+        return retry_in
@@ -0,0 +1,41 @@
+"""
+Общее подключение к Redis
+"""
+from typing import Optional
+
+from config import settings
+
+_redis = None
+
+
+def get_redis(url: Optional[str] = None):
+    """
+    Получить клиент Redis (создается при первом обращении)
+
+    Args:
+        url: URL Redis, по умолчанию settings.REDIS_URL
+
+    Returns:
+        Асинхронный клиент redis.asyncio.Redis
+    """
+    global _redis
+
+    if _redis is None:
+        url = url or settings.REDIS_URL
+        if not url:
+            raise RuntimeError("REDIS_URL не задан")
+
+        # Импортируем здесь, чтобы Redis оставался опциональной зависимостью
+        from redis.asyncio import Redis
+        _redis = Redis.from_url(url)
+
+    return _redis
+
+
+async def close_redis():
+    """Закрыть подключение к Redis"""
+    global _redis
+
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
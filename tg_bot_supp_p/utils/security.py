@@ -2,11 +2,29 @@
 Утилиты безопасности
 """
 import re
+import time
+import asyncio
+import uuid
+import logging
+from array import array
+from collections import deque
 from typing import Optional
 from datetime import datetime, timedelta
-from sqlalchemy import select, func
+from sqlalchemy import select, func, insert, delete
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import RateLimit, BlockedUser
+from database import RateLimit, BlockedUser, async_session
+from config import settings
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+MINUTE_LIMIT_MESSAGE = "Слишком много сообщений. Подождите минуту."
+HOUR_LIMIT_MESSAGE = "Превышен лимит сообщений в час. Попробуйте позже."
+
+rate_limit_audit_dropped_total = Counter(
+    "rate_limit_audit_dropped_total",
+    "Записи журнала rate_limits, отброшенные из-за переполнения очереди на запись"
+)
 
 
 class SecurityValidator:
@@ -83,6 +101,9 @@ class RateLimiter:
         self.max_per_minute = max_per_minute
         self.max_per_hour = max_per_hour
 
+    def start(self):
+        """Запуск фоновых задач ограничителя (для БД не требуются)"""
+
     async def check_limit(
             self,
             session: AsyncSession,
@@ -114,7 +135,7 @@ class RateLimiter:
         minute_count = minute_result.scalar()
 
         if minute_count >= self.max_per_minute:
-            return False, "Слишком много сообщений. Подождите минуту."
+            return False, MINUTE_LIMIT_MESSAGE
 
         # Проверка за час
         hour_query = select(func.count(RateLimit.id)).where(
@@ -126,7 +147,7 @@ class RateLimiter:
         hour_count = hour_result.scalar()
 
         if hour_count >= self.max_per_hour:
-            return False, "Превышен лимит сообщений в час. Попробуйте позже."
+            return False, HOUR_LIMIT_MESSAGE
 
         # Записываем действие
         rate_limit = RateLimit(
@@ -139,39 +160,424 @@ class RateLimiter:
 
         return True, None
 
-    async def cleanup_old_records(self, session: AsyncSession, days: int = 7):
+    async def cleanup_old_records(self, session: AsyncSession, days: int = 7) -> int:
         """
         Очистка старых записей
 
         Args:
             session: Сессия БД
             days: Количество дней для хранения
+
+        Returns:
+            Количество удаленных записей
         """
         cutoff = datetime.utcnow() - timedelta(days=days)
-        query = select(RateLimit).where(RateLimit.timestamp < cutoff)
-        result = await session.execute(query)
-        old_records = result.scalars().all()
+        return await _delete_rate_limits_before(session, cutoff, settings.RATE_LIMIT_CLEANUP_BATCH)
 
-        for record in old_records:
-            await session.delete(record)
 
+async def _delete_rate_limits_before(session: AsyncSession, cutoff: datetime, batch_size: int) -> int:
+    """
+    Удалить записи rate_limits старше cutoff порциями по диапазонам id
+
+    Каждая порция - один DELETE по batch_size идущих подряд id с отдельным
+    коммитом, поэтому блокировки держатся недолго, а записи не грузятся в память.
+    """
+    low = (await session.execute(select(func.min(RateLimit.id)))).scalar()
+    high = (await session.execute(
+        select(func.max(RateLimit.id)).where(RateLimit.timestamp < cutoff)
+    )).scalar()
+    if high is None:
+        return 0
+
+    removed = 0
+    while low <= high:
+        result = await session.execute(
+            delete(RateLimit)
+            .where(
+                RateLimit.id >= low,
+                RateLimit.id < low + batch_size,
+                RateLimit.timestamp < cutoff
+            )
+            .execution_options(synchronize_session=False)
+        )
         await session.commit()
+        removed += result.rowcount
+        low += batch_size
+
+        # Отдаем управление обработчикам между порциями
+        await asyncio.sleep(0)
+
+    return removed
+
+
+async def purge_rate_limits():
+    """Удалить записи rate_limits старше RATE_LIMIT_RETENTION_DAYS (фоновая задача)"""
+    started = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=settings.RATE_LIMIT_RETENTION_DAYS)
+
+    async with async_session() as session:
+        removed = await _delete_rate_limits_before(session, cutoff, settings.RATE_LIMIT_CLEANUP_BATCH)
+
+    logger.info(f"rate_limits: удалено {removed} записей старше {cutoff:%Y-%m-%d %H:%M} за {time.monotonic() - started:.2f} с")
+
+
+# Скользящее окно на sorted set: score - время действия в мс.
+# Скрипт выполняется атомарно, поэтому параллельные проверки одного
+# пользователя не могут превысить лимит.
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local max_per_minute = tonumber(ARGV[2])
+local max_per_hour = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', key, '-inf', '(' .. (now - 3600000))
+
+if redis.call('ZCOUNT', key, now - 60000, '+inf') >= max_per_minute then
+    return 1
+end
+if redis.call('ZCARD', key) >= max_per_hour then
+    return 2
+end
+
+redis.call('ZADD', key, now, ARGV[4])
+redis.call('PEXPIRE', key, 3600000)
+return 0
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Ограничитель частоты запросов со скользящим окном в Redis"""
+
+    def __init__(
+            self,
+            redis,
+            max_per_minute: int = 5,
+            max_per_hour: int = 30,
+            key_prefix: str = "rate_limit"
+    ):
+        super().__init__(max_per_minute, max_per_hour)
+        self.redis = redis
+        self.key_prefix = key_prefix
+        self._script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    async def check_limit(
+            self,
+            session: AsyncSession,
+            telegram_id: int,
+            action_type: str = "message"
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Проверка лимита запросов без обращения к БД
+
+        Args:
+            session: Сессия БД (не используется, оставлена для совместимости)
+            telegram_id: ID пользователя
+            action_type: Тип действия
+
+        Returns:
+            (разрешено, сообщение об ошибке)
+        """
+        now_ms = int(time.time() * 1000)
+        key = f"{self.key_prefix}:{action_type}:{telegram_id}"
+
+        try:
+            result = await self._script(
+                keys=[key],
+                args=[now_ms, self.max_per_minute, self.max_per_hour, f"{now_ms}:{uuid.uuid4().hex}"]
+            )
+        except Exception as e:
+            # Недоступность Redis не должна блокировать обращения в поддержку
+            logger.warning(f"Redis rate limiter недоступен, пропускаю проверку: {e}")
+            return True, None
+
+        if result == 1:
+            return False, MINUTE_LIMIT_MESSAGE
+        if result == 2:
+            return False, HOUR_LIMIT_MESSAGE
+
+        return True, None
+
+
+class _RateWindow:
+    """Кольцевой буфер времени последних действий одного пользователя"""
+
+    __slots__ = ("stamps", "head", "count")
+
+    def __init__(self, size: int):
+        self.stamps = array("d", bytes(8 * size))
+        self.head = 0
+        self.count = 0
+
+    def nth_latest(self, n: int) -> float:
+        """Время n-го с конца действия (n >= 1)"""
+        return self.stamps[(self.head - n) % len(self.stamps)]
+
+    def push(self, stamp: float):
+        """Записать действие, вытеснив самое старое"""
+        self.stamps[self.head] = stamp
+        self.head = (self.head + 1) % len(self.stamps)
+        if self.count < len(self.stamps):
+            self.count += 1
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Ограничитель частоты в памяти процесса (для одного экземпляра бота)"""
+
+    def __init__(
+            self,
+            max_per_minute: int = 5,
+            max_per_hour: int = 30,
+            flush_interval: float = 5.0,
+            max_pending: int = 10000
+    ):
+        super().__init__(max_per_minute, max_per_hour)
+        self.flush_interval = flush_interval
+        self._size = max(max_per_minute, max_per_hour, 1)
+        self._windows: dict[tuple[int, str], _RateWindow] = {}
+        # Записи для журнала rate_limits, ожидающие пакетной вставки
+        # (не больше max_pending: при долгом сбое БД старые отбрасываются)
+        self.max_pending = max_pending
+        self._pending: deque[tuple[int, str, datetime]] = deque()
+        self._overflowing = False
+
+    async def check_limit(
+            self,
+            session: AsyncSession,
+            telegram_id: int,
+            action_type: str = "message"
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Проверка лимита запросов за O(1) без обращения к БД
+
+        Args:
+            session: Сессия БД (не используется, оставлена для совместимости)
+            telegram_id: ID пользователя
+            action_type: Тип действия
+
+        Returns:
+            (разрешено, сообщение об ошибке)
+        """
+        now = time.monotonic()
+        key = (telegram_id, action_type)
+
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _RateWindow(self._size)
+
+        # Лимит превышен, если N-е с конца действие попадает в окно
+        if window.count >= self.max_per_minute and window.nth_latest(self.max_per_minute) > now - 60:
+            return False, MINUTE_LIMIT_MESSAGE
+
+        if window.count >= self.max_per_hour and window.nth_latest(self.max_per_hour) > now - 3600:
+            return False, HOUR_LIMIT_MESSAGE
+
+        window.push(now)
+        self._pending.append((telegram_id, action_type, datetime.utcnow()))
+        self._trim_pending()
+
+        return True, None
+
+    def start(self):
+        """Запустить фоновую запись журнала"""
+        from utils.background import background
+        background.every(self.flush_interval, self.flush, "rate_limit_audit_flush", run_on_stop=True)
+
+    async def flush(self):
+        """Записать накопленные действия в rate_limits одной пакетной вставкой"""
+        self._evict_idle()
+
+        if not self._pending:
+            return
+
+        batch = list(self._pending)
+        self._pending.clear()
+
+        try:
+            async with async_session() as session:
+                await session.execute(insert(RateLimit), [
+                    {"telegram_id": telegram_id, "action_type": action_type, "timestamp": timestamp}
+                    for telegram_id, action_type, timestamp in batch
+                ])
+                await session.commit()
+        except Exception:
+            # Вернем записи перед пришедшими за время вставки, попробуем при следующем сбросе
+            self._pending = deque(batch + list(self._pending))
+            self._trim_pending()
+            raise
+
+        self._overflowing = False
+
+    def _trim_pending(self):
+        """Отбросить самые старые записи сверх max_pending"""
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return
+
+        for _ in range(overflow):
+            self._pending.popleft()
+        rate_limit_audit_dropped_total.inc(overflow)
+
+        # Предупреждаем один раз до следующей успешной записи
+        if not self._overflowing:
+            self._overflowing = True
+            logger.warning(
+                f"Очередь журнала rate_limits переполнена ({self.max_pending} записей), "
+                f"старые записи отбрасываются"
+            )
+
+    def _evict_idle(self):
+        """Удалить окна пользователей, не писавших больше часа"""
+        hour_ago = time.monotonic() - 3600
+        idle = [key for key, window in self._windows.items() if window.nth_latest(1) <= hour_ago]
+        for key in idle:
+            del self._windows[key]
+
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Создать ограничитель частоты по настройкам
+
+    Returns:
+        Ограничитель, выбранный RATE_LIMIT_BACKEND
+        (auto: Redis если задан REDIS_URL, иначе БД)
+    """
+    backend = settings.RATE_LIMIT_BACKEND.lower()
+    if backend == "auto":
+        backend = "redis" if settings.REDIS_URL else "sql"
+
+    if backend == "memory":
+        return MemoryRateLimiter(
+            max_per_minute=settings.MAX_MESSAGES_PER_MINUTE,
+            max_per_hour=settings.MAX_MESSAGES_PER_HOUR,
+            flush_interval=settings.RATE_LIMIT_AUDIT_FLUSH_INTERVAL
+        )
+
+    if backend == "redis":
+        from utils.redis_client import get_redis
+        return RedisRateLimiter(
+            get_redis(),
+            max_per_minute=settings.MAX_MESSAGES_PER_MINUTE,
+            max_per_hour=settings.MAX_MESSAGES_PER_HOUR
+        )
+
+    return RateLimiter(
+        max_per_minute=settings.MAX_MESSAGES_PER_MINUTE,
+        max_per_hour=settings.MAX_MESSAGES_PER_HOUR
+    )
+
+
+class BlockedUsersCache:
+    """Кэш ID заблокированных пользователей в памяти"""
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._ids: set[int] = set()
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        # Блокировки и разблокировки за время перезагрузки (ID -> заблокирован):
+        # запрос мог прочитать таблицу до них, поэтому они применяются поверх
+        self._pending: Optional[dict[int, bool]] = None
+
+        self.hits = Counter("blocked_cache_hits_total", "Проверки блокировки, отвеченные из памяти")
+        self.misses = Counter("blocked_cache_misses_total", "Проверки блокировки, потребовавшие загрузки из БД")
+        self.size = Gauge("blocked_cache_size", "Число ID в кэше заблокированных")
+        self.size.set_function(lambda: len(self._ids))
+
+    @property
+    def is_fresh(self) -> bool:
+        """Кэш загружен и не старше TTL"""
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def contains(self, session: AsyncSession, telegram_id: int) -> bool:
+        """
+        Проверить ID, при устаревшем кэше перезагрузив его
+
+        Args:
+            session: Сессия БД для перезагрузки
+            telegram_id: ID пользователя
+
+        Returns:
+            True если пользователь заблокирован
+        """
+        if self.is_fresh:
+            self.hits.inc()
+        else:
+            self.misses.inc()
+            await self.refresh(session)
+
+        return telegram_id in self._ids
+
+    async def refresh(self, session: Optional[AsyncSession] = None):
+        """
+        Перечитать blocked_users целиком (подхватывает изменения вне бота)
+
+        Args:
+            session: Сессия БД, по умолчанию открывается новая
+        """
+        async with self._lock:
+            # Пока ждали блокировку, кэш мог обновить другой запрос
+            if self.is_fresh:
+                return
+
+            query = select(BlockedUser.telegram_id)
+            self._pending = {}
+            try:
+                if session is None:
+                    async with async_session() as session:
+                        ids = (await session.execute(query)).scalars().all()
+                else:
+                    ids = (await session.execute(query)).scalars().all()
+
+                self._ids = set(ids)
+                for telegram_id, blocked in self._pending.items():
+                    if blocked:
+                        self._ids.add(telegram_id)
+                    else:
+                        self._ids.discard(telegram_id)
+            finally:
+                self._pending = None
+            self._loaded_at = time.monotonic()
+
+        logger.debug(
+            f"Кэш блокировок обновлен: {len(self._ids)} ID, "
+            f"попаданий {self.hits.value()}, промахов {self.misses.value()}"
+        )
+
+    def add(self, telegram_id: int):
+        """Записать блокировку в кэш"""
+        self._ids.add(telegram_id)
+        if self._pending is not None:
+            self._pending[telegram_id] = True
+
+    def discard(self, telegram_id: int):
+        """Убрать блокировку из кэша"""
+        self._ids.discard(telegram_id)
+        if self._pending is not None:
+            self._pending[telegram_id] = False
+
+
+blocked_users_cache = BlockedUsersCache(ttl=settings.BLOCKED_CACHE_TTL)
 
 
 async def is_user_blocked(session: AsyncSession, telegram_id: int) -> bool:
     """
-    Проверка блокировки пользователя
+    Проверка блокировки пользователя (из кэша blocked_users_cache)
 
     Args:
-        session: Сессия БД
+        session: Сессия БД (используется, только если кэш устарел)
         telegram_id: ID пользователя
 
     Returns:
         True если пользователь заблокирован
     """
+    return await blocked_users_cache.contains(session, telegram_id)
+
+
+async def _get_blocked_user(session: AsyncSession, telegram_id: int) -> Optional[BlockedUser]:
+    """Найти запись о блокировке в БД, минуя кэш"""
     query = select(BlockedUser).where(BlockedUser.telegram_id == telegram_id)
     result = await session.execute(query)
-    return result.scalar_one_or_none() is not None
+    return result.scalar_one_or_none()
 
 
 async def block_user(
@@ -192,8 +598,9 @@ async def block_user(
     Returns:
         True если успешно заблокирован
     """
-    # Проверяем, не заблокирован ли уже
-    if await is_user_blocked(session, telegram_id):
+    # Проверяем по БД: запись могла появиться в обход кэша
+    if await _get_blocked_user(session, telegram_id) is not None:
+        blocked_users_cache.add(telegram_id)
         return False
 
     blocked_user = BlockedUser(
@@ -203,6 +610,7 @@ async def block_user(
     )
     session.add(blocked_user)
     await session.commit()
+    blocked_users_cache.add(telegram_id)
     return True
 
 
@@ -217,13 +625,13 @@ async def unblock_user(session: AsyncSession, telegram_id: int) -> bool:
     Returns:
         True если успешно разблокирован
     """
-    query = select(BlockedUser).where(BlockedUser.telegram_id == telegram_id)
-    result = await session.execute(query)
-    blocked_user = result.scalar_one_or_none()
+    blocked_user = await _get_blocked_user(session, telegram_id)
 
     if not blocked_user:
+        blocked_users_cache.discard(telegram_id)
         return False
 
     await session.delete(blocked_user)
     await session.commit()
-    return True
\ No newline at end of file
+    blocked_users_cache.discard(telegram_id)
+    return True
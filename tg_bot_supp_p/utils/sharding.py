@@ -0,0 +1,59 @@
+"""
+Распределение обновлений по процессам-обработчикам
+"""
+import bisect
+import hashlib
+from typing import Optional, Sequence
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование ключей по узлам
+
+    Каждый узел занимает replicas точек на кольце; ключ достается узлу
+    с ближайшей точкой по часовой стрелке. При изменении числа узлов
+    переезжает только ~1/N ключей.
+    """
+
+    def __init__(self, nodes: Sequence, replicas: int = 100):
+        self._points: list[int] = []
+        self._nodes: list = []
+
+        ring = sorted(
+            (_hash(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        for point, node in ring:
+            self._points.append(point)
+            self._nodes.append(node)
+
+    def node_for(self, key) -> object:
+        """Узел, которому принадлежит ключ"""
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._nodes[index]
+
+
+def raw_update_user_id(data: dict) -> Optional[int]:
+    """
+    ID пользователя из необработанного обновления (dict из JSON)
+
+    Не строит модели aiogram: приемнику нужен только ключ маршрутизации.
+    """
+    for key, event in data.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if isinstance(user, dict):
+            return user.get("id")
+    return None
+
+
+def update_shard_key(data: dict):
+    """Ключ маршрутизации: пользователь, а для системных обновлений - update_id"""
+    user_id = raw_update_user_id(data)
+    return user_id if user_id is not None else data.get("update_id")
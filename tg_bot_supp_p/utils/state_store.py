@@ -0,0 +1,233 @@
+"""
+Хранилища состояния диалогов с ограничением размера и времени жизни
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from config import settings
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Все созданные хранилища по имени (для метрик)
+_stores: dict[str, "StateStore"] = {}
+
+state_store_entries = Gauge(
+    "state_store_entries",
+    "Текущее число записей в хранилище состояния",
+    ["store"]
+)
+state_store_entries.set_function(lambda: {(name,): store.size() for name, store in _stores.items()})
+
+state_store_evictions_total = Counter(
+    "state_store_evictions_total",
+    "Записи, вытесненные из хранилища по размеру или времени жизни",
+    ["store", "reason"]
+)
+
+
+class StateStore:
+    """
+    Асинхронное хранилище ключ-значение с временем жизни записей
+
+    Интерфейс одинаков для памяти и Redis, поэтому обработчики не зависят
+    от выбранного бэкенда.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+
+    async def get(self, key: Hashable, default: Any = None) -> Any:
+        """Значение по ключу или default"""
+        raise NotImplementedError
+
+    async def set(self, key: Hashable, value: Any):
+        """Сохранить значение (время жизни отсчитывается заново)"""
+        raise NotImplementedError
+
+    async def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удалить запись и вернуть ее значение"""
+        raise NotImplementedError
+
+    async def contains(self, key: Hashable) -> bool:
+        """Есть ли живая запись с таким ключом"""
+        return await self.get(key, _MISSING) is not _MISSING
+
+    def size(self) -> int:
+        """Текущее число записей (для метрик)"""
+        raise NotImplementedError
+
+
+class MemoryStateStore(StateStore):
+    """
+    Хранилище в памяти процесса с ограничением размера и TTL
+
+    Записи хранятся в порядке последней записи: время жизни, как и в Redis,
+    отсчитывается от set, а чтение его не продлевает. Поэтому у всех записей
+    одинаковый срок, и порядок истечения совпадает с порядком хранения. При
+    переполнении вытесняются самые давно записанные, просроченные удаляются
+    при чтении и при каждой записи с головы очереди.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        super().__init__(name, max_size, ttl)
+        # ключ -> (момент истечения, значение)
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            state_store_evictions_total.inc(store=self.name, reason="ttl")
+            return default
+
+        return value
+
+    async def set(self, key: Hashable, value: Any):
+        now = time.monotonic()
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        self._evict(now)
+
+    async def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        if item is None or item[0] <= time.monotonic():
+            return default
+        return item[1]
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def _evict(self, now: float):
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            state_store_evictions_total.inc(store=self.name, reason="size")
+
+        # Голова - самые давние записи, они истекают первыми
+        while self._data:
+            key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            del self._data[key]
+            state_store_evictions_total.inc(store=self.name, reason="ttl")
+
+
+class RedisStateStore(StateStore):
+    """
+    Хранилище в Redis: общее для всех экземпляров бота и переживает перезапуск
+
+    Каждая запись - отдельный ключ {prefix}:{name}:{key} со значением в JSON
+    и истечением через ttl. Размер ограничивается временем жизни и политикой
+    памяти Redis; число записей для метрик обновляет refresh_size().
+    """
+
+    def __init__(self, redis, name: str, max_size: int, ttl: float, key_prefix: str = "state"):
+        super().__init__(name, max_size, ttl)
+        self.redis = redis
+        self.key_prefix = f"{key_prefix}:{name}"
+        self._size = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.key_prefix}:{key}"
+
+    async def get(self, key: Hashable, default: Any = None) -> Any:
+        raw = await self.redis.get(self._key(key))
+        if raw is None:
+            return default
+        return json.loads(raw)
+
+    async def set(self, key: Hashable, value: Any):
+        await self.redis.set(self._key(key), json.dumps(value), px=int(self.ttl * 1000))
+
+    async def pop(self, key: Hashable, default: Any = None) -> Any:
+        raw = await self.redis.getdel(self._key(key))
+        if raw is None:
+            return default
+        return json.loads(raw)
+
+    async def contains(self, key: Hashable) -> bool:
+        return bool(await self.redis.exists(self._key(key)))
+
+    def size(self) -> int:
+        return self._size
+
+    async def refresh_size(self):
+        """Пересчитать число записей через SCAN (не блокирует Redis)"""
+        count = 0
+        async for _ in self.redis.scan_iter(match=f"{self.key_prefix}:*", count=1000):
+            count += 1
+        self._size = count
+
+
+def state_backend() -> str:
+    """Бэкенд состояния: redis или memory (auto - redis при заданном REDIS_URL)"""
+    backend = settings.STATE_BACKEND
+    if backend == "auto":
+        return "redis" if settings.REDIS_URL else "memory"
+    if backend not in ("redis", "memory"):
+        raise ValueError(f"Неизвестный STATE_BACKEND: {backend}")
+    return backend
+
+
+def create_fsm_storage():
+    """
+    Хранилище FSM aiogram в том же бэкенде, что и состояние диалогов
+
+    С Redis состояния FSM (рассылка, добавление товара) видны всем
+    экземплярам бота и сохраняются при перезапуске.
+    """
+    if state_backend() == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage, DefaultKeyBuilder
+        from utils.redis_client import get_redis
+        return RedisStorage(
+            get_redis(),
+            key_builder=DefaultKeyBuilder(prefix="fsm"),
+            state_ttl=int(settings.STATE_PENDING_TTL),
+            data_ttl=int(settings.STATE_PENDING_TTL)
+        )
+
+    from aiogram.fsm.storage.memory import MemoryStorage
+    return MemoryStorage()
+
+
+def create_state_store(name: str, max_size: int, ttl: float) -> StateStore:
+    """
+    Создать хранилище состояния в бэкенде из settings.STATE_BACKEND
+
+    Args:
+        name: Имя хранилища (часть ключей Redis и метка метрик)
+        max_size: Максимум записей в памяти
+        ttl: Время жизни записи в секундах
+
+    Returns:
+        Хранилище выбранного бэкенда
+    """
+    if state_backend() == "redis":
+        from utils.redis_client import get_redis
+        store = RedisStateStore(get_redis(), name, max_size, ttl)
+    else:
+        store = MemoryStateStore(name, max_size, ttl)
+
+    _stores[name] = store
+    return store
+
+
+async def refresh_state_sizes():
+    """Обновить размеры хранилищ Redis для метрик (фоновая задача)"""
+    for store in _stores.values():
+        if isinstance(store, RedisStateStore):
+            try:
+                await store.refresh_size()
+            except Exception as e:
+                logger.warning(f"Не удалось посчитать записи {store.name}: {e}")
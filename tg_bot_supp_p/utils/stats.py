@@ -0,0 +1,177 @@
+"""
+Статистика бота на предрасчитанных счетчиках
+"""
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, func, delete, update, insert, event
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import (
+    User, Order, Product, BlockedUser,
+    StatsCounter, StatsDaily, async_session
+)
+
+logger = logging.getLogger(__name__)
+
+# Модель -> (метрика, колонка даты для дневных счетчиков или None)
+TRACKED_MODELS = {
+    User: ("users", User.created_at),
+    Order: ("orders", Order.created_at),
+    Product: ("products", None),
+    BlockedUser: ("blocked_users", None),
+}
+
+
+def _dialect_insert(connection: Connection, table):
+    """INSERT с поддержкой ON CONFLICT для текущей БД (или None)"""
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif connection.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert(table)
+
+
+def _add_to_counter(connection: Connection, table, keys: dict, delta: int):
+    """Прибавить delta к строке счетчика, создав ее при отсутствии"""
+    stmt = _dialect_insert(connection, table)
+    if stmt is not None:
+        stmt = stmt.values(**keys, value=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={"value": table.c.value + stmt.excluded.value}
+        )
+        connection.execute(stmt)
+        return
+
+    conditions = [table.c[name] == value for name, value in keys.items()]
+    result = connection.execute(update(table).where(*conditions).values(value=table.c.value + delta))
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(**keys, value=delta))
+
+
+def increment_stats(connection: Connection, metric: str, delta: int = 1, day: Optional[date] = None):
+    """
+    Изменить счетчики в транзакции, которая меняет данные
+
+    Args:
+        connection: Синхронное соединение (из события или run_sync)
+        metric: Имя метрики
+        delta: Изменение
+        day: День для дневного счетчика (None - только общий)
+    """
+    _add_to_counter(connection, StatsCounter.__table__, {"metric": metric}, delta)
+    if day is not None:
+        _add_to_counter(connection, StatsDaily.__table__, {"metric": metric, "day": day}, delta)
+
+
+def _make_listener(metric: str, date_column, delta: int):
+    def listener(mapper, connection, target):
+        day = None
+        if date_column is not None:
+            day = (getattr(target, date_column.key) or datetime.utcnow()).date()
+        increment_stats(connection, metric, delta, day)
+    return listener
+
+
+for _model, (_metric, _date_column) in TRACKED_MODELS.items():
+    event.listen(_model, "after_insert", _make_listener(_metric, _date_column, 1))
+    event.listen(_model, "after_delete", _make_listener(_metric, _date_column, -1))
+
+
+async def get_stats(session: AsyncSession) -> dict:
+    """
+    Прочитать статистику из счетчиков (несколько строк, не зависит от размера таблиц)
+
+    Недельные значения - скользящее окно последних 7 суток, как и раньше:
+    считаются по индексу created_at и затрагивают только записи за неделю.
+
+    Returns:
+        Словарь: total_users, total_blocked, total_orders, total_products,
+        new_users_week, new_orders_week, today_orders
+    """
+    week_ago = datetime.utcnow() - timedelta(days=7)
+
+    totals = dict((await session.execute(select(StatsCounter.metric, StatsCounter.value))).all())
+
+    today_orders = (await session.execute(
+        select(StatsDaily.value).where(
+            StatsDaily.metric == "orders",
+            StatsDaily.day == datetime.utcnow().date()
+        )
+    )).scalar()
+
+    new_users_week = (await session.execute(
+        select(func.count(User.id)).where(User.created_at >= week_ago)
+    )).scalar()
+    new_orders_week = (await session.execute(
+        select(func.count(Order.id)).where(Order.created_at >= week_ago)
+    )).scalar()
+
+    return {
+        "total_users": totals.get("users", 0),
+        "total_blocked": totals.get("blocked_users", 0),
+        "total_orders": totals.get("orders", 0),
+        "total_products": totals.get("products", 0),
+        "new_users_week": new_users_week,
+        "new_orders_week": new_orders_week,
+        "today_orders": today_orders or 0,
+    }
+
+
+async def reconcile_stats(days: Optional[int] = None):
+    """
+    Пересчитать счетчики по исходным таблицам
+
+    Исправляет расхождения от записей в обход ORM (вебапп, скрипты, SQL)
+    и первый раз заполняет счетчики на существующей базе.
+
+    Args:
+        days: За сколько последних дней пересчитать дневные счетчики
+              (по умолчанию settings.STATS_RECONCILE_DAYS)
+    """
+    days = days or settings.STATS_RECONCILE_DAYS
+    started = time.monotonic()
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+
+    async with async_session() as session:
+        for model, (metric, date_column) in TRACKED_MODELS.items():
+            total = (await session.execute(select(func.count()).select_from(model))).scalar()
+            await session.execute(delete(StatsCounter).where(StatsCounter.metric == metric))
+            await session.execute(insert(StatsCounter).values(metric=metric, value=total))
+
+            if date_column is None:
+                continue
+
+            day_column = func.date(date_column)
+            rows = (await session.execute(
+                select(day_column, func.count())
+                .where(date_column >= datetime.combine(since, datetime.min.time()))
+                .group_by(day_column)
+            )).all()
+
+            await session.execute(
+                delete(StatsDaily).where(StatsDaily.metric == metric, StatsDaily.day >= since)
+            )
+            if rows:
+                await session.execute(insert(StatsDaily), [
+                    {"metric": metric, "day": _as_date(day), "value": count}
+                    for day, count in rows
+                ])
+
+        await session.commit()
+
+    logger.info(f"Статистика пересчитана за {time.monotonic() - started:.2f} с")
+
+
+def _as_date(value) -> date:
+    # SQLite возвращает date() строкой
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
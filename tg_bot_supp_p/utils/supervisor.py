@@ -0,0 +1,265 @@
+"""
+Несколько процессов-обработчиков с маршрутизацией обновлений по пользователям
+"""
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import sys
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import ClientError, ClientSession, web
+
+from config import settings
+from utils.sharding import HashRing, update_shard_key
+from utils.state_store import state_backend
+from utils.webhook import SECRET_HEADER, serve_updates, set_webhook
+
+logger = logging.getLogger(__name__)
+
+# Секрет между приемником и обработчиками (передается через окружение)
+WORKER_SECRET_ENV = "BOT_WORKER_SECRET"
+
+# Попыток переслать обновление из getUpdates (раз в секунду): хватает на перезапуск обработчика
+FORWARD_ATTEMPTS = 60
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+
+
+def worker_port(index: int) -> int:
+    """Локальный порт обработчика"""
+    return settings.WORKER_BASE_PORT + index
+
+
+class WorkerProcess:
+    """Процесс-обработчик: запускается и перезапускается супервизором"""
+
+    def __init__(self, index: int, count: int, secret: str):
+        self.index = index
+        self.count = count
+        self.secret = secret
+        self.url = f"http://127.0.0.1:{worker_port(index)}{settings.WEBHOOK_PATH}"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._stopping = False
+
+    async def start(self):
+        """Запустить процесс"""
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT, "--worker-index", str(self.index), "--workers", str(self.count),
+            env={**os.environ, WORKER_SECRET_ENV: self.secret}
+        )
+        logger.info(f"Обработчик #{self.index} запущен (pid {self.process.pid}, порт {worker_port(self.index)})")
+
+    async def watch(self):
+        """Перезапускать процесс при падении"""
+        while True:
+            code = await self.process.wait()
+            if self._stopping:
+                return
+
+            logger.error(f"Обработчик #{self.index} завершился с кодом {code}, перезапуск")
+            await asyncio.sleep(1)
+            if self._stopping:
+                return
+            await self.start()
+
+    async def stop(self, timeout: float = 15):
+        """Остановить процесс (SIGTERM, затем SIGKILL)"""
+        self._stopping = True
+        if self.process is None or self.process.returncode is not None:
+            return
+
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Обработчик #{self.index} не остановился за {timeout} с, завершаю принудительно")
+            self.process.kill()
+
+
+class UpdateRouter:
+    """
+    Пересылка обновлений обработчикам по консистентному хешу пользователя
+
+    Все обновления одного пользователя попадают в один процесс, поэтому
+    сохраняется их порядок, а локальные кэши пользователя не дублируются.
+    """
+
+    def __init__(self, workers: list[WorkerProcess], secret: str):
+        self.workers = workers
+        self.ring = HashRing(range(len(workers)))
+        self._secret = secret
+        self._session: Optional[ClientSession] = None
+
+    def worker_for(self, data: dict) -> WorkerProcess:
+        """Обработчик для обновления"""
+        return self.workers[self.ring.node_for(update_shard_key(data))]
+
+    async def forward(self, data: dict, body: Optional[bytes] = None) -> Optional[int]:
+        """Передать обновление обработчику; HTTP-статус ответа или None, если он недоступен"""
+        if self._session is None:
+            self._session = ClientSession(headers={SECRET_HEADER: self._secret})
+
+        worker = self.worker_for(data)
+        try:
+            async with self._session.post(
+                worker.url,
+                data=body if body is not None else json.dumps(data),
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                return response.status
+        except ClientError as e:
+            logger.warning(f"Обработчик #{worker.index} недоступен: {e}")
+            return None
+
+    @staticmethod
+    def should_retry(status: Optional[int]) -> bool:
+        """Повторять ли пересылку: обработчик недоступен или перегружен"""
+        return status is None or status == 503
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def _receive_webhook(bot: Bot, router: UpdateRouter, allowed_updates: list[str]):
+    """Принимать вебхук Telegram и пересылать обновления обработчикам"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ""), settings.WEBHOOK_SECRET
+        ):
+            return web.Response(status=401)
+
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        status = await router.forward(data, body)
+        if router.should_retry(status):
+            # Telegram повторит доставку позже
+            return web.Response(status=503)
+        if status != 200:
+            # Повтор не поможет: обновление отброшено, иначе Telegram слал бы его снова
+            logger.error(f"Обработчик отклонил обновление {data.get('update_id')} (HTTP {status}), пропуск")
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, handle_update)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+
+    try:
+        await set_webhook(bot, allowed_updates)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _receive_polling(bot: Bot, router: UpdateRouter, allowed_updates: list[str]):
+    """Получать обновления через getUpdates и пересылать обработчикам"""
+    await bot.delete_webhook()
+    offset = None
+
+    async def forward_batch(batch: list[dict]):
+        # Обновления одного обработчика - строго по порядку, с повтором
+        for data in batch:
+            for attempt in range(1, FORWARD_ATTEMPTS + 1):
+                status = await router.forward(data)
+                if not router.should_retry(status) or attempt == FORWARD_ATTEMPTS:
+                    break
+                await asyncio.sleep(1)
+
+            if status != 200:
+                reason = "обработчик недоступен" if status is None else f"HTTP {status}"
+                logger.error(
+                    f"Обновление {data.get('update_id')} не передано обработчику "
+                    f"({reason}, попыток {attempt}), пропуск"
+                )
+
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.warning(f"Ошибка getUpdates: {e}")
+            await asyncio.sleep(5)
+            continue
+
+        if not updates:
+            continue
+
+        batches: dict[int, list[dict]] = {}
+        for update in updates:
+            data = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+            batches.setdefault(router.worker_for(data).index, []).append(data)
+
+        await asyncio.gather(*(forward_batch(batch) for batch in batches.values()))
+        offset = updates[-1].update_id + 1
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher, workers: int, webhook: bool):
+    """
+    Запустить обработчики и приемник обновлений
+
+    Args:
+        bot: Бот (для приема обновлений)
+        dp: Диспетчер (для списка используемых типов обновлений)
+        workers: Число процессов-обработчиков
+        webhook: Принимать вебхук вместо getUpdates
+    """
+    # Режим ответа админа и сообщения с кнопками общие для разных
+    # пользователей, поэтому процессам нужно общее хранилище
+    if state_backend() != "redis":
+        raise RuntimeError("Несколько процессов требуют общего состояния: задайте REDIS_URL")
+    if webhook and not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL не задан")
+    if webhook and not settings.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан")
+
+    secret = secrets.token_urlsafe(32)
+    processes = [WorkerProcess(index, workers, secret) for index in range(workers)]
+    for process in processes:
+        await process.start()
+    watchers = [asyncio.create_task(process.watch()) for process in processes]
+
+    router = UpdateRouter(processes, secret)
+    allowed_updates = dp.resolve_used_update_types()
+
+    try:
+        if webhook:
+            await _receive_webhook(bot, router, allowed_updates)
+        else:
+            await _receive_polling(bot, router, allowed_updates)
+    finally:
+        await router.close()
+        await asyncio.gather(*(process.stop() for process in processes))
+        for watcher in watchers:
+            watcher.cancel()
+
+
+async def run_worker(bot: Bot, dp: Dispatcher, index: int):
+    """Процесс-обработчик: принимать обновления от приемника на локальном порту"""
+    secret = os.environ.get(WORKER_SECRET_ENV)
+    if not secret:
+        raise RuntimeError(f"{WORKER_SECRET_ENV} не задан: обработчик запускает супервизор")
+
+    # Супервизор останавливает обработчики через SIGTERM
+    task = asyncio.current_task()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    except NotImplementedError:
+        pass
+
+    logger.info(f"Обработчик #{index} слушает порт {worker_port(index)}")
+    try:
+        await serve_updates(bot, dp, "127.0.0.1", worker_port(index), secret)
+    except asyncio.CancelledError:
+        logger.info(f"Обработчик #{index} остановлен")
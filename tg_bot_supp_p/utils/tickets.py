@@ -0,0 +1,382 @@
+"""
+Обращения в поддержку: отложенная пакетная запись и LRU для поиска по сообщениям
+"""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, func, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+from database import Ticket, TicketMessage, async_session
+from utils.background import background
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Обращений в одном запросе (Postgres и SQLite ограничивают число параметров)
+FLUSH_BATCH_SIZE = 1000
+
+# Статусы обращения
+TICKET_OPEN = "open"
+TICKET_ANSWERED = "answered"
+TICKET_IGNORED = "ignored"
+
+ticket_cache_lookups_total = Counter(
+    "ticket_cache_lookups_total",
+    "Поиск обращения по сообщению администратора (hit - из LRU, miss - из БД)",
+    ["result"]
+)
+ticket_pending_writes = Gauge(
+    "ticket_pending_writes",
+    "Обращения с изменениями, еще не записанными в БД"
+)
+
+
+@dataclass(eq=False)
+class CachedTicket:
+    """Обращение в памяти: ключ - сообщение с кнопками у администратора"""
+    user_id: int
+    admin_chat_id: int
+    admin_message_id: int
+    status: str = TICKET_OPEN
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    closed_at: Optional[datetime] = None
+    # ID остальных сообщений обращения у администратора (альбом, текст)
+    message_ids: list[int] = field(default_factory=list)
+    # Строка уже вставлена (или вставляется) в БД
+    persisted: bool = False
+    # Неудачные сбросы подряд
+    flush_failures: int = 0
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.admin_chat_id, self.admin_message_id
+
+
+class TicketStore:
+    """
+    Обращения с записью в фоне
+
+    Обработчики меняют обращения в памяти; раз в flush_interval новые
+    обращения и смены статуса записываются одной транзакцией. Поиск по
+    сообщению администратора идет через LRU на cache_size сообщений, при
+    промахе - одним запросом по уникальному индексу. Незаписанные
+    изменения учитываются при чтении из БД, поэтому обработчики их видят.
+    Если запись не удалась, изменения повторяются при следующих сбросах,
+    но не дольше max_attempts раз подряд.
+    """
+
+    def __init__(self, cache_size: int, flush_interval: float, max_attempts: int = 60):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        # (admin_chat_id, admin_message_id) любого сообщения обращения -> обращение
+        self._cache: OrderedDict[tuple[int, int], CachedTicket] = OrderedDict()
+        # Изменения к записи и записываемые сейчас (ключ - обращения)
+        self._dirty: dict[tuple[int, int], CachedTicket] = {}
+        self._flushing: dict[tuple[int, int], CachedTicket] = {}
+        # Открытые обращения по чатам администраторов (для распределения по операторам)
+        self._open_counts: dict[int, int] = {}
+
+        ticket_pending_writes.set_function(lambda: len(self._dirty) + len(self._flushing))
+
+    def open(
+            self,
+            user_id: int,
+            admin_chat_id: int,
+            admin_message_id: int,
+            message_ids: Optional[list[int]] = None
+    ) -> CachedTicket:
+        """
+        Завести обращение (запись в БД - при следующем сбросе)
+
+        Args:
+            user_id: telegram_id автора
+            admin_chat_id: Чат администратора
+            admin_message_id: Сообщение с кнопками управления
+            message_ids: Остальные сообщения обращения в этом чате
+        """
+        ticket = CachedTicket(user_id, admin_chat_id, admin_message_id, message_ids=list(message_ids or []))
+        self._remember(ticket)
+        self._dirty[ticket.key] = ticket
+        self._open_counts[admin_chat_id] = self._open_counts.get(admin_chat_id, 0) + 1
+        return ticket
+
+    def close(self, ticket: CachedTicket, status: str):
+        """Закрыть обращение: answered или ignored"""
+        if ticket.status == TICKET_OPEN:
+            count = self._open_counts.get(ticket.admin_chat_id, 0)
+            self._open_counts[ticket.admin_chat_id] = max(count - 1, 0)
+        ticket.status = status
+        ticket.closed_at = datetime.utcnow()
+        self._dirty[ticket.key] = ticket
+
+    async def by_admin_message(self, admin_chat_id: int, admin_message_id: int) -> Optional[CachedTicket]:
+        """Обращение, к которому относится сообщение в чате администратора"""
+        key = (admin_chat_id, admin_message_id)
+        ticket = self._cache.get(key)
+        if ticket is not None:
+            self._cache.move_to_end(key)
+            ticket_cache_lookups_total.inc(result="hit")
+            return ticket
+
+        ticket_cache_lookups_total.inc(result="miss")
+        # Вытесненное из LRU, но еще не записанное обращение в БД не найти
+        for ticket in self._unflushed():
+            if ticket.admin_chat_id == admin_chat_id and (
+                    admin_message_id == ticket.admin_message_id or admin_message_id in ticket.message_ids
+            ):
+                self._cache[key] = ticket
+                self._trim()
+                return ticket
+
+        async with async_session() as session:
+            row = (await session.execute(
+                select(Ticket)
+                .join(TicketMessage, TicketMessage.ticket_id == Ticket.id)
+                .where(
+                    TicketMessage.admin_chat_id == admin_chat_id,
+                    TicketMessage.admin_message_id == admin_message_id
+                )
+            )).scalar_one_or_none()
+
+        if row is None:
+            return None
+
+        ticket = self._from_row(row)
+        self._cache[key] = ticket
+        self._trim()
+        return ticket
+
+    async def open_for_user(self, user_id: int) -> list[CachedTicket]:
+        """
+        Открытые обращения пользователя
+
+        Всегда читает БД (вызывается раз на ответ администратора): обращения
+        могли завести другие экземпляры бота.
+        """
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(Ticket)
+                .where(Ticket.user_id == user_id, Ticket.status == TICKET_OPEN)
+                .order_by(Ticket.id)
+            )).scalars().all()
+
+        tickets = {}
+        for row in rows:
+            ticket = self._from_row(row)
+            tickets[ticket.key] = ticket
+        # Еще не вставленные обращения этого процесса
+        for ticket in self._unflushed():
+            if ticket.user_id == user_id:
+                tickets[ticket.key] = ticket
+
+        return [ticket for ticket in tickets.values() if ticket.status == TICKET_OPEN]
+
+    async def close_for_user(self, user_id: int, status: str) -> list[CachedTicket]:
+        """Закрыть все открытые обращения пользователя и вернуть их"""
+        tickets = await self.open_for_user(user_id)
+        for ticket in tickets:
+            self.close(ticket, status)
+        return tickets
+
+    def open_count(self, admin_chat_id: int) -> int:
+        """Число открытых обращений в чате администратора"""
+        return self._open_counts.get(admin_chat_id, 0)
+
+    async def refresh_open_counts(self):
+        """
+        Пересчитать открытые обращения по БД
+
+        Счетчики меняются в памяти при открытии и закрытии; пересчет
+        учитывает обращения, закрытые другими экземплярами бота.
+        """
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(Ticket.admin_chat_id, func.count())
+                .where(Ticket.status == TICKET_OPEN)
+                .group_by(Ticket.admin_chat_id)
+            )).all()
+
+        counts = dict(rows)
+        # Еще не записанные открытия и закрытия этого процесса
+        for ticket in self._unflushed():
+            if not ticket.persisted and ticket.status == TICKET_OPEN:
+                counts[ticket.admin_chat_id] = counts.get(ticket.admin_chat_id, 0) + 1
+            elif ticket.persisted and ticket.status != TICKET_OPEN:
+                counts[ticket.admin_chat_id] = max(counts.get(ticket.admin_chat_id, 0) - 1, 0)
+        self._open_counts = counts
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def start(self):
+        """Запустить периодическую запись (и финальную при остановке)"""
+        background.every(self.flush_interval, self.flush, "ticket_flush", run_on_stop=True)
+
+    async def flush(self):
+        """Записать новые обращения и смены статуса в БД"""
+        if not self._dirty:
+            return
+
+        self._flushing, self._dirty = self._dirty, {}
+        batch = list(self._flushing.values())
+        new = sum(1 for ticket in batch if not ticket.persisted)
+        started = time.monotonic()
+
+        try:
+            await self._write(batch)
+        except IntegrityError as e:
+            # Одна строка не должна блокировать весь пакет: пишем по одному
+            logger.warning(f"Обращения: конфликт при записи пакета из {len(batch)}, запись по одному: {e.orig}")
+            await self._write_each(batch)
+        except Exception:
+            self._retry_later(batch)
+            raise
+        finally:
+            self._flushing = {}
+
+        logger.debug(
+            f"Обращения: записано {new} новых и {len(batch) - new} изменений "
+            f"за {time.monotonic() - started:.3f} с"
+        )
+
+    async def _write(self, tickets: list[CachedTicket]):
+        """Записать обращения одной транзакцией"""
+        new = [ticket for ticket in tickets if not ticket.persisted]
+        changed = [ticket for ticket in tickets if ticket.persisted]
+
+        # Снимок: изменения во время записи попадут в следующий сброс
+        for ticket in new:
+            ticket.persisted = True
+
+        try:
+            async with async_session() as session:
+                for offset in range(0, len(new), FLUSH_BATCH_SIZE):
+                    await self._insert(session, new[offset:offset + FLUSH_BATCH_SIZE])
+
+                if changed:
+                    await session.execute(
+                        update(Ticket.__table__)
+                        .where(
+                            Ticket.admin_chat_id == bindparam("admin_chat_id_"),
+                            Ticket.admin_message_id == bindparam("admin_message_id_")
+                        )
+                        .values(status=bindparam("status_"), closed_at=bindparam("closed_at_")),
+                        [
+                            {
+                                "admin_chat_id_": ticket.admin_chat_id,
+                                "admin_message_id_": ticket.admin_message_id,
+                                "status_": ticket.status,
+                                "closed_at_": ticket.closed_at,
+                            }
+                            for ticket in changed
+                        ]
+                    )
+                await session.commit()
+        except Exception:
+            for ticket in new:
+                ticket.persisted = False
+            raise
+
+        for ticket in tickets:
+            ticket.flush_failures = 0
+
+    async def _write_each(self, tickets: list[CachedTicket]):
+        """Записать обращения по одному; нарушающие ограничения БД отбросить"""
+        failed = []
+        error = None
+        for ticket in tickets:
+            try:
+                await self._write([ticket])
+            except IntegrityError as e:
+                logger.error(f"Обращение {ticket.key} пользователя {ticket.user_id} отброшено: {e.orig}")
+            except Exception as e:
+                failed.append(ticket)
+                error = e
+
+        if failed:
+            self._retry_later(failed)
+            raise error
+
+    def _retry_later(self, tickets: list[CachedTicket]):
+        """Вернуть незаписанные обращения в очередь, если попытки не исчерпаны"""
+        for ticket in tickets:
+            ticket.flush_failures += 1
+            if ticket.flush_failures >= self.max_attempts:
+                logger.error(
+                    f"Обращение {ticket.key} пользователя {ticket.user_id} не записано "
+                    f"за {ticket.flush_failures} попыток, изменения отброшены"
+                )
+                continue
+            # Более свежие изменения, пришедшие за время записи, важнее
+            self._dirty.setdefault(ticket.key, ticket)
+
+    @staticmethod
+    async def _insert(session, tickets: list[CachedTicket]):
+        """Вставить обращения и их сообщения: три запроса на порцию"""
+        await session.execute(insert(Ticket), [
+            {
+                "user_id": ticket.user_id,
+                "admin_chat_id": ticket.admin_chat_id,
+                "admin_message_id": ticket.admin_message_id,
+                "status": ticket.status,
+                "created_at": ticket.created_at,
+                "closed_at": ticket.closed_at,
+            }
+            for ticket in tickets
+        ])
+
+        # ID вставленных строк по уникальному ключу (порядок RETURNING при executemany не везде гарантирован)
+        result = await session.execute(
+            select(Ticket.id, Ticket.admin_chat_id, Ticket.admin_message_id)
+            .where(tuple_(Ticket.admin_chat_id, Ticket.admin_message_id).in_([ticket.key for ticket in tickets]))
+        )
+        ids = {(chat_id, message_id): ticket_id for ticket_id, chat_id, message_id in result.all()}
+
+        await session.execute(insert(TicketMessage), [
+            {"ticket_id": ids[ticket.key], "admin_chat_id": ticket.admin_chat_id, "admin_message_id": message_id}
+            for ticket in tickets
+            for message_id in (ticket.admin_message_id, *ticket.message_ids)
+        ])
+
+    def _unflushed(self):
+        yield from self._flushing.values()
+        yield from self._dirty.values()
+
+    def _from_row(self, row: Ticket) -> CachedTicket:
+        """Обращение из БД; незаписанная версия этого процесса новее"""
+        key = (row.admin_chat_id, row.admin_message_id)
+        ticket = self._dirty.get(key) or self._flushing.get(key) or self._cache.get(key)
+        if ticket is not None:
+            return ticket
+        return CachedTicket(
+            user_id=row.user_id,
+            admin_chat_id=row.admin_chat_id,
+            admin_message_id=row.admin_message_id,
+            status=row.status,
+            created_at=row.created_at,
+            closed_at=row.closed_at,
+            persisted=True
+        )
+
+    def _remember(self, ticket: CachedTicket):
+        for message_id in (ticket.admin_message_id, *ticket.message_ids):
+            self._cache[(ticket.admin_chat_id, message_id)] = ticket
+        self._trim()
+
+    def _trim(self):
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+ticket_store = TicketStore(
+    settings.TICKET_CACHE_SIZE,
+    settings.TICKET_FLUSH_INTERVAL,
+    settings.TICKET_FLUSH_MAX_ATTEMPTS
+)
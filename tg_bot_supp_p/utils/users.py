@@ -0,0 +1,94 @@
+"""
+Работа с профилями пользователей
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import User
+from utils.stats import increment_stats
+
+
+async def upsert_user(
+        session: AsyncSession,
+        telegram_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str]
+) -> bool:
+    """
+    Создать пользователя или обновить его профиль одним запросом
+
+    INSERT ... ON CONFLICT (telegram_id) DO UPDATE не гоняется с параллельным
+    /start того же пользователя и не требует предварительного SELECT.
+    Коммит остается за вызывающим.
+
+    Args:
+        session: Сессия БД
+        telegram_id: ID пользователя
+        username: Username
+        first_name: Имя
+        last_name: Фамилия
+
+    Returns:
+        True, если пользователь создан
+    """
+    now = datetime.utcnow()
+    values = dict(
+        telegram_id=telegram_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+        created_at=now,
+        last_activity=now
+    )
+    profile = dict(username=username, first_name=first_name, last_name=last_name, last_activity=now)
+    dialect = session.bind.dialect.name
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(User).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_=profile)
+        # xmax = 0 только у строки, которую этот запрос вставил
+        is_new = (await session.execute(stmt.returning(literal_column("xmax = 0")))).scalar()
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(User).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_=profile)
+        # created_at при обновлении не меняется: совпадает только у новой строки
+        is_new = (await session.execute(stmt.returning(User.created_at))).scalar() == now
+    else:
+        return await _upsert_user_fallback(session, values, profile)
+
+    # Core INSERT не вызывает события ORM, счетчики статистики обновляем сами
+    if is_new:
+        await session.run_sync(
+            lambda sync_session: increment_stats(sync_session.connection(), "users", 1, now.date())
+        )
+
+    return is_new
+
+
+async def _upsert_user_fallback(session: AsyncSession, values: dict, profile: dict) -> bool:
+    """SELECT + INSERT/UPDATE через ORM для СУБД без ON CONFLICT"""
+    user = (await session.execute(
+        select(User).where(User.telegram_id == values["telegram_id"])
+    )).scalar_one_or_none()
+
+    if user is None:
+        try:
+            async with session.begin_nested():
+                session.add(User(**values))
+            return True
+        except IntegrityError:
+            # Параллельный /start успел создать пользователя
+            user = (await session.execute(
+                select(User).where(User.telegram_id == values["telegram_id"])
+            )).scalar_one()
+
+    for key, value in profile.items():
+        setattr(user, key, value)
+    return False
@@ -0,0 +1,170 @@
+"""
+Прием обновлений через вебхук (aiohttp)
+"""
+import asyncio
+import hmac
+import logging
+from typing import Awaitable, Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_user_id(update: Update) -> Optional[int]:
+    """ID пользователя, от которого пришло обновление (None для системных)"""
+    from_user = getattr(update.event, "from_user", None)
+    return from_user.id if from_user else None
+
+
+class UpdateWorkers:
+    """
+    Очереди обработки обновлений, разделенные по пользователям
+
+    Обновления одного пользователя попадают в одну очередь и обрабатываются
+    по порядку, разные пользователи обрабатываются параллельно. Очереди
+    ограничены: при перегрузке вебхук отвечает медленнее, а не копит память.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int, queue_size: int):
+        self.dp = dp
+        self.bot = bot
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self):
+        """Запустить обработчики"""
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"update_worker_{index}")
+            for index, queue in enumerate(self._queues)
+        ]
+
+    async def put(self, update: Update):
+        """Поставить обновление в очередь его пользователя"""
+        user_id = update_user_id(update)
+        key = user_id if user_id is not None else update.update_id
+        await self._queues[key % len(self._queues)].put(update)
+
+    async def stop(self, timeout: float = 10):
+        """Дообработать принятые обновления и остановить обработчики"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не все обновления обработаны до остановки")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.exception(f"Ошибка обработки обновления {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, workers: UpdateWorkers, secret: str) -> web.Application:
+    """
+    aiohttp-приложение с эндпоинтом вебхука
+
+    Обновление только проверяется и ставится в очередь: Telegram получает
+    ответ сразу, не дожидаясь обработчиков.
+    """
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            update = Update.model_validate(data, context={"bot": bot})
+        except ValidationError:
+            return web.Response(status=400)
+
+        await workers.put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, handle_update)
+    return app
+
+
+async def serve_updates(
+        bot: Bot,
+        dp: Dispatcher,
+        host: str,
+        port: int,
+        secret: str,
+        on_listening: Optional[Callable[[], Awaitable]] = None
+):
+    """
+    Принимать обновления по HTTP до отмены задачи
+
+    Args:
+        bot: Бот
+        dp: Диспетчер
+        host: Адрес сервера
+        port: Порт сервера
+        secret: Ожидаемый секрет в заголовке
+        on_listening: Вызвать, когда сервер начал принимать запросы
+    """
+    workers = UpdateWorkers(dp, bot, settings.WEBHOOK_WORKERS, settings.WEBHOOK_QUEUE_SIZE)
+    app = create_webhook_app(dp, bot, workers, secret)
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, **dp.workflow_data)
+    workers.start()
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    try:
+        if on_listening is not None:
+            await on_listening()
+        await asyncio.Event().wait()
+    finally:
+        # Сначала перестаем принимать, затем дообрабатываем очередь
+        await runner.cleanup()
+        await workers.stop()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **dp.workflow_data)
+
+
+async def set_webhook(bot: Bot, allowed_updates: list[str]):
+    """Зарегистрировать WEBHOOK_URL в Telegram"""
+    await bot.set_webhook(
+        settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=allowed_updates
+    )
+    logger.info(
+        f"Вебхук слушает {settings.WEBHOOK_HOST}:{settings.WEBHOOK_PORT}{settings.WEBHOOK_PATH}, "
+        f"обновления: {', '.join(allowed_updates)}"
+    )
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Запустить сервер вебхука и зарегистрировать его в Telegram"""
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL не задан")
+    if not settings.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан")
+
+    await serve_updates(
+        bot, dp, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT, settings.WEBHOOK_SECRET,
+        on_listening=lambda: set_webhook(bot, dp.resolve_used_update_types())
+    )